@@ -4,11 +4,146 @@ from aws_cdk import (
     aws_codepipeline_actions as codepipeline_actions,
     aws_codebuild as codebuild,
     aws_iam as iam,
+    aws_s3 as s3,
     SecretValue
     )
 from constructs import Construct
 from cdk_nag import NagSuppressions
 
+# Manifest of the templates deployed by the last runs, in the deployment state bucket
+DEPLOYED_MANIFEST_KEY = "deployed-templates.manifest"
+
+# Shell functions of the validate and deploy builds (bash). Only the templates whose content or
+# parameters changed since they were last deployed are validated and deployed, up to MAX_PARALLEL
+# at a time. The source artifact has no git history, so changes are found by comparing the sha256
+# of each template and its parameters file with the manifest of the last deployment.
+TEMPLATE_FUNCTIONS = r"""
+# Templates the pipeline validates and deploys: those under deploy/ and the generated
+# <resource type>/GenRem-*.yaml remediation templates. Resource type directories may contain spaces.
+find_templates() {
+  find . -path ./cdk.out -prune -o -name "*.yaml" \( -path "./deploy/*" -o -name "GenRem-*.yaml" \) -print0
+}
+# The stack name of a template: its path without ./ and .yaml, with the characters a stack name cannot
+# have replaced by "-", as remediationArtifacts.stack_name does for the parameters file name. The
+# directory is part of it: the same file name can be generated under several resource type directories.
+stack_name() {
+  local path="${1#./}"
+  printf "%s\n" "${path%.yaml}" | tr -c "A-Za-z0-9\n-" "-"
+}
+parameters_file() {
+  echo "deploy/parameters/$(stack_name "$1")-params.json"
+}
+# <sha256 of the template and its parameters file> <tab> <stack name> <tab> <template path>
+manifest_line() {
+  printf "%s\t%s\t%s\n" "$(cat "$1" "$(parameters_file "$1")" 2>/dev/null | sha256sum | cut -d " " -f 1)" "$(stack_name "$1")" "$1"
+}
+# Write the NUL-separated paths of the templates that differ from the deployed manifest to changed.list
+changed_templates() {
+  aws s3 cp "s3://$STATE_BUCKET/$DEPLOYED_MANIFEST_KEY" deployed.manifest --quiet 2>/dev/null || : > deployed.manifest
+  : > current.manifest
+  find_templates | while IFS= read -r -d "" file; do manifest_line "$file" >> current.manifest; done
+  awk -F "\t" 'FILENAME == ARGV[1] { deployed[$2] = $1; next } deployed[$2] != $1 { print $3 }' deployed.manifest current.manifest | tr "\n" "\0" > changed.list
+  echo "$(tr -cd "\0" < changed.list | wc -c) of $(wc -l < current.manifest) templates changed since the last deployment"
+}
+# Run a function on every changed template, MAX_PARALLEL at a time, prefixing its output with the template
+run_changed() {
+  xargs -0 -r -n 1 -P "$MAX_PARALLEL" bash -c "$1"' "$0" 2>&1 | sed "s|^|[$0] |"; exit ${PIPESTATUS[0]}' < changed.list
+}
+export -f find_templates stack_name parameters_file manifest_line
+"""
+
+VALIDATE_COMMANDS = TEMPLATE_FUNCTIONS + r"""
+validate_template() {
+  test -f "$(parameters_file "$1")" || { echo "Missing $(parameters_file "$1")"; return 1; }
+  aws cloudformation validate-template --template-body "file://$1" > /dev/null && echo "Valid"
+}
+export -f validate_template
+changed_templates
+run_changed validate_template
+"""
+
+# StackSet rollout (bash). A stack set is updated when it exists and created otherwise, then given
+# the stack instances of WORKLOAD_ACCOUNTS x STACKSET_REGIONS it does not have yet. Each operation
+# runs with STACKSET_OPERATION_PREFERENCES and its progress is reported until it completes.
+STACKSET_FUNCTIONS = r"""
+STACKSET_POLL_SECONDS=${STACKSET_POLL_SECONDS:-15}
+# Wait for a stack set operation, reporting how many of its stack instances are done
+wait_for_operation() {
+  while true; do
+    status=$(aws cloudformation describe-stack-set-operation --stack-set-name "$1" --operation-id "$2" --query StackSetOperation.Status --output text) || return 1
+    progress=$(aws cloudformation list-stack-set-operation-results --stack-set-name "$1" --operation-id "$2" --query "Summaries[].Status" --output text | tr -s "\t " "\n\n" | grep -v -e "^$" -e "^None$" | sort | uniq -c | awk '{ printf "%s%s %s", sep, $1, $2; sep = ", " }')
+    echo "$1 $3 $2: $status (instances: ${progress:-none done yet})"
+    case "$status" in
+      SUCCEEDED) return 0;;
+      RUNNING|QUEUED|STOPPING) sleep "$STACKSET_POLL_SECONDS";;
+      *) return 1;;
+    esac
+  done
+}
+deploy_stack_set() {
+  set_name="RemediationAutomate-$(stack_name "$1")"
+  template=(--template-body "file://$1" --parameters "file://$(parameters_file "$1")" --capabilities CAPABILITY_NAMED_IAM --execution-role-name "$CFN_EXEC_ROLE_NAME")
+  if aws cloudformation describe-stack-set --stack-set-name "$set_name" > /dev/null 2>&1; then
+    echo "Updating StackSet $set_name..."
+    operation=$(aws cloudformation update-stack-set --stack-set-name "$set_name" "${template[@]}" --operation-preferences "$STACKSET_OPERATION_PREFERENCES" --query OperationId --output text) || return 1
+    wait_for_operation "$set_name" "$operation" update || return 1
+  else
+    echo "Creating StackSet $set_name..."
+    aws cloudformation create-stack-set --stack-set-name "$set_name" "${template[@]}" > /dev/null || return 1
+  fi
+  existing=$(aws cloudformation list-stack-instances --stack-set-name "$set_name" --query "Summaries[].[Account, Region]" --output text) || return 1
+  # Regions missing the same accounts are added by one operation
+  declare -A missing
+  for region in $STACKSET_REGIONS; do
+    accounts=""
+    for account in $WORKLOAD_ACCOUNTS; do
+      echo "$existing" | awk -v a="$account" -v r="$region" '$1 == a && $2 == r { found = 1 } END { exit !found }' || accounts="$accounts $account"
+    done
+    if [ -n "$accounts" ]; then missing["$accounts"]="${missing["$accounts"]} $region"; fi
+  done
+  for accounts in "${!missing[@]}"; do
+    echo "Creating stack instances of $set_name in accounts$accounts and regions${missing["$accounts"]}..."
+    operation=$(aws cloudformation create-stack-instances --stack-set-name "$set_name" --accounts $accounts --regions ${missing["$accounts"]} --operation-preferences "$STACKSET_OPERATION_PREFERENCES" --query OperationId --output text) || return 1
+    wait_for_operation "$set_name" "$operation" create-stack-instances || return 1
+  done
+}
+export -f wait_for_operation deploy_stack_set
+"""
+
+DEPLOY_COMMANDS = TEMPLATE_FUNCTIONS + STACKSET_FUNCTIONS + r"""
+deploy_template() {
+  name=$(stack_name "$1")
+  if [ -z "$CFN_EXEC_ROLE_NAME" ]; then
+    echo "Deploying stack $name directly..."
+    aws cloudformation deploy --template-file "$1" --stack-name "$name" --parameter-overrides "file://$(parameters_file "$1")" --capabilities CAPABILITY_NAMED_IAM --no-fail-on-empty-changeset || return 1
+  else
+    deploy_stack_set "$1" || return 1
+  fi
+  manifest_line "$1" > "deployed.d/$name"
+}
+export -f deploy_template
+changed_templates
+rm -rf deployed.d && mkdir deployed.d
+status=0
+run_changed deploy_template || status=$?
+# Record every template deployed by this run, so that the next run retries only the ones that failed
+{ cat deployed.manifest; find deployed.d -type f -exec cat {} +; } | awk -F "\t" '{ line[$2] = $0 } END { for (name in line) print line[name] }' | sort -t "$(printf "\t")" -k 2 > next.manifest
+echo "Deployed $(find deployed.d -type f | wc -l) of $(tr -cd "\0" < changed.list | wc -c) changed templates"
+aws s3 cp next.manifest "s3://$STATE_BUCKET/$DEPLOYED_MANIFEST_KEY" --quiet
+if [ $status -ne 0 ]; then echo "Error occurred during CloudFormation stack deployment."; exit 1; fi
+echo "CloudFormation stack deployment complete."
+"""
+
+def space_separated(values):
+    """
+    Format a context list, or a comma or space separated string, as the space separated list the
+    buildspecs expand into CLI arguments.
+    """
+    if isinstance(values, str):
+        values = values.replace(",", " ").split()
+    return " ".join(str(value) for value in values)
+
+
 class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -45,15 +180,39 @@ class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
         workload_accounts = self.node.try_get_context("WORKLOAD_ACCOUNTS")
         if workload_accounts is None:
             workload_accounts = []
-            
+
+        # StackSet rollout: target regions (default: the pipeline region) and operation preferences
+        stackset_regions = self.node.try_get_context("STACKSET_REGIONS") or [self.region]
+        stackset_operation_preferences = "RegionConcurrencyType={},MaxConcurrentPercentage={},FailureTolerancePercentage={}".format(
+            self.node.try_get_context("STACKSET_REGION_CONCURRENCY_TYPE") or "PARALLEL",
+            self.node.try_get_context("STACKSET_MAX_CONCURRENT_PERCENTAGE") or 100,
+            self.node.try_get_context("STACKSET_FAILURE_TOLERANCE_PERCENTAGE") or 0)
+
+        # Templates validated and deployed at a time
+        max_parallel = str(self.node.try_get_context("PIPELINE_MAX_PARALLEL") or 4)
+
+        # Manifest of the deployed templates, to validate and deploy only the changed ones
+        state_bucket = s3.Bucket(self, "DeploymentStateBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            versioned=True
+        )
+        state_variables = {
+            "STATE_BUCKET": codebuild.BuildEnvironmentVariable(value=state_bucket.bucket_name),
+            "DEPLOYED_MANIFEST_KEY": codebuild.BuildEnvironmentVariable(value=DEPLOYED_MANIFEST_KEY),
+            "MAX_PARALLEL": codebuild.BuildEnvironmentVariable(value=max_parallel)
+        }
+
         # Validation CodeBuild project
         validate_project = codebuild.PipelineProject(self, 'ValidateProject',
             build_spec=codebuild.BuildSpec.from_object({
                 'version': '0.2',
+                'env': {'shell': 'bash'},
                 'phases': {
                     'build': {
                         'commands': [
-                            'for file in $(find deploy -name "*.yaml"); do aws cloudformation validate-template --template-body file://$file; done'
+                            VALIDATE_COMMANDS
                         ]
                     }
                 }
@@ -69,8 +228,10 @@ class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
                                 )
                             ])
                           }
-                        )
+                        ),
+            environment_variables=state_variables
         )
+        state_bucket.grant_read(validate_project, DEPLOYED_MANIFEST_KEY)
 
         # Validation stage
         validation_stage = codepipeline.StageProps(
@@ -102,6 +263,7 @@ class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
             self, 'DeployProject',
             build_spec=codebuild.BuildSpec.from_object({
                 "version": "0.2",
+                "env": {"shell": "bash"},
                 "phases": {
                     "pre_build": {
                         "commands": [
@@ -110,12 +272,7 @@ class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
                     },
                     "build": {
                         "commands": [
-                            "set -e && for file in $(find deploy -name \"*.yaml\"); do STACK_NAME=$(basename $file .yaml); if [ -z \"$CFN_EXEC_ROLE_NAME\" ]; then echo \"Deploying stack $STACK_NAME directly...\"; aws cloudformation deploy --template-file $file --stack-name $STACK_NAME --parameter-overrides file://deploy/parameters/$STACK_NAME-params.json --capabilities CAPABILITY_NAMED_IAM || exit 1; else echo \"Deploying stack $STACK_NAME as a StackSet...\"; STACK_SET_NAME=RemediationAutomate-$STACK_NAME; aws cloudformation create-stack-set --stack-set-name $STACK_SET_NAME --template-body file://$file --capabilities CAPABILITY_NAMED_IAM --execution-role-name $CFN_EXEC_ROLE_NAME || exit 1; aws cloudformation create-stack-instances --stack-set-name $STACK_SET_NAME --accounts ${WORKLOAD_ACCOUNTS} --regions us-east-1 || exit 1; fi; done; echo \"CloudFormation stack deployment complete.\""
-                        ]
-                    },
-                    "post_build": {
-                        "commands": [
-                            "if [ $? -ne 0 ]; then echo \"Error occurred during CloudFormation stack deployment.\"; exit 1; fi"
+                            DEPLOY_COMMANDS
                         ]
                     }
                 }
@@ -141,9 +298,13 @@ class AwsBedrockLangchainCodePipelineStack(cdk.Stack):
             ),
             environment_variables={
                 "CFN_EXEC_ROLE_NAME": codebuild.BuildEnvironmentVariable(value=cfn_exec_role_name),
-                "WORKLOAD_ACCOUNTS": codebuild.BuildEnvironmentVariable(value=workload_accounts)
+                "WORKLOAD_ACCOUNTS": codebuild.BuildEnvironmentVariable(value=space_separated(workload_accounts)),
+                "STACKSET_REGIONS": codebuild.BuildEnvironmentVariable(value=space_separated(stackset_regions)),
+                "STACKSET_OPERATION_PREFERENCES": codebuild.BuildEnvironmentVariable(value=stackset_operation_preferences),
+                **state_variables
             }
         )
+        state_bucket.grant_read_write(deploy_project, DEPLOYED_MANIFEST_KEY)
 
         # Define the deploy stage
         deploy_stage = codepipeline.StageProps(
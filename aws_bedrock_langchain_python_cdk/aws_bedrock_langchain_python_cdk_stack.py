@@ -1,9 +1,18 @@
+import json
+
 from aws_cdk import (
     Stack,
+    CfnOutput,
     Duration,
+    RemovalPolicy,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as events_targets,
     aws_iam as iam,
     aws_lambda as _lambda,
     aws_lambda_python_alpha as _alambda,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_sqs as sqs,
     SecretValue
 )
 from constructs import Construct
@@ -20,6 +29,19 @@ class AwsBedrockLangchainPythonCdkStack(Stack):
         model_id = self.node.try_get_context("MODEL_ID")
         github_repo = self.node.try_get_context("GITHUB_REPO")
         github_owner = self.node.try_get_context("GITHUB_OWNER")
+        cache_ttl_seconds = self.node.try_get_context("CACHE_TTL_SECONDS") or 86400
+        streaming_generation = self.node.try_get_context("STREAMING_GENERATION") or False
+        remediation_engine = self.node.try_get_context("REMEDIATION_ENGINE") or "langchain"
+        retriever = self.node.try_get_context("RETRIEVER") or "knowledge_base"
+        retrieval_mode = self.node.try_get_context("RETRIEVAL_MODE") or "fixed"
+        context_compression = self.node.try_get_context("CONTEXT_COMPRESSION") or False
+        commit_mode = self.node.try_get_context("COMMIT_MODE") or "sync"
+        # Per-stage models: a dict in cdk.json, or a JSON string with -c on the command line
+        model_routing = self.node.try_get_context("MODEL_ROUTING") or {}
+        fallback_model_id = self.node.try_get_context("FALLBACK_MODEL_ID")
+        # Remediate the findings Security Hub imports, coalesced per control within the batching window
+        finding_ingestion = str(self.node.try_get_context("FINDING_INGESTION") or False).lower() == "true"
+        finding_ingestion_window_seconds = int(self.node.try_get_context("FINDING_INGESTION_WINDOW_SECONDS") or 60)
 
         bedrock_policy = iam.PolicyStatement(
             effect= iam.Effect.ALLOW,
@@ -49,6 +71,60 @@ class AwsBedrockLangchainPythonCdkStack(Stack):
             resources=["arn:aws:secretsmanager:*"]
         ))
 
+        # Shared remediation result cache, keyed by normalized finding title, model id and knowledge base id
+        remediation_cache_table = dynamodb.Table(
+            self,
+            "RemediationCacheTable",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        remediation_cache_table.grant_read_write_data(lambda_role)
+
+        model_environment = {}
+        if model_routing:
+            model_environment["MODEL_ROUTING"] = model_routing if isinstance(model_routing, str) else json.dumps(model_routing)
+        if fallback_model_id:
+            model_environment["MODEL_FALLBACK_ID"] = fallback_model_id
+
+        # Async commit mode: templates are queued and committed in batches by the commit queue consumer
+        commit_environment = {"COMMIT_MODE": commit_mode}
+        if commit_mode == "async":
+            commit_dead_letter_queue = sqs.Queue(
+                self,
+                "CommitDeadLetterQueue",
+                fifo=True,
+                retention_period=Duration.days(14),
+                enforce_ssl=True
+            )
+            # FIFO, with one message group per file: the templates of a file are committed in the order they
+            # were queued and never by two batches at once, so an older template cannot revert a newer one
+            commit_queue = sqs.Queue(
+                self,
+                "CommitQueue",
+                fifo=True,
+                # Six times the consumer timeout, as recommended for SQS event sources, so that a batch is
+                # not redelivered while it is committed or retried by the poller
+                visibility_timeout=Duration.seconds(1800),
+                enforce_ssl=True,
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=commit_dead_letter_queue)
+            )
+            commit_status_table = dynamodb.Table(
+                self,
+                "CommitStatusTable",
+                partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                point_in_time_recovery=True,
+                removal_policy=RemovalPolicy.DESTROY
+            )
+            commit_queue.grant_send_messages(lambda_role)
+            commit_status_table.grant_read_write_data(lambda_role)
+            commit_environment["COMMIT_QUEUE_URL"] = commit_queue.queue_url
+            commit_environment["COMMIT_STATUS_TABLE_NAME"] = commit_status_table.table_name
+
         boto3_lambda_layer = _alambda.PythonLayerVersion(self, 
                                                     'boto3-lambda-layer',
                                                     entry = './aws_bedrock_langchain_python_cdk/lambda/layer/boto3_latest/',
@@ -63,6 +139,27 @@ class AwsBedrockLangchainPythonCdkStack(Stack):
                                                     compatible_runtimes=[_lambda.Runtime.PYTHON_3_11 ],
         )
 
+        # The converse engine calls Bedrock through boto3 only and does not need the LangChain layer
+        langchain_bedrock_lambda_layers = [boto3_lambda_layer] if remediation_engine == "converse" else [
+            boto3_lambda_layer,
+            langchain_lambda_layer
+        ]
+        remediation_environment = {
+            "MODEL_ID": model_id,
+            "KB_ID": kb_id,
+            "GITHUB_REPO": github_repo,
+            "GITHUB_OWNER": github_owner,
+            "CACHE_TABLE_NAME": remediation_cache_table.table_name,
+            "CACHE_TTL_SECONDS": str(cache_ttl_seconds),
+            "STREAMING_GENERATION": str(streaming_generation).lower(),
+            "REMEDIATION_ENGINE": remediation_engine,
+            "RETRIEVER": retriever,
+            "RETRIEVAL_MODE": retrieval_mode,
+            "CONTEXT_COMPRESSION": str(context_compression).lower(),
+            **model_environment,
+            **commit_environment
+        }
+
         langchain_bedrock_lambda = _lambda.Function(
             self,
             "langchain-bedrock-lambda",
@@ -71,20 +168,137 @@ class AwsBedrockLangchainPythonCdkStack(Stack):
             runtime=_lambda.Runtime.PYTHON_3_11,
             architecture=_lambda.Architecture.ARM_64,
             role=lambda_role,
-            layers=[
-                boto3_lambda_layer,
-                langchain_lambda_layer
-            ],
+            layers=langchain_bedrock_lambda_layers,
             timeout=Duration.seconds(900),
             memory_size=1024,
+            environment=remediation_environment
+        )
+
+        # Invalidates the remediation cache. Nothing triggers it: invoke it after every knowledge base
+        # data source sync (see the README). It only needs boto3, index.py defers the LangChain imports.
+        cache_invalidation_lambda = _lambda.Function(
+            self,
+            "remediation-cache-invalidation-lambda",
+            handler="index.cache_invalidation_handler",
+            code=_lambda.Code.from_asset("./aws_bedrock_langchain_python_cdk/lambda/code/langchain/"),
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            architecture=_lambda.Architecture.ARM_64,
+            role=lambda_role,
+            layers=[boto3_lambda_layer],
+            timeout=Duration.seconds(60),
+            memory_size=256,
             environment={
                 "MODEL_ID": model_id,
                 "KB_ID": kb_id,
                 "GITHUB_REPO": github_repo,
-                "GITHUB_OWNER": github_owner
+                "GITHUB_OWNER": github_owner,
+                "CACHE_TABLE_NAME": remediation_cache_table.table_name
             }
         )
+        CfnOutput(self, "CacheInvalidationFunctionName", value=cache_invalidation_lambda.function_name)
         
+        if commit_mode == "async":
+            commit_queue_lambda = _lambda.Function(
+                self,
+                "remediation-commit-queue-lambda",
+                handler="index.commit_queue_handler",
+                code=_lambda.Code.from_asset("./aws_bedrock_langchain_python_cdk/lambda/code/langchain/"),
+                runtime=_lambda.Runtime.PYTHON_3_11,
+                architecture=_lambda.Architecture.ARM_64,
+                role=lambda_role,
+                layers=[boto3_lambda_layer],
+                timeout=Duration.seconds(300),
+                memory_size=256,
+                environment={
+                    "MODEL_ID": model_id,
+                    "KB_ID": kb_id,
+                    "GITHUB_REPO": github_repo,
+                    "GITHUB_OWNER": github_owner,
+                    **commit_environment
+                }
+            )
+            commit_queue.grant_consume_messages(commit_queue_lambda)
+            # Templates queued together are committed together (FIFO event sources have no batching window).
+            # The poller runs two batches at most, so few commits race for the branch head (GitHubCommitter
+            # retries when it moved); unlike reserved concurrency, this never throttles receives into the
+            # dead-letter queue.
+            commit_queue_lambda.add_event_source(lambda_event_sources.SqsEventSource(
+                commit_queue,
+                batch_size=10,
+                max_concurrency=2
+            ))
+            NagSuppressions.add_resource_suppressions(commit_queue_lambda,
+                                suppressions=[{
+                                            "id": "AwsSolutions-L1",
+                                            "reason": "Runtime pinned to match the remediation Lambda function and layers"
+                                            }
+                                        ]
+                                )
+
+        if finding_ingestion:
+            ingestion_dead_letter_queue = sqs.Queue(
+                self,
+                "FindingIngestionDeadLetterQueue",
+                retention_period=Duration.days(14),
+                enforce_ssl=True
+            )
+            ingestion_queue = sqs.Queue(
+                self,
+                "FindingIngestionQueue",
+                # Longer than the consumer timeout, so a batch is not redelivered while it is remediated
+                visibility_timeout=Duration.seconds(960),
+                enforce_ssl=True,
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=ingestion_dead_letter_queue)
+            )
+            # Failed findings of active resources, as imported by Security Hub
+            events.Rule(
+                self,
+                "FindingsImportedRule",
+                event_pattern=events.EventPattern(
+                    source=["aws.securityhub"],
+                    detail_type=["Security Hub Findings - Imported"],
+                    detail={
+                        "findings": {
+                            "Compliance": {"Status": ["FAILED"]},
+                            "RecordState": ["ACTIVE"],
+                            "Workflow": {"Status": ["NEW"]}
+                        }
+                    }
+                ),
+                targets=[events_targets.SqsQueue(ingestion_queue)]
+            )
+            finding_ingestion_lambda = _lambda.Function(
+                self,
+                "finding-ingestion-lambda",
+                handler="index.finding_events_handler",
+                code=_lambda.Code.from_asset("./aws_bedrock_langchain_python_cdk/lambda/code/langchain/"),
+                runtime=_lambda.Runtime.PYTHON_3_11,
+                architecture=_lambda.Architecture.ARM_64,
+                role=lambda_role,
+                layers=langchain_bedrock_lambda_layers,
+                timeout=Duration.seconds(900),
+                memory_size=1024,
+                environment=remediation_environment
+            )
+            ingestion_queue.grant_consume_messages(finding_ingestion_lambda)
+            # A burst of findings is delivered as one batch, remediated once per control. Two
+            # concurrent batches at most, the minimum for an SQS event source. 500 events of a few KB
+            # each stay under the 6 MB Lambda payload limit.
+            finding_ingestion_lambda.add_event_source(lambda_event_sources.SqsEventSource(
+                ingestion_queue,
+                batch_size=500,
+                max_batching_window=Duration.seconds(finding_ingestion_window_seconds),
+                max_concurrency=2,
+                report_batch_item_failures=True
+            ))
+            NagSuppressions.add_resource_suppressions(finding_ingestion_lambda,
+                                suppressions=[{
+                                            "id": "AwsSolutions-L1",
+                                            "reason": "Runtime pinned to match the remediation Lambda function and layers"
+                                            }
+                                        ]
+                                )
+
         # Add lambda permission to allow bedrock to invoke the function
         langchain_bedrock_lambda.add_permission(
             "bedrock-permission",
@@ -118,3 +332,10 @@ class AwsBedrockLangchainPythonCdkStack(Stack):
                                         }
                                     ]
                             )
+        NagSuppressions.add_resource_suppressions(cache_invalidation_lambda,
+                            suppressions=[{
+                                        "id": "AwsSolutions-L1",
+                                        "reason": "Runtime pinned to match the remediation Lambda function and layers"
+                                        }
+                                    ]
+                            )
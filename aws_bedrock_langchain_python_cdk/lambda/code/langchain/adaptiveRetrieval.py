@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from collections import namedtuple
+
+import metrics
+from contextCompression import PLAYBOOK_PREFIX, estimate_tokens, mentions_control
+
+LOGGER = logging.getLogger(__name__)
+
+# Results requested by the first Retrieve call, and by the escalated one
+RETRIEVAL_MIN_K = int(os.environ.get('RETRIEVAL_MIN_K', '2'))
+RETRIEVAL_MAX_K = int(os.environ.get('RETRIEVAL_MAX_K', '8'))
+# Relative gap between the two best scores under which the ranking is too flat to trust
+RETRIEVAL_SCORE_MARGIN = float(os.environ.get('RETRIEVAL_SCORE_MARGIN', '0.1'))
+# Appended to the finding title by the escalated query, to reach the playbook tables of the guide
+REQUERY_SUFFIX = " remediation playbook runbook"
+
+RetrievalResult = namedtuple('RetrievalResult', ['passages', 'scores', 'k', 'escalated', 'reason', 'first_count'])
+RetrievalResult.__doc__ = """
+Passages retrieved for a finding.
+
+Args:
+    passages (list): Passage texts, best first.
+    scores (list): Their retrieval scores.
+    k (int): numberOfResults of the last Retrieve call.
+    escalated (bool): Whether the escalated query was run.
+    reason (str): Why retrieval escalated or would escalate, or None when the results looked confident.
+    first_count (int): How many of the passages, at the start, the first query returned.
+"""
+
+
+def retrieval_configuration(k, search_type="HYBRID"):
+    return {"vectorSearchConfiguration": {"numberOfResults": k, "overrideSearchType": search_type}}
+
+
+def low_confidence_reason(sechub_finding, passages, scores, k):
+    """
+    Judge whether retrieved passages are likely to hold the finding's runbook.
+
+    Passages that mention the finding's control ID or playbook name are trusted. Otherwise the
+    results are low confidence when fewer than k came back, when none mentions any playbook or runbook
+    name, or when the best score is within RETRIEVAL_SCORE_MARGIN of the second best.
+
+    Returns:
+        str: "too_few_results", "no_playbook" or "flat_scores", or None when the results look confident.
+    """
+    if len(passages) < k:
+        return "too_few_results"
+    if mentions_control(sechub_finding, passages):
+        return None
+    if not any(PLAYBOOK_PREFIX.match(word) for passage in passages for word in passage.split()):
+        return "no_playbook"
+    if len(scores) > 1 and scores[0] > 0 and (scores[0] - scores[1]) / scores[0] < RETRIEVAL_SCORE_MARGIN:
+        return "flat_scores"
+    return None
+
+
+class AdaptiveRetriever:
+    """
+    Knowledge base retrieval that starts with min_k results and escalates to max_k with a re-query.
+
+    Args:
+        client: A client with the bedrock-agent-runtime retrieve operation.
+        knowledge_id (str): The knowledge base ID.
+        min_k (int): numberOfResults of the first query.
+        max_k (int): numberOfResults of the escalated query, and the most passages returned.
+    """
+
+    def __init__(self, client, knowledge_id, min_k=None, max_k=None):
+        self.client = client
+        self.knowledge_id = knowledge_id
+        self.min_k = min_k or RETRIEVAL_MIN_K
+        self.max_k = max(max_k or RETRIEVAL_MAX_K, self.min_k)
+
+    def _retrieve(self, query, k):
+        with metrics.get_recorder().stage("kb_retrieval", K=k) as stage:
+            response = self.client.retrieve(retrievalQuery={"text": query}, knowledgeBaseId=self.knowledge_id,
+                                            retrievalConfiguration=retrieval_configuration(k))
+            results = response["retrievalResults"]
+            stage.add("RetrievedDocuments", len(results))
+        return [result["content"]["text"] for result in results], [result.get("score", 0) for result in results]
+
+    def retrieve(self, sechub_finding, escalate=False, previous=None):
+        """
+        Retrieve passages for a finding.
+
+        Args:
+            sechub_finding (str): The finding title.
+            escalate (bool): Run the escalated query even if the first results look confident.
+            previous (RetrievalResult): Results of the first query, reused instead of querying again.
+
+        Returns:
+            RetrievalResult: The passages; after escalation the first results followed by the new ones.
+        """
+        if previous is None:
+            passages, scores = self._retrieve(sechub_finding, self.min_k)
+            reason = low_confidence_reason(sechub_finding, passages, scores, self.min_k)
+            previous = RetrievalResult(passages, scores, self.min_k, False, reason, len(passages))
+        if not (escalate or previous.reason) or self.max_k <= self.min_k:
+            return previous
+        passages, scores = list(previous.passages), list(previous.scores)
+        new_passages, new_scores = self._retrieve(sechub_finding + REQUERY_SUFFIX, self.max_k)
+        for passage, score in zip(new_passages, new_scores):
+            if len(passages) < self.max_k and passage not in passages:
+                passages.append(passage)
+                scores.append(score)
+        return RetrievalResult(passages, scores, self.max_k, True, previous.reason or "low_confidence_output",
+                               previous.first_count)
+
+
+class AdaptiveRetrievalChain:
+    """
+    Chain 1 with adaptive retrieval depth.
+
+    Chain 1 first answers from min_k passages; retrieval escalates when the passages look low
+    confidence (see low_confidence_reason), or when the answer is remediation_available=false, in which
+    case chain 1 runs once more on the escalated passages. A runbook found that way saves the chain 2
+    generation the false answer would have triggered. The "adaptive_retrieval" metrics stage records
+    the extra Retrieve calls, chain 1 calls and context tokens next to the chain 2 calls avoided. When
+    the first passages already escalate, chain 1 answers once, from the escalated passages: the extra
+    context tokens are the share of the passages the escalation added, and the escalation is counted
+    as FirstPassEscalations. No chain 2 call is counted as avoided then, since the first passages
+    alone might have found the runbook too.
+
+    Args:
+        handler (BaseRemediationHandler): Renders the retrieved passages (see render_context).
+        retriever (AdaptiveRetriever): The retriever.
+        answer_chain: Runnable taking {"context", "$security_hub_finding_title"} and returning the
+            parsed chain 1 output.
+    """
+
+    def __init__(self, handler, retriever, answer_chain):
+        self.handler = handler
+        self.retriever = retriever
+        self.answer_chain = answer_chain
+
+    def _answer(self, sechub_finding, retrieved, config):
+        context = self.handler.render_context(sechub_finding, retrieved.passages)
+        output = self.answer_chain.invoke({"context": context, "$security_hub_finding_title": sechub_finding},
+                                          config=config)
+        return output, estimate_tokens(context)
+
+    def _extra_tokens(self, retrieved, context_tokens):
+        """
+        Share of the context tokens that comes from the passages the escalated query added.
+        """
+        total = sum(estimate_tokens(passage) for passage in retrieved.passages)
+        added = sum(estimate_tokens(passage) for passage in retrieved.passages[retrieved.first_count:])
+        return round(context_tokens * added / total) if total else 0
+
+    def invoke(self, sechub_finding, config=None):
+        with metrics.get_recorder().stage("adaptive_retrieval") as stage:
+            retrieved = self.retriever.retrieve(sechub_finding)
+            output, tokens = self._answer(sechub_finding, retrieved, config)
+            extra_calls = first_pass = int(retrieved.escalated)
+            retries = avoided = extra_tokens = 0
+            if retrieved.escalated:
+                extra_tokens = self._extra_tokens(retrieved, tokens)
+            elif not output.remediation_available:
+                escalated = self.retriever.retrieve(sechub_finding, escalate=True, previous=retrieved)
+                extra_calls = int(escalated.escalated)
+                if escalated.passages != retrieved.passages:
+                    retried, extra_tokens = self._answer(sechub_finding, escalated, config)
+                    retries = 1
+                    avoided = int(bool(retried.remediation_available))
+                    output = retried
+                retrieved = escalated
+            stage.add("RetrievalEscalations", extra_calls)
+            stage.add("FirstPassEscalations", first_pass)
+            stage.add("ExtraRetrieveCalls", extra_calls)
+            stage.add("ExtraChain1Calls", retries)
+            stage.add("ExtraContextTokens", extra_tokens)
+            stage.add("Chain2CallsAvoided", avoided)
+            stage.set_property("RetrievalK", retrieved.k)
+            stage.set_property("EscalationReason", retrieved.reason)
+        if retrieved.escalated:
+            LOGGER.info("Escalated retrieval to k={} ({}), chain 2 avoided: {}".format(
+                retrieved.k, retrieved.reason, bool(avoided)))
+        return output
+
+    async def ainvoke(self, sechub_finding, config=None):
+        return await asyncio.to_thread(self.invoke, sechub_finding, config)
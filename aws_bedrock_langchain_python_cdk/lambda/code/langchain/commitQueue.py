@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+LOGGER = logging.getLogger(__name__)
+
+# How long commit statuses are kept in the status table
+STATUS_TTL_SECONDS = int(os.environ.get('COMMIT_STATUS_TTL_SECONDS', str(7 * 86400)))
+# SQS delivers at most 10 messages per receive
+MAX_BATCH_SIZE = 10
+
+# COMMIT_QUEUE_URL value selecting the in-memory queue, for local runs only
+LOCAL_QUEUE_URL = 'local'
+
+STATUS_PENDING = 'pending'
+STATUS_COMMITTED = 'committed'
+STATUS_UNCHANGED = 'unchanged'
+STATUS_FAILED = 'failed'
+# A newer template of the same file was committed first; this one was dropped
+STATUS_SUPERSEDED = 'superseded'
+
+
+class LocalCommitQueue:
+    """
+    In-memory stand-in for the SQS commit queue, used in tests and when no queue is configured.
+    """
+
+    def __init__(self):
+        self.messages = deque()
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.messages.append(json.dumps(message))
+
+    def receive(self, max_messages=MAX_BATCH_SIZE):
+        """
+        Take up to max_messages messages off the queue.
+
+        Returns:
+            list: (receipt handle, message) tuples.
+        """
+        with self._lock:
+            count = min(max_messages, len(self.messages))
+            return [(None, json.loads(self.messages.popleft())) for _ in range(count)]
+
+    def delete(self, receipt_handles):
+        # Messages leave the local queue when they are received
+        pass
+
+
+class SqsCommitQueue:
+    """
+    Commit queue backed by an SQS FIFO queue.
+
+    The messages of a file share a message group, so SQS hands them out in the order they were sent
+    and never to two consumers at once, even when a failed batch is redelivered.
+    """
+
+    def __init__(self, queue_url, region=None):
+        region = region or os.environ['AWS_DEFAULT_REGION']
+        self.queue_url = queue_url
+        self.client = boto3.client('sqs', region_name=region)
+
+    def send(self, message):
+        # Group IDs only allow ASCII punctuation and alphanumerics, file paths may contain spaces
+        group_id = hashlib.sha256(message['file_path'].encode('utf-8')).hexdigest()
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message),
+                                 MessageGroupId=group_id, MessageDeduplicationId=message['artifact_id'])
+
+    def receive(self, max_messages=MAX_BATCH_SIZE):
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url, MaxNumberOfMessages=min(max_messages, MAX_BATCH_SIZE), WaitTimeSeconds=1)
+        return [(message['ReceiptHandle'], json.loads(message['Body'])) for message in response.get('Messages', [])]
+
+    def delete(self, receipt_handles):
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            entries = [{'Id': str(i), 'ReceiptHandle': handle}
+                       for i, handle in enumerate(receipt_handles[start:start + MAX_BATCH_SIZE])]
+            self.client.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+
+
+def file_key(file_path):
+    """
+    Status store key of the enqueued_at of the latest template committed for a file.
+    """
+    return 'file#' + file_path
+
+
+class LocalStatusStore:
+    """
+    In-memory stand-in for the DynamoDB commit status table.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def put_status(self, artifact_id, status):
+        with self._lock:
+            self.items[artifact_id] = dict(status)
+
+    def get_status(self, artifact_id):
+        return self.items.get(artifact_id)
+
+    def get_committed_at(self, file_path):
+        return self.items.get(file_key(file_path))
+
+    def put_committed_at(self, file_path, enqueued_at):
+        with self._lock:
+            key = file_key(file_path)
+            self.items[key] = max(self.items.get(key, enqueued_at), enqueued_at)
+
+
+class DynamoDBStatusStore:
+    """
+    Commit status store backed by a DynamoDB table with partition key 'pk' and TTL attribute 'expires_at'.
+    """
+
+    def __init__(self, table_name, region=None):
+        region = region or os.environ['AWS_DEFAULT_REGION']
+        self.table = boto3.resource('dynamodb', region_name=region).Table(table_name)
+
+    def put_status(self, artifact_id, status):
+        self.table.put_item(Item={'pk': artifact_id, 'value': json.dumps(status),
+                                  'expires_at': int(time.time() + STATUS_TTL_SECONDS)})
+
+    def get_status(self, artifact_id):
+        item = self.table.get_item(Key={'pk': artifact_id}).get('Item')
+        return json.loads(item['value']) if item else None
+
+    def get_committed_at(self, file_path):
+        item = self.table.get_item(Key={'pk': file_key(file_path)}, ConsistentRead=True).get('Item')
+        return float(item['enqueued_at']) if item else None
+
+    def put_committed_at(self, file_path, enqueued_at):
+        # Conditional, so that the recorded time never goes back
+        try:
+            self.table.put_item(
+                Item={'pk': file_key(file_path), 'enqueued_at': Decimal(str(enqueued_at)),
+                      'expires_at': int(time.time() + STATUS_TTL_SECONDS)},
+                ConditionExpression='attribute_not_exists(pk) OR enqueued_at < :enqueued_at',
+                ExpressionAttributeValues={':enqueued_at': Decimal(str(enqueued_at))})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+class CommitQueue:
+    """
+    Queue of remediation templates waiting to be committed, and the status of each of them.
+
+    The agent response only enqueues the template and returns its artifact ID. A consumer drains the
+    queue in batches, commits every template of a batch in a single commit and records the commit SHA
+    per artifact, which the status API path reads back.
+    """
+
+    def __init__(self, queue=None, status_store=None):
+        self.queue = queue if queue is not None else LocalCommitQueue()
+        self.status_store = status_store if status_store is not None else LocalStatusStore()
+
+    def enqueue(self, sechub_finding, file_path, content, resource_type, related_files=None):
+        """
+        Queue a template for commit.
+
+        Args:
+            related_files (dict): Files derived from the template, such as its parameters file (path ->
+                content), committed in the same commit as the template.
+
+        Returns:
+            str: The artifact ID to query the commit status with.
+        """
+        artifact_id = uuid.uuid4().hex
+        status = {'artifact_id': artifact_id, 'status': STATUS_PENDING, 'file_path': file_path,
+                  'sechub_finding': sechub_finding, 'commit_sha': None, 'enqueued_at': time.time()}
+        # The status is written first so that the artifact is never unknown once the caller has its ID
+        self.status_store.put_status(artifact_id, status)
+        self.queue.send({'artifact_id': artifact_id, 'file_path': file_path, 'content': content,
+                         'related_files': related_files or {}, 'resource_type': resource_type,
+                         'sechub_finding': sechub_finding, 'enqueued_at': status['enqueued_at']})
+        return artifact_id
+
+    def get_status(self, artifact_id):
+        """
+        Return the status of an artifact, or None when the ID is unknown or has expired.
+        """
+        return self.status_store.get_status(artifact_id)
+
+    def process(self, messages, committer):
+        """
+        Commit a batch of queued templates in one commit and record the outcome of every artifact.
+
+        When a file was queued more than once, the most recently enqueued content wins and every
+        artifact of that file is resolved by the same commit. Templates enqueued before the last one
+        committed for their file, by an earlier batch, are dropped as superseded instead of reverting it.
+
+        Returns:
+            GitCommit: The new commit, or None when every template was already up to date or superseded.
+        """
+        latest = {}
+        for message in sorted(messages, key=lambda message: message['enqueued_at']):
+            latest[message['file_path']] = message
+        superseded = set()
+        for path, message in list(latest.items()):
+            committed_at = self.status_store.get_committed_at(path)
+            if committed_at is not None and message['enqueued_at'] < committed_at:
+                LOGGER.info("Dropping %s enqueued at %s, a template enqueued at %s is committed",
+                            path, message['enqueued_at'], committed_at)
+                superseded.add(path)
+                del latest[path]
+        files = {path: message['content'] for path, message in latest.items()}
+        for message in latest.values():
+            # Messages queued before related files were added carry none
+            files.update(message.get('related_files') or {})
+        resource_types = [message['resource_type'] for message in latest.values()]
+        pending = [message for message in messages if message['file_path'] not in superseded]
+        for message in messages:
+            if message['file_path'] in superseded:
+                self._set_status(message, STATUS_SUPERSEDED, None)
+        commit = None
+        if files:
+            try:
+                commit, _ = committer.commit_contents(files, resource_types)
+            except Exception as e:
+                for message in pending:
+                    self._set_status(message, STATUS_FAILED, None, error=str(e))
+                raise
+            for path, message in latest.items():
+                self.status_store.put_committed_at(path, message['enqueued_at'])
+        for message in pending:
+            if commit is None:
+                self._set_status(message, STATUS_UNCHANGED, None)
+            else:
+                self._set_status(message, STATUS_COMMITTED, commit.sha)
+        LOGGER.info("Processed %s queued templates for %s files, commit: %s",
+                    len(messages), len(files), commit.sha if commit is not None else None)
+        return commit
+
+    def _set_status(self, message, status, commit_sha, error=None):
+        record = {'artifact_id': message['artifact_id'], 'status': status, 'file_path': message['file_path'],
+                  'sechub_finding': message['sechub_finding'], 'commit_sha': commit_sha,
+                  'enqueued_at': message['enqueued_at'], 'completed_at': time.time()}
+        if error is not None:
+            record['error'] = error
+        self.status_store.put_status(message['artifact_id'], record)
+
+    def drain(self, committer, max_batches=None):
+        """
+        Receive and commit batches until the queue is empty, or max_batches batches were processed.
+
+        Returns:
+            list: The commits made, None for batches that were already up to date.
+        """
+        commits = []
+        while max_batches is None or len(commits) < max_batches:
+            received = self.queue.receive(MAX_BATCH_SIZE)
+            if not received:
+                break
+            commits.append(self.process([message for _, message in received], committer))
+            self.queue.delete([handle for handle, _ in received if handle is not None])
+        return commits
+
+
+_COMMIT_QUEUE = None
+_COMMIT_QUEUE_LOCK = threading.Lock()
+
+
+def commit_queue_settings():
+    """
+    Read the commit queue configuration of async commit mode.
+
+    COMMIT_QUEUE_URL and COMMIT_STATUS_TABLE_NAME name the SQS queue and the DynamoDB status table. With
+    COMMIT_QUEUE_URL=local, templates are queued in memory instead, for local runs: they are lost when the
+    process exits.
+
+    Returns:
+        tuple: (queue url, status table name), both None for COMMIT_QUEUE_URL=local.
+
+    Raises:
+        ValueError: The queue or the status table is not configured.
+    """
+    queue_url = os.environ.get('COMMIT_QUEUE_URL')
+    table_name = os.environ.get('COMMIT_STATUS_TABLE_NAME')
+    if queue_url == LOCAL_QUEUE_URL:
+        return None, table_name
+    missing = [name for name, value in (('COMMIT_QUEUE_URL', queue_url), ('COMMIT_STATUS_TABLE_NAME', table_name))
+               if not value]
+    if missing:
+        raise ValueError("COMMIT_MODE=async needs {} (or COMMIT_QUEUE_URL={} for a local run)".format(
+            " and ".join(missing), LOCAL_QUEUE_URL))
+    return queue_url, table_name
+
+
+def get_commit_queue():
+    """
+    Get the process-level CommitQueue, backed by the SQS queue and DynamoDB table of commit_queue_settings,
+    or by local stand-ins for COMMIT_QUEUE_URL=local.
+    """
+    global _COMMIT_QUEUE
+    if _COMMIT_QUEUE is None:
+        with _COMMIT_QUEUE_LOCK:
+            if _COMMIT_QUEUE is None:
+                queue_url, table_name = commit_queue_settings()
+                _COMMIT_QUEUE = CommitQueue(
+                    queue=SqsCommitQueue(queue_url) if queue_url else LocalCommitQueue(),
+                    status_store=DynamoDBStatusStore(table_name) if table_name else LocalStatusStore()
+                )
+    return _COMMIT_QUEUE
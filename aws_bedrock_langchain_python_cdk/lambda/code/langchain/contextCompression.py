@@ -0,0 +1,241 @@
+import logging
+import math
+import os
+import re
+from collections import namedtuple
+
+import metrics
+from controlIndex import get_control_index
+from findingKey import find_control_id
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bound of the retrieved context rendered into prompt 1, in estimated tokens
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '800'))
+# Words kept on each side of a control ID, playbook name or run of finding title words
+CONTEXT_WINDOW_WORDS = int(os.environ.get('CONTEXT_WINDOW_WORDS', '30'))
+# Length of the word shingles that detect text repeated by overlapping chunks
+SHINGLE_WORDS = 8
+# Playbook and runbook name prefixes, e.g. "ASR-EnableDefaultEncryption", "AWSConfigRemediation-..."
+PLAYBOOK_PREFIX = re.compile(r'^(?:ASR|SHARR|AWS|AWSConfigRemediation)-', re.IGNORECASE)
+# The PDF extraction breaks playbook names into up to this many words ("ASR-Enabl eDefaultEncryption")
+MAX_PLAYBOOK_WORDS = 4
+SPAN_SEPARATOR = " ... "
+# The ASR guide says "activated" where Security Hub finding titles say "enabled"
+SYNONYMS = {'activated': 'enabled', 'activate': 'enable', 'deactivated': 'disabled', 'deactivate': 'disable'}
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'not',
+    'of', 'on', 'or', 'should', 'that', 'the', 'to', 'use', 'with', 'all', 'any', 'least', 'one',
+])
+
+CompressedContext = namedtuple('CompressedContext', ['text', 'tokens_in', 'tokens_out', 'passages_in', 'spans'])
+CompressedContext.__doc__ = """
+Retrieved context reduced for prompt 1.
+
+Args:
+    text (str): The context to render as {context}.
+    tokens_in (int): Estimated tokens of the retrieved passages.
+    tokens_out (int): Estimated tokens of text.
+    passages_in (int): Number of retrieved passages.
+    spans (int): Number of spans kept.
+"""
+
+Span = namedtuple('Span', ['priority', 'rank', 'start', 'end'])
+
+
+def estimate_tokens(text):
+    """
+    Estimate the model tokens of a text, at about four characters per token.
+    """
+    return int(math.ceil(len(text) / 4.0))
+
+
+def _normalize(word):
+    return re.sub(r'[^a-z0-9.]', '', word.casefold()).strip('.')
+
+
+def _term(word):
+    """
+    Map a normalized word to the title term it stands for: "activated" to "enabled", and a control ID
+    such as "kms.4" to its service, "kms".
+    """
+    return SYNONYMS.get(word) or word.split('.', 1)[0]
+
+
+def finding_anchors(sechub_finding):
+    """
+    Collect what marks a passage as relevant to a finding.
+
+    Returns:
+        tuple: Casefolded control IDs, casefolded playbook names, and the title terms of the finding.
+    """
+    control_ids, playbooks = set(), set()
+    control_id = find_control_id(sechub_finding)
+    control_index = get_control_index()
+    if control_index is not None:
+        match = control_index.lookup(sechub_finding)
+        if match is not None:
+            control_id = control_id or match[0]
+            playbooks.add(match[1]['runbook'].casefold())
+    if control_id is not None:
+        control_ids.add(control_id.casefold())
+    terms = set()
+    for word in sechub_finding.split():
+        word = _term(_normalize(word))
+        if len(word) >= 3 and word not in STOPWORDS and word not in control_ids:
+            terms.add(word)
+    return control_ids, playbooks, terms
+
+
+def _duplicate_flags(passages_words):
+    """
+    Flag the words of a passage that an earlier passage already contained, by their word shingles.
+    """
+    flags, seen = [], set()
+    for words in passages_words:
+        normalized = [_normalize(word) for word in words]
+        duplicate = [False] * len(words)
+        shingles = [tuple(normalized[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+        for i, shingle in enumerate(shingles):
+            if shingle in seen:
+                for j in range(i, i + SHINGLE_WORDS):
+                    duplicate[j] = True
+        seen.update(shingles)
+        flags.append(duplicate)
+    return flags
+
+
+def _anchor_positions(words, control_ids, playbooks, terms, window):
+    """
+    Return the positions of strong anchors (control IDs and playbook names of the finding) and of weak
+    anchors (title words surrounded by enough other title words) in a passage.
+    """
+    normalized = [_normalize(word) for word in words]
+    strong, weak = [], []
+    for i, word in enumerate(normalized):
+        if word in control_ids:
+            strong.append(i)
+        elif playbooks and PLAYBOOK_PREFIX.match(words[i]):
+            name = ''
+            for part in words[i:i + MAX_PLAYBOOK_WORDS]:
+                name += part.casefold()
+                if name in playbooks:
+                    strong.append(i)
+                    break
+    if terms:
+        threshold = max(2, int(math.ceil(len(terms) / 2.0)))
+        matched = [_term(word) for word in normalized]
+        hits = [i for i, term in enumerate(matched) if term in terms]
+        for i in hits:
+            nearby = {matched[j] for j in hits if abs(j - i) <= window}
+            if len(nearby) >= threshold:
+                weak.append(i)
+    return strong, weak
+
+
+def mentions_control(sechub_finding, passages):
+    """
+    Return True when a passage mentions the control ID or the playbook name of the finding.
+    """
+    control_ids, playbooks, _ = finding_anchors(sechub_finding)
+    if not control_ids and not playbooks:
+        return False
+    for passage in passages:
+        strong, _ = _anchor_positions(passage.split(), control_ids, playbooks, set(), CONTEXT_WINDOW_WORDS)
+        if strong:
+            return True
+    return False
+
+
+def _spans(rank, words, strong, weak, window):
+    """
+    Merge the windows around the anchors of a passage into spans, the strong ones first.
+    """
+    windows = [(max(i - window, 0), min(i + window + 1, len(words)), 0) for i in strong]
+    windows += [(max(i - window, 0), min(i + window + 1, len(words)), 1) for i in weak]
+    spans = []
+    for start, end, priority in sorted(windows):
+        if spans and start <= spans[-1].end:
+            last = spans[-1]
+            spans[-1] = Span(min(last.priority, priority), rank, last.start, max(last.end, end))
+        else:
+            spans.append(Span(priority, rank, start, end))
+    return spans
+
+
+def _span_text(words, duplicate, span):
+    return " ".join(word for word, is_duplicate in zip(words[span.start:span.end], duplicate[span.start:span.end])
+                    if not is_duplicate)
+
+
+def compress_context(sechub_finding, passages, token_budget=None, window=None):
+    """
+    Reduce retrieved passages to the text that is about the finding, within a token budget.
+
+    Text repeated by overlapping chunks is dropped. Of the rest, only windows of `window` words around
+    the finding's control ID and playbook names, and around runs of the finding's title words, are kept.
+    Spans are added by priority (control ID and playbook spans first, then by retrieval rank) until
+    the budget is used up, and rendered in retrieval order. When nothing in the passages matches the
+    finding, the deduplicated passages are kept in retrieval order up to the budget.
+
+    Args:
+        sechub_finding (str): The finding title the passages were retrieved for.
+        passages (list): The retrieved passage texts, best first.
+        token_budget (int): Upper bound of the result in estimated tokens. Defaults to CONTEXT_TOKEN_BUDGET.
+        window (int): Words kept on each side of an anchor. Defaults to CONTEXT_WINDOW_WORDS.
+
+    Returns:
+        CompressedContext: The compressed context and its token counts.
+    """
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    window = window or CONTEXT_WINDOW_WORDS
+    control_ids, playbooks, terms = finding_anchors(sechub_finding)
+    passages_words = [passage.split() for passage in passages]
+    duplicates = _duplicate_flags(passages_words)
+
+    candidates = []
+    for rank, words in enumerate(passages_words):
+        strong, weak = _anchor_positions(words, control_ids, playbooks, terms, window)
+        candidates += _spans(rank, words, strong, weak, window)
+    if not candidates:
+        candidates = [Span(2, rank, 0, len(words)) for rank, words in enumerate(passages_words)]
+
+    selected, used = [], 0
+    for span in sorted(candidates):
+        words, duplicate = passages_words[span.rank], duplicates[span.rank]
+        text = _span_text(words, duplicate, span)
+        if not text:
+            continue
+        tokens = estimate_tokens(text) + 1
+        if used + tokens > token_budget:
+            if selected:
+                continue
+            # The best span alone is over the budget: keep the words that fit
+            text = text[:(token_budget - 1) * 4].rsplit(" ", 1)[0]
+            tokens = estimate_tokens(text) + 1
+        selected.append((span.rank, span.start, text))
+        used += tokens
+
+    rendered = []
+    for rank in sorted({rank for rank, _, _ in selected}):
+        rendered.append(SPAN_SEPARATOR.join(text for span_rank, _, text in sorted(selected) if span_rank == rank))
+    text = "\n\n".join(rendered)
+    return CompressedContext(text, sum(estimate_tokens(passage) for passage in passages), estimate_tokens(text),
+                             len(passages), len(selected))
+
+
+def compress_retrieved_context(sechub_finding, passages):
+    """
+    Compress retrieved passages for prompt 1 and record the tokens saved on the current metrics recorder.
+
+    Returns:
+        str: The context to render as {context}.
+    """
+    with metrics.get_recorder().stage("context_compression") as stage:
+        compressed = compress_context(sechub_finding, passages)
+        stage.add("ContextTokensIn", compressed.tokens_in)
+        stage.add("ContextTokensOut", compressed.tokens_out)
+        stage.add("ContextTokensSaved", compressed.tokens_in - compressed.tokens_out)
+    LOGGER.info("Compressed {} passages from {} to {} tokens in {} spans".format(
+        compressed.passages_in, compressed.tokens_in, compressed.tokens_out, compressed.spans))
+    return compressed.text
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+LOGGER = logging.getLogger(__name__)
+
+# Bumped when the layout of control_index.json changes; see scripts/build_control_index.py
+INDEX_VERSION = 1
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'control_index.json')
+
+# A Security Hub control ID such as S3.4 or CloudTrail.1, bare or in brackets/parentheses
+CONTROL_ID_PATTERN = re.compile(r'(?:^|[\[(\s])([A-Za-z][A-Za-z0-9]*\.\d+)(?=$|[\])\s:,])')
+
+
+def title_key(title):
+    """
+    Reduce a control title to lower-case letters and digits.
+
+    Finding titles vary in spacing and punctuation (a trailing period, "at-rest" for "at rest"), which
+    are ignored when comparing them.
+    """
+    return re.sub(r'[^a-z0-9]', '', unicodedata.normalize('NFKC', title).casefold())
+
+
+def find_control_ids(sechub_finding):
+    """
+    Return the control IDs mentioned in a finding title, e.g. ["S3.4"] for "[S3.4] S3 buckets should ...".
+    """
+    return CONTROL_ID_PATTERN.findall(sechub_finding)
+
+
+class ControlIndex:
+    """
+    Control ID -> ASR playbook / Systems Manager runbook mappings from the ASR implementation guide.
+
+    Args:
+        controls (dict): Control ID -> {"runbook", "title", "resource_type"}.
+        titles (dict): title_key of the control title -> control ID.
+    """
+
+    def __init__(self, controls, titles):
+        self.controls = controls
+        self.titles = titles
+        self._ids = {control_id.casefold(): control_id for control_id in controls}
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError("Unsupported control index version {} in {}".format(data.get('version'), path))
+        return cls(data['controls'], data['titles'])
+
+    def lookup(self, sechub_finding):
+        """
+        Find the control of a finding by exact control ID, or else by exact (normalized) title.
+
+        Returns:
+            tuple: (control ID, control entry) or None when there is no exact match.
+        """
+        for control_id in find_control_ids(sechub_finding):
+            control_id = self._ids.get(control_id.casefold())
+            if control_id is not None:
+                return control_id, self.controls[control_id]
+        control_id = self.titles.get(title_key(sechub_finding))
+        if control_id is not None:
+            return control_id, self.controls[control_id]
+        return None
+
+    def get_output_params(self, sechub_finding):
+        """
+        Build the chain 1 output fields for a finding with a known playbook, without calling the model.
+
+        Returns:
+            dict: The same keys as index.get_output_params, or None when the finding is not in the index.
+        """
+        match = self.lookup(sechub_finding)
+        if match is None:
+            return None
+        control_id, control = match
+        return {
+            "remediation_runbook": control["runbook"],
+            "remediation_details": "The {} runbook remediates Security Hub control {}: {}".format(
+                control["runbook"], control_id, control["title"]),
+            "remediation_available": True,
+            "resource_type": control["resource_type"],
+        }
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_control_index():
+    """
+    Get the process-level ControlIndex loaded from CONTROL_INDEX_PATH (control_index.json next to
+    this module by default), or None when the file is missing or invalid.
+    """
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                path = os.environ.get('CONTROL_INDEX_PATH', DEFAULT_INDEX_PATH)
+                try:
+                    _INDEX = ControlIndex.load(path)
+                except (OSError, ValueError) as e:
+                    LOGGER.warning("Control index not available, every finding takes the RAG path: %s", e)
+                    _INDEX = ControlIndex({}, {})
+    return _INDEX if _INDEX.controls else None
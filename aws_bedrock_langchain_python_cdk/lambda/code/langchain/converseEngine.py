@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import re
+from collections import namedtuple
+
+import metrics
+from modelRouting import FALLBACK_ERRORS, converse_inference_config, record_fallback
+from remediation import BaseRemediationHandler, YamlTemplateStream
+
+LOGGER = logging.getLogger(__name__)
+
+# Fields of the chain 1 output, in the order of the sechub_output model of RemediationHandler.get_pydantic_parser
+SECHUB_OUTPUT_FIELDS = [
+    ("remediation_details", "string"),
+    ("remediation_available", "boolean"),
+    ("remediation_runbook", "string"),
+    ("security_hub_finding_title", "string"),
+    ("resource_type", "string"),
+]
+
+SecHubOutput = namedtuple("SecHubOutput", [name for name, _ in SECHUB_OUTPUT_FIELDS])
+
+# Same text as the format instructions LangChain's PydanticOutputParser renders for sechub_output,
+# so both engines send the model the same prompt 1
+FORMAT_INSTRUCTIONS = """The output should be formatted as a JSON instance that conforms to the JSON schema below.
+
+As an example, for the schema {{"properties": {{"foo": {{"title": "Foo", "description": "a list of strings", "type": "array", "items": {{"type": "string"}}}}}}, "required": ["foo"]}}
+the object {{"foo": ["bar", "baz"]}} is a well-formatted instance of the schema. The object {{"properties": {{"foo": ["bar", "baz"]}}}} is not well-formatted.
+
+Here is the output schema:
+```
+{schema}
+```"""
+
+JSON_BLOCK = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+
+def get_format_instructions():
+    """
+    Render the JSON schema instructions for the chain 1 output.
+    """
+    schema = {
+        "properties": {
+            name: {"description": name, "title": name.replace("_", " ").title(), "type": json_type}
+            for name, json_type in SECHUB_OUTPUT_FIELDS
+        },
+        "required": [name for name, _ in SECHUB_OUTPUT_FIELDS],
+    }
+    return FORMAT_INSTRUCTIONS.format(schema=json.dumps(schema, ensure_ascii=False))
+
+
+def parse_sechub_output(text):
+    """
+    Parse the chain 1 model output into a SecHubOutput.
+
+    Accepts a bare JSON object or one inside a Markdown code block, like LangChain's PydanticOutputParser.
+
+    Raises:
+        ValueError: When the output is not a JSON object with the sechub_output fields.
+    """
+    match = JSON_BLOCK.search(text)
+    candidate = match.group(1) if match else text[text.find("{"):text.rfind("}") + 1]
+    try:
+        data = json.loads(candidate)
+    except ValueError as e:
+        raise ValueError("Failed to parse sechub_output from completion {}: {}".format(text, e))
+    if not isinstance(data, dict):
+        raise ValueError("Failed to parse sechub_output from completion {}".format(text))
+    values = {}
+    for name, json_type in SECHUB_OUTPUT_FIELDS:
+        if name not in data:
+            raise ValueError("Failed to parse sechub_output from completion {}: missing {}".format(text, name))
+        value = data[name]
+        if json_type == "boolean" and isinstance(value, str):
+            value = value.strip().lower() in ("true", "yes", "1")
+        values[name] = bool(value) if json_type == "boolean" else str(value)
+    return SecHubOutput(**values)
+
+
+class ConverseChain:
+    """
+    Minimal stand-in for a LangChain runnable: renders a prompt template, calls Converse and parses the output.
+
+    Args:
+        handler (ConverseRemediationHandler): The handler owning the Bedrock clients.
+        template (str): The prompt template, with {name} placeholders.
+        knowledge_id (str): When set, the input is a finding title used as the Retrieve query and the
+            retrieved passages are rendered as {context}.
+        parse (callable): Converts the completion text to the chain output.
+        partial_variables (dict): Template variables that are the same for every call.
+        route_stage (str): The stage whose model answers the chain, see BaseRemediationHandler.get_route.
+    """
+
+    def __init__(self, handler, template, knowledge_id=None, parse=None, partial_variables=None, route_stage=None):
+        self.handler = handler
+        self.template = template
+        self.knowledge_id = knowledge_id
+        self.parse = parse
+        self.partial_variables = partial_variables or {}
+        self.route_stage = route_stage
+
+    def render(self, inputs, stage):
+        if self.knowledge_id is None:
+            variables = dict(inputs)
+        else:
+            variables = {
+                "context": self.handler.retrieve_context(inputs, self.knowledge_id, stage),
+                "$security_hub_finding_title": inputs,
+            }
+        variables.update(self.partial_variables)
+        return self.template.format(**variables)
+
+    def invoke(self, inputs, config=None):
+        stage = (config or {}).get("stage")
+        text = self.handler.converse(self.render(inputs, stage), stage, route_stage=self.route_stage)
+        return self.parse(text) if self.parse else text
+
+    async def ainvoke(self, inputs, config=None):
+        return await asyncio.to_thread(self.invoke, inputs, config)
+
+
+class ConverseRemediationHandler(BaseRemediationHandler):
+    """
+    The remediation engine that calls bedrock-runtime Converse and bedrock-agent-runtime Retrieve directly.
+
+    It renders the same prompt templates and returns the same chain outputs as the LangChain engine, without
+    loading LangChain or pydantic. The retrieved passages are rendered as plain text separated by blank
+    lines rather than as a list of LangChain Document objects.
+    """
+    RETRIEVAL_CONFIGURATION = {
+        "vectorSearchConfiguration": {
+            "numberOfResults": 4,
+            "overrideSearchType": "HYBRID"
+        }
+    }
+
+    def chain_config(self, stage):
+        return {"stage": stage}
+
+    def inference_config(self, route_stage=None):
+        """
+        Converse inference parameters of a stage, the same as the BedrockChat model_kwargs of the LangChain engine.
+        """
+        return converse_inference_config(self.get_route(route_stage).model_kwargs)
+
+    def _messages(self, prompt):
+        return [{"role": "user", "content": [{"text": prompt}]}]
+
+    def _record_usage(self, stage, usage):
+        if stage is not None and usage:
+            stage.add("InputTokens", usage.get("inputTokens", 0))
+            stage.add("OutputTokens", usage.get("outputTokens", 0))
+
+    def _call_routed(self, operation, route_stage, prompt):
+        """
+        Call a Converse operation on the model of a stage, and on its fallback model when that fails.
+        """
+        route = self.get_route(route_stage)
+        request = {"messages": self._messages(prompt), "inferenceConfig": converse_inference_config(route.model_kwargs)}
+        try:
+            return getattr(self.get_model_client(route), operation)(modelId=route.model_id, **request)
+        except FALLBACK_ERRORS:
+            if route.fallback_model_id is None:
+                raise
+            record_fallback(route_stage, route)
+            return getattr(self.get_fallback_client(route), operation)(modelId=route.fallback_model_id, **request)
+
+    def converse(self, prompt, stage=None, route_stage=None):
+        """
+        Send a single user message to the model of route_stage and return the text of the reply.
+        """
+        response = self._call_routed("converse", route_stage, prompt)
+        self._record_usage(stage, response.get("usage"))
+        return "".join(block.get("text", "") for block in response["output"]["message"]["content"])
+
+    def retrieve_context(self, query, knowledge_id, stage=None):
+        """
+        Retrieve knowledge base passages for the query and render them for the {context} placeholder
+        (see render_context).
+        """
+        with metrics.get_recorder().stage("kb_retrieval") as retrieval:
+            response = self.get_knowledge_base_client().retrieve(
+                retrievalQuery={"text": query},
+                knowledgeBaseId=knowledge_id,
+                retrievalConfiguration=self.RETRIEVAL_CONFIGURATION
+            )
+            results = response["retrievalResults"]
+            retrieval.add("RetrievedDocuments", len(results))
+        if stage is not None:
+            stage.add("RetrievedDocuments", len(results))
+        return self.render_context(query, [result["content"]["text"] for result in results])
+
+    def answerChain(self, template):
+        return ConverseChain(self, template, parse=parse_sechub_output,
+                             partial_variables={"format_instructions": get_format_instructions()},
+                             route_stage="chain_1")
+
+    def _build_retrieval_chain(self, template, knowledge_id):
+        return ConverseChain(self, template, knowledge_id=knowledge_id, parse=parse_sechub_output,
+                             partial_variables={"format_instructions": get_format_instructions()},
+                             route_stage="chain_1")
+
+    def QAChain(self, template, stage=None):
+        return self._get_or_build_chain(("qa", stage, template),
+                                        lambda: ConverseChain(self, template, route_stage=stage))
+
+    def stream_yaml_generation(self, template, inputs, config=None):
+        stage = (config or {}).get("stage")
+        stream_metrics = self._start_stream_metrics()
+        template_stream = YamlTemplateStream()
+        # Falls back when the stream cannot be opened; a stream failing midway is not restarted
+        response = self._call_routed("converse_stream", "chain_2", template.format(**inputs))
+        stream = response["stream"]
+        try:
+            for event in stream:
+                # Usage comes with the last event, a stream stopped at the closing fence has none
+                self._record_usage(stage, event.get("metadata", {}).get("usage"))
+                delta = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+                if delta and self._update_stream_metrics(stream_metrics, template_stream, delta):
+                    break
+        finally:
+            # Closing the event stream abandons the rest of the generation
+            stream.close()
+        stream_metrics.pop("start")
+        return template_stream.text, stream_metrics
+
+    async def astream_yaml_generation(self, template, inputs, config=None):
+        return await asyncio.to_thread(self.stream_yaml_generation, template, inputs, config)
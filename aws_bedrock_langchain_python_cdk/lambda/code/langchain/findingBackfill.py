@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+from findingEvents import finding_title
+from findingKey import finding_key
+
+LOGGER = logging.getLogger(__name__)
+
+# Failed findings of active resources that nobody suppressed or resolved yet
+BACKFILL_FILTERS = {
+    "ComplianceStatus": [{"Value": "FAILED", "Comparison": "EQUALS"}],
+    "RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}],
+    "WorkflowStatus": [{"Value": "NEW", "Comparison": "EQUALS"}, {"Value": "NOTIFIED", "Comparison": "EQUALS"}],
+}
+# GetFindings returns at most 100 findings per page
+PAGE_SIZE = 100
+# Controls remediated, and committed, together
+CHUNK_SIZE = int(os.environ.get('BACKFILL_CHUNK_SIZE', '10'))
+
+# Statuses of remediate_findings results that count as remediated
+REMEDIATED_STATUSES = ("completed", "pending")
+
+
+class BackfillCheckpoint:
+    """
+    Progress of a backfill, saved as JSON after every page of findings and every chunk of controls,
+    so that an interrupted run resumes where it stopped.
+
+    Args:
+        path (str): The checkpoint file. Progress is loaded from it when it exists.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {"next_token": None, "scan_complete": False, "controls": {}, "remediated": {}, "failed": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state.update(json.load(f))
+            LOGGER.info("Resuming backfill from {}: {} controls found, {} remediated".format(
+                path, len(self.state["controls"]), len(self.state["remediated"])))
+
+    @property
+    def controls(self):
+        """
+        dict: Finding key -> {"sechub_finding": canonical title, "findings": number of findings}.
+        """
+        return self.state["controls"]
+
+    def add_finding(self, finding):
+        title = finding_title(finding)
+        if not title:
+            return
+        control = self.state["controls"].setdefault(finding_key(title), {"sechub_finding": title, "findings": 0})
+        control["findings"] += 1
+
+    def restart_scan(self):
+        """
+        Scan the findings again from the first page, keeping the controls already remediated.
+        """
+        self.state.update(next_token=None, scan_complete=False, controls={})
+
+    def pending_controls(self):
+        return [key for key in self.state["controls"] if key not in self.state["remediated"]]
+
+    def save(self):
+        # Replace the file in one step, so that an interruption never leaves a truncated checkpoint
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.path)
+
+
+def scan_findings(client, checkpoint, filters=None):
+    """
+    Page through GetFindings and group the findings by control in the checkpoint.
+
+    Args:
+        client: A securityhub client.
+        checkpoint (BackfillCheckpoint): Where the scan resumes from and records its progress.
+        filters (dict): GetFindings filters, BACKFILL_FILTERS by default.
+    """
+    pages = 0
+    while not checkpoint.state["scan_complete"]:
+        request = {"Filters": filters or BACKFILL_FILTERS, "MaxResults": PAGE_SIZE}
+        if checkpoint.state["next_token"]:
+            request["NextToken"] = checkpoint.state["next_token"]
+        try:
+            response = client.get_findings(**request)
+        except ClientError as e:
+            if "NextToken" not in request or e.response["Error"]["Code"] != "InvalidInputException":
+                raise
+            # Tokens expire; the controls of the pages already read are found again
+            LOGGER.warning("Could not resume the findings scan, starting over: {}".format(e))
+            checkpoint.restart_scan()
+            continue
+        for finding in response["Findings"]:
+            checkpoint.add_finding(finding)
+        checkpoint.state["next_token"] = response.get("NextToken")
+        checkpoint.state["scan_complete"] = not response.get("NextToken")
+        checkpoint.save()
+        pages += 1
+    LOGGER.info("Scanned {} pages of findings: {} controls".format(pages, len(checkpoint.controls)))
+
+
+def remediate_controls(checkpoint, remediate, chunk_size=None):
+    """
+    Remediate the controls of the checkpoint that are not remediated yet, chunk_size at a time.
+
+    Args:
+        checkpoint (BackfillCheckpoint): The scanned controls and the progress of the remediation.
+        remediate: Callable taking a list of finding titles and returning one result dict per title,
+            with its "status" (see index.remediate_findings).
+        chunk_size (int): Controls remediated and committed together.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    pending = checkpoint.pending_controls()
+    for start in range(0, len(pending), chunk_size):
+        keys = pending[start:start + chunk_size]
+        results = remediate([checkpoint.controls[key]["sechub_finding"] for key in keys])
+        for key, result in zip(keys, results):
+            if result["status"] in REMEDIATED_STATUSES:
+                checkpoint.state["remediated"][key] = result["status"]
+                checkpoint.state["failed"].pop(key, None)
+            else:
+                checkpoint.state["failed"][key] = result["body"]
+        checkpoint.save()
+        LOGGER.info("Remediated {} of {} controls".format(len(checkpoint.state["remediated"]), len(checkpoint.controls)))
+
+
+def run_backfill(client, checkpoint, remediate, chunk_size=None):
+    """
+    Pre-generate the remediations of the failed findings of an account: scan the findings, then
+    remediate every control once.
+
+    Returns:
+        dict: The numbers of findings and controls, and the controls remediated and failed.
+    """
+    scan_findings(client, checkpoint)
+    remediate_controls(checkpoint, remediate, chunk_size)
+    return {
+        "findings": sum(control["findings"] for control in checkpoint.controls.values()),
+        "controls": len(checkpoint.controls),
+        "remediated": len(checkpoint.state["remediated"]),
+        "failed": OrderedDict(sorted(checkpoint.state["failed"].items())),
+    }
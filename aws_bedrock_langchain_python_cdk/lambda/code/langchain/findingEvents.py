@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+from findingKey import canonical_finding_title, finding_key
+
+LOGGER = logging.getLogger(__name__)
+
+# A control remediated by this container is not remediated again for its findings imported within
+# this many seconds. Bursts are coalesced within an SQS batch first (see the event source batching
+# window); this window spans the batches a warm container consumes.
+INGESTION_WINDOW_SECONDS = int(os.environ.get('INGESTION_WINDOW_SECONDS', '900'))
+
+FindingWindow = namedtuple('FindingWindow', ['key', 'sechub_finding', 'message_ids', 'findings'])
+FindingWindow.__doc__ = """
+The imported findings of one control in a batch of Security Hub events.
+
+Args:
+    key (str): The finding key shared by the findings (see findingKey.finding_key), e.g. "S3.4".
+    sechub_finding (str): The canonical title the remediation flow runs for.
+    message_ids (list): IDs of the SQS messages carrying the findings, to report their failure.
+    findings (int): Number of findings coalesced into the window.
+"""
+
+
+def control_id(finding):
+    """
+    Return the Security Hub control ID of an ASFF finding, or None for findings that are not control
+    findings (GuardDuty, Inspector, ...).
+    """
+    compliance = finding.get('Compliance') or {}
+    if compliance.get('SecurityControlId'):
+        return compliance['SecurityControlId']
+    generator_id = finding.get('GeneratorId') or ''
+    if generator_id.startswith('security-control/'):
+        return generator_id.split('/', 1)[1]
+    return (finding.get('ProductFields') or {}).get('ControlId')
+
+
+def finding_title(finding):
+    """
+    Build the finding title the agent would send for an ASFF finding: its control ID, if any, in
+    brackets in front of its title.
+    """
+    title = finding.get('Title') or ''
+    control = control_id(finding)
+    if control and control not in title:
+        title = "[{}] {}".format(control, title)
+    return canonical_finding_title(title)
+
+
+def event_findings(record):
+    """
+    Read the findings of an SQS record carrying a "Security Hub Findings - Imported" event.
+
+    Returns:
+        list: The ASFF findings; empty for a message that is not such an event.
+    """
+    try:
+        event = json.loads(record['body'])
+        return list(event['detail']['findings'])
+    except (ValueError, KeyError, TypeError) as e:
+        LOGGER.warning("Skipping message {} that is not a Security Hub findings event: {}".format(
+            record.get('messageId'), e))
+        return []
+
+
+def coalesce_finding_events(records):
+    """
+    Coalesce the findings of a batch of SQS records by control ID, or by canonical title for
+    findings without one.
+
+    Args:
+        records (list): SQS records of the Lambda event, each carrying one EventBridge event.
+
+    Returns:
+        list: FindingWindow per distinct control, in order of first appearance.
+    """
+    windows = OrderedDict()
+    for record in records:
+        for finding in event_findings(record):
+            title = finding_title(finding)
+            if not title:
+                continue
+            key = finding_key(title)
+            if key not in windows:
+                windows[key] = FindingWindow(key, title, [], 0)
+            window = windows[key]
+            if record['messageId'] not in window.message_ids:
+                window.message_ids.append(record['messageId'])
+            windows[key] = window._replace(findings=window.findings + 1)
+    return list(windows.values())
+
+
+class RecentFindings:
+    """
+    The finding keys remediated by this container within the last window_seconds.
+    """
+
+    def __init__(self, window_seconds=INGESTION_WINDOW_SECONDS, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._remediated = {}
+
+    def is_recent(self, key):
+        remediated = self._remediated.get(key)
+        if remediated is None:
+            return False
+        if self.clock() - remediated >= self.window_seconds:
+            del self._remediated[key]
+            return False
+        return True
+
+    def add(self, key):
+        self._remediated[key] = self.clock()
+
+
+_RECENT_FINDINGS = None
+
+
+def get_recent_findings():
+    global _RECENT_FINDINGS
+    if _RECENT_FINDINGS is None:
+        _RECENT_FINDINGS = RecentFindings()
+    return _RECENT_FINDINGS
@@ -0,0 +1,101 @@
+import hashlib
+import re
+import unicodedata
+
+from controlIndex import CONTROL_ID_PATTERN, get_control_index
+
+# Identifiers that differ between accounts and resources but not between findings. An optional
+# label in front ("account 123456789012", "in us-east-1", "resource: i-0abc...") goes with them.
+VOLATILE_PATTERN = re.compile(
+    r'(?:\b(?:in|for|on|of)\s+)?'
+    r'(?:\b(?:account|region|resource|arn)(?:\s*id)?\s*[:=]?\s*)?'
+    r'(?:'
+    r'arn:aws[a-z-]*:[^\s,;\'"\])]+'
+    r'|s3://[^\s,;\'"\])]+'
+    r'|(?<![\w.-])\d{12}(?![\w.-])'
+    r'|\b(?:us|eu|ap|sa|ca|me|af|il|mx|cn)(?:-gov|-iso[a-z]?)?'
+    r'-(?:north|south|east|west|central|northeast|southeast|northwest|southwest)-\d\b'
+    r'|\b(?:i|sg|vpc|subnet|vol|snap|ami|eni|igw|rtb|acl|nat|eipalloc|tgw|pcx|vpce|fs|lt)-[0-9a-f]{8,17}\b'
+    r')',
+    re.IGNORECASE,
+)
+BRACKETED_CONTROL_ID = re.compile(r'\[\s*([A-Za-z][A-Za-z0-9]*\.\d+)\s*\]')
+EMPTY_BRACKETS = re.compile(r'\(\s*\)|\[\s*\]')
+EDGE_PUNCTUATION = ' \t-:;,.|/'
+MAX_FILENAME_LENGTH = 100
+
+
+def find_control_id(sechub_finding):
+    """
+    Return the Security Hub control ID of a finding title in its canonical spelling, or None.
+
+    A bracketed ID ("[S3.4]") is always taken; a bare one ("S3.4", "(s3.4)") only when the control
+    index knows it, so version numbers such as "TLSv1.2" are not mistaken for controls.
+    """
+    control_index = get_control_index()
+    known = {control_id.casefold(): control_id for control_id in control_index.controls} if control_index else {}
+    match = BRACKETED_CONTROL_ID.search(sechub_finding)
+    if match:
+        return known.get(match.group(1).casefold(), match.group(1))
+    for control_id in CONTROL_ID_PATTERN.findall(sechub_finding):
+        if control_id.casefold() in known:
+            return known[control_id.casefold()]
+    return None
+
+
+def canonical_finding_title(sechub_finding):
+    """
+    Strip account IDs, ARNs, regions and resource IDs from a finding title and put its control ID, if
+    any, in front as "[S3.4]".
+
+    The result is what the chains see, so a remediation computed for one account's finding carries no
+    identifiers of that account and can be shared with every equivalent finding.
+
+    Args:
+        sechub_finding (str): The finding title as received from the agent.
+
+    Returns:
+        str: The canonical title, e.g. "[S3.4] S3 buckets should have server-side encryption enabled".
+    """
+    title = unicodedata.normalize('NFKC', sechub_finding)
+    title = VOLATILE_PATTERN.sub(' ', title)
+    control_id = find_control_id(title)
+    if control_id is not None:
+        pattern = r'[\[(]?\s*(?<![\w.]){}(?![\w.])\s*[\])]?'.format(re.escape(control_id))
+        title = re.sub(pattern, ' ', title, count=1, flags=re.IGNORECASE)
+    title = EMPTY_BRACKETS.sub(' ', title)
+    title = " ".join(title.split()).strip(EDGE_PUNCTUATION)
+    if control_id is not None:
+        return "[{}] {}".format(control_id, title).rstrip()
+    return title
+
+
+def finding_key(sechub_finding):
+    """
+    Map a finding title to the key shared by all equivalent findings.
+
+    Findings of one Security Hub control share the control ID as key, whatever the rest of the
+    title says; other findings share the lower-cased canonical title.
+
+    Returns:
+        str: e.g. "S3.4" or "s3 buckets should have lifecycle policies".
+    """
+    title = canonical_finding_title(sechub_finding)
+    match = BRACKETED_CONTROL_ID.match(title)
+    if match:
+        return match.group(1)
+    return title.casefold()
+
+
+def finding_filename(sechub_finding):
+    """
+    Build the template file name of a finding from its key, e.g. "S3.4" or
+    "s3-buckets-should-have-lifecycle-policies". Long titles are shortened and suffixed with a hash
+    of the key so that the name stays unique.
+    """
+    key = finding_key(sechub_finding)
+    filename = re.sub(r'[^A-Za-z0-9.]+', '-', key).strip('-.')
+    if len(filename) > MAX_FILENAME_LENGTH:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]
+        filename = "{}-{}".format(filename[:MAX_FILENAME_LENGTH - 9].rstrip('-.'), digest)
+    return filename
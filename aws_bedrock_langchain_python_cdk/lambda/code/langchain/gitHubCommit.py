@@ -1,53 +1,265 @@
+import hashlib
 import logging
-from github import Github, GithubException
+import os
+import posixpath
+import threading
+import time
 import boto3
 
+# PyGithub is imported by the methods that use it: it is only needed once a template is committed,
+# so invocations that never reach the ```yaml branch do not pay for loading it.
+
 logging.basicConfig(level=logging.INFO)
 
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+# How long the token read from Secrets Manager is trusted
+GITHUB_TOKEN_TTL_SECONDS = int(os.environ.get('GITHUB_TOKEN_TTL_SECONDS', '3600'))
+
+# Committers are cached per container, keyed by repo and API url, so warm invocations reuse
+# the token, the GitHub client and the repo metadata.
+_COMMITTERS = {}
+_COMMITTERS_LOCK = threading.Lock()
+
+
+def get_github_committer(github_repo, base_url=GITHUB_API_URL, github_options=None):
+    """
+    Get the GitHubCommitter for a repo, creating it on first use in this container.
+    """
+    key = (github_repo, base_url)
+    with _COMMITTERS_LOCK:
+        committer = _COMMITTERS.get(key)
+        if committer is None:
+            committer = GitHubCommitter(github_repo, base_url=base_url, github_options=github_options)
+            _COMMITTERS[key] = committer
+    return committer
+
+
+def clear_github_committers():
+    """
+    Drop every cached GitHubCommitter.
+    """
+    with _COMMITTERS_LOCK:
+        _COMMITTERS.clear()
+
+def template_file_path(resource_type, filename):
+    """
+    Path of a remediation template in the repo, e.g. "S3/GenRem-S3.4.yaml".
+    """
+    return f'{resource_type}/GenRem-{filename}.yaml'
+
+def is_generated_file(path):
+    """
+    Check whether a file is one the remediation commits write: a GenRem-*.yaml template or a
+    parameters file (see remediationArtifacts.parameters_file_path).
+    """
+    from remediationArtifacts import is_parameters_file
+    name = posixpath.basename(path)
+    return (name.startswith('GenRem-') and name.endswith('.yaml')) or is_parameters_file(path)
+
+def git_blob_sha(file_content):
+    """
+    Compute the git blob SHA of file content, as GitHub reports it for the file.
+    """
+    data = file_content.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
 class GitHubCommitter:
-    def __init__(self, github_repo):
-        # Retrieving GitHub access token from secrets manager 'github-token' secret.
+    def __init__(self, github_repo, base_url=GITHUB_API_URL, github_options=None, token_ttl_seconds=GITHUB_TOKEN_TTL_SECONDS):
+        self.github_repo = github_repo
+        self.base_url = base_url
+        self.github_options = github_options or {}
+        self.token_ttl_seconds = token_ttl_seconds
         self.client = boto3.client('secretsmanager')
+        self.default_branch = None
+        # (head commit SHA, {path: blob sha}) of the generated files on the default branch (see is_generated_file)
+        self.branch_files = (None, {})
+        # Tree commits of the threads sharing this committer would only race each other for the branch
+        self._commit_lock = threading.Lock()
+        self.connect()
+
+    def connect(self):
+        """
+        Fetch the GitHub token and build the GitHub client. Repo metadata is only fetched the first time.
+        """
+        from github import Github
+        # Retrieving GitHub access token from secrets manager 'github-token' secret.
         try:
             self.oauth_token = self.client.get_secret_value(SecretId='github-token')['SecretString']
         except Exception as e:
             logging.error(f"Failed to retrieve GitHub token: {str(e)}")
             raise
-        self.g = Github(self.oauth_token)
-        self.repo = self.g.get_repo(github_repo)
-        self.default_branch = self.repo.default_branch
+        self.token_fetched_at = time.monotonic()
+        self.g = Github(self.oauth_token, base_url=self.base_url, **self.github_options)
+        if self.default_branch is None:
+            self.repo = self.g.get_repo(self.github_repo)
+            self.default_branch = self.repo.default_branch
+        else:
+            # Metadata is already known, bind the repo to the new client without a round trip
+            self.repo = self.g.get_repo(self.github_repo, lazy=True)
 
-    def read_file_content(self, filepath):
-        with open(filepath, 'r') as file:
-            return file.read()
-
-    def create_file_path(self, resource_type, filename):
-        return f'{resource_type}/GenRem-{filename}.yaml'
-
-    def update_or_create_file(self, file_path, commit_message, file_content):
+    def call_with_credentials(self, operation, *args):
+        """
+        Run a GitHub operation, refreshing the token when it is older than its TTL or was rejected.
+        """
+        from github import GithubException
+        if time.monotonic() - self.token_fetched_at >= self.token_ttl_seconds:
+            self.connect()
         try:
-            # Try to get the file contents
-            file = self.repo.get_contents(file_path, ref=self.default_branch)
-            # If successful, update the existing file
-            return self.repo.update_file(file_path, commit_message, file_content, file.sha, branch=self.default_branch)
+            return operation(*args)
         except GithubException as e:
-            if e.status == 404:
-                # If file not found, create a new file
-                return self.repo.create_file(file_path, commit_message, file_content, branch=self.default_branch)
-            else:
-                # If it's a different kind of error, re-raise it
+            if e.status != 401:
                 raise
+            # The token was rotated in Secrets Manager, fetch it again and retry once
+            logging.info("GitHub rejected the cached token, fetching it again")
+            self.connect()
+            return operation(*args)
+
+    def create_file_path(self, resource_type, filename):
+        return template_file_path(resource_type, filename)
+
+    def get_branch_files(self):
+        """
+        Get the branch head and the blob SHAs of the generated files on the default branch.
+
+        The listing is cached per head commit: one ref lookup tells whether it is current, so commits
+        made by other containers or by the commit queue consumer are always seen.
+
+        Returns:
+            tuple: The GitRef of the default branch, and {path: blob sha}.
+        """
+        ref = self.repo.get_git_ref(f'heads/{self.default_branch}')
+        head_sha, shas = self.branch_files
+        if head_sha != ref.object.sha:
+            head = self.repo.get_git_commit(ref.object.sha)
+            # One recursive listing of the whole tree; the contents API stops at 1000 files per directory
+            tree = self.repo.get_git_tree(head.tree.sha, recursive=True)
+            if tree.truncated:
+                logging.warning(f"Tree of {self.default_branch} is truncated, unlisted files are committed again")
+            shas = {item.path: item.sha for item in tree.tree
+                    if item.type == 'blob' and is_generated_file(item.path)}
+            self.branch_files = (ref.object.sha, shas)
+        return ref, shas
+
+    def create_tree_commit(self, files, commit_message, max_attempts=5, ref=None):
+        """
+        Commit any number of files to the default branch as a single commit using the Git Data API.
+
+        The new tree and commit are built on top of the current branch head and the branch is
+        fast-forwarded to the new commit. If the branch moved in the meantime, the update is
+        rejected and the commit is rebuilt on the new head.
+
+        Args:
+            files (dict): File path in the repo -> file content.
+            commit_message (str): The commit message.
+            max_attempts (int): How many times to rebuild the commit when the branch moves.
+            ref (GitRef): The default branch, when it was just fetched.
+
+        Returns:
+            GitCommit: The new commit.
+        """
+        from github import InputGitTreeElement
+        # File contents are sent inline in the tree request, GitHub creates the blobs server side
+        elements = [InputGitTreeElement(path, '100644', 'blob', content=content) for path, content in files.items()]
+        with self._commit_lock:
+            return self._create_tree_commit(elements, commit_message, max_attempts, ref)
+
+    def _create_tree_commit(self, elements, commit_message, max_attempts, ref=None):
+        from github import GithubException
+        ref = ref or self.repo.get_git_ref(f'heads/{self.default_branch}')
+        for attempt in range(1, max_attempts + 1):
+            head = self.repo.get_git_commit(ref.object.sha)
+            tree = self.repo.create_git_tree(elements, base_tree=head.tree)
+            commit = self.repo.create_git_commit(commit_message, tree, [head])
+            try:
+                ref.edit(commit.sha, force=False)
+                return commit
+            except GithubException as e:
+                # 422: the branch no longer points at head, another commit landed first
+                if e.status != 422 or attempt == max_attempts:
+                    raise
+                logging.info(f"Branch {self.default_branch} moved, retrying commit (attempt {attempt})")
+                time.sleep(min(0.1 * 2 ** attempt, 2))
+                ref = self.repo.get_git_ref(f'heads/{self.default_branch}')
+
+    def merge_existing_parameters(self, files, shas):
+        """
+        Keep the values of the parameters files on the default branch, which operators may have edited,
+        for the parameters the new templates still declare.
+
+        Args:
+            files (dict): File path in the repo -> file content.
+            shas (dict): Blob SHAs of the generated files on the default branch (see get_branch_files).
+        """
+        from remediationArtifacts import is_parameters_file, merge_parameters, parameters_file_path, stack_name
+        templates = {parameters_file_path(stack_name(path)): content
+                     for path, content in files.items() if not is_parameters_file(path)}
+        merged = dict(files)
+        for path, content in files.items():
+            remote_sha = shas.get(path) if is_parameters_file(path) else None
+            if remote_sha is not None and remote_sha != git_blob_sha(content):
+                existing = self.repo.get_contents(path, ref=self.default_branch).decoded_content.decode('utf-8')
+                merged[path] = merge_parameters(content, existing, templates.get(path))
+        return merged
+
+    def commit_changed_files(self, files, resource_types):
+        """
+        Commit the files whose content differs from the default branch.
+
+        Returns:
+            tuple: The new GitCommit, or None when nothing changed, and the changed files.
+        """
+        from remediationArtifacts import is_parameters_file
+        ref, shas = self.get_branch_files()
+        files = self.merge_existing_parameters(files, shas)
+        changed = {path: content for path, content in files.items() if shas.get(path) != git_blob_sha(content)}
+        if not changed:
+            logging.info(f"Files unchanged, skipping commit: {list(files)}")
+            return None, changed
+        templates = [path for path in changed if not is_parameters_file(path)] or list(changed)
+        commit_message = f"Push the remediation templates for {len(templates)} security hub findings - {', '.join(sorted(set(resource_types)))}"
+        return self.create_tree_commit(changed, commit_message, ref=ref), changed
+
+    def commit_artifacts(self, artifacts):
+        """
+        Commit remediation artifacts (see remediationArtifacts.py) in one commit, so that the pipeline
+        never sees a template without its parameters file.
+
+        Args:
+            artifacts (list): The RemediationArtifact of each template.
+
+        Returns:
+            tuple: The new GitCommit, or None when every file was already up to date, and the list
+            of file paths, templates first.
+        """
+        from remediationArtifacts import artifact_files
+        return self.commit_contents(artifact_files(artifacts), [artifact.resource_type for artifact in artifacts])
+
+    def commit_contents(self, files, resource_types):
+        """
+        Commit file contents in one commit, skipping the files that are already up to date.
 
-    def commit_file(self, filename, filepath, resource_type):
-        file_content = self.read_file_content(filepath)
-        file_path = self.create_file_path(resource_type, filename)
-        commit_message = f"Push the remediation template for the security hub finding - {resource_type}"
+        Args:
+            files (dict): File path in the repo -> file content.
+            resource_types (list): The resource types of the templates, for the commit message.
 
+        Returns:
+            tuple: The new GitCommit, or None when every file was already up to date, and the list
+            of file paths.
+        """
+        from github import GithubException
         try:
-            commit_response = self.update_or_create_file(file_path, commit_message, file_content)
-            logging.info(f"File operation successful: {file_path}")
+            commit, changed = self.call_with_credentials(self.commit_changed_files, files, resource_types)
         except GithubException as e:
-            logging.error(f"Error committing file: {e}")
+            logging.error(f"Error committing files: {e}")
             raise
+        if commit is None:
+            return None, list(files)
+        logging.info(f"Commit {commit.sha} successful: {list(changed)}")
 
-        return commit_response, file_path
\ No newline at end of file
+        head_sha, shas = self.branch_files
+        if [parent.sha for parent in commit.parents] == [head_sha]:
+            # Built on the listed head: the new head's listing is known without another round trip
+            shas = dict(shas)
+            shas.update((path, git_blob_sha(content)) for path, content in changed.items())
+            self.branch_files = (commit.sha, shas)
+        return commit, list(files)
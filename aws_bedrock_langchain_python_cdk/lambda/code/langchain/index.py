@@ -1,7 +1,18 @@
+import asyncio
+import json
 import logging
 import os
-from remediation import RemediationHandler
-from gitHubCommit import GitHubCommitter
+from concurrent.futures import ThreadPoolExecutor
+from remediation import MODEL_FALLBACK_ID, MODEL_ROUTING, get_remediation_handler
+from modelRouting import load_model_routing, routing_key
+from gitHubCommit import get_github_committer
+from remediationArtifacts import build_artifact
+from commitQueue import commit_queue_settings, get_commit_queue
+from remediationCache import get_remediation_cache
+from findingKey import canonical_finding_title, finding_filename, finding_key
+from controlIndex import get_control_index
+from findingEvents import coalesce_finding_events, get_recent_findings
+import metrics
 
 # Logger 
 LOGGER=logging.getLogger()
@@ -11,6 +22,26 @@ kb_id = os.environ['KB_ID']
 modelId = os.environ['MODEL_ID']
 github_repo = os.environ['GITHUB_REPO']
 github_owner = os.environ['GITHUB_OWNER']
+cache_enabled = os.environ.get('CACHE_ENABLED', 'true').lower() == 'true'
+control_index_enabled = os.environ.get('CONTROL_INDEX_ENABLED', 'true').lower() == 'true'
+streaming_generation = os.environ.get('STREAMING_GENERATION', 'false').lower() == 'true'
+batch_max_concurrency = int(os.environ.get('BATCH_MAX_CONCURRENCY', '4'))
+batch_time_reserve_seconds = int(os.environ.get('BATCH_TIME_RESERVE_SECONDS', '60'))
+# Cache entries are keyed by the models that produced them: MODEL_ID, or with MODEL_ROUTING the model
+# and model_kwargs of every stage
+cache_model_id = "{}|{}".format(modelId, routing_key(load_model_routing(MODEL_ROUTING, modelId, MODEL_FALLBACK_ID))) \
+    if MODEL_ROUTING else modelId
+# "sync" commits templates before responding to the agent, "async" queues them (see commitQueue.py)
+commit_mode = os.environ.get('COMMIT_MODE', 'sync').lower()
+if commit_mode == "async":
+    # Fail the cold start rather than answer "pending" for templates nothing will commit
+    commit_queue_settings()
+
+# Record the Bedrock, knowledge base and GitHub traffic of this container to a cassette, or replay it
+# offline (see trafficCassette.py). Installed before any client is built.
+if os.environ.get('CASSETTE_MODE', 'off').lower() != 'off':
+    from trafficCassette import install_cassette
+    install_cassette()
 
 prompt1 = """
         The following information is your only source of truth, only answer the question with the provided context, if you are unable to answer from that, tell the user Im having trouble finding an answer for you.
@@ -184,53 +215,428 @@ prompt3 = """
 
         """
 
-def rag_flow(sechub_finding, kb_id):
-    remediation_handler = RemediationHandler(modelId)
-    
-    # Invoke the llm using retrieval QA
-    response = remediation_handler.retrievalChain(prompt1, kb_id).invoke(sechub_finding)
-    LOGGER.info("Response_Chain_1: {}".format(response))
-    # Store response details into params
-    outputParams = {
+def get_cached_result(sechub_finding, kb_id):
+    """
+    Return the cache and the cached (response, resource_type) for a finding, or None on a miss.
+    """
+    # Serve repeated finding titles from the remediation cache instead of re-running the chains
+    cache = get_remediation_cache() if cache_enabled else None
+    if cache is None:
+        return None, None
+    with metrics.get_recorder().stage("cache_lookup") as stage:
+        cached = cache.get(sechub_finding, cache_model_id, kb_id)
+        stage.add("CacheHit", int(cached is not None))
+        stage.set_property("CacheOutcome", "hit" if cached is not None else "miss")
+    if cached is not None:
+        LOGGER.info("Remediation cache hit for finding: {} stats: {}".format(sechub_finding, cache.stats))
+        return cache, (cached["response"], cached["sechub_output"]["resource_type"])
+    LOGGER.info("Remediation cache miss for finding: {} stats: {}".format(sechub_finding, cache.stats))
+    return cache, None
+
+def get_control_index_output(sechub_finding):
+    """
+    Return the chain 1 output fields from the control index when the finding's control ID or title
+    matches a control with a known playbook, or None to take the RAG path.
+    """
+    control_index = get_control_index() if control_index_enabled else None
+    if control_index is None:
+        return None
+    with metrics.get_recorder().stage("control_index") as stage:
+        outputParams = control_index.get_output_params(sechub_finding)
+        stage.add("ControlIndexHit", int(outputParams is not None))
+    if outputParams is not None:
+        LOGGER.info("Control index match for finding: {}, skipping chain 1".format(sechub_finding))
+    return outputParams
+
+def get_output_params(response):
+    """
+    Store the chain 1 response details into params
+    """
+    return {
         "remediation_runbook": response.remediation_runbook,
         "remediation_details": response.remediation_details,
         "remediation_available": response.remediation_available,
         "resource_type": response.resource_type.replace(':','')
     }
+
+def get_followup_chain(remediation_handler, sechub_finding, outputParams):
+    """
+    Select chain 2 or chain 3 for the chain 1 output and build its inputs.
+    """
     # Check if remediation_available is false. If it is, invoke the second chain to create the cloudformation template
     if not outputParams["remediation_available"]:
-        response = remediation_handler.QAChain(prompt2).invoke(
-            {"sechub_finding": sechub_finding, "remediation_details": outputParams["remediation_details"]}
-        )
-        LOGGER.info("Response_Chain_2: {}".format(response))
-    else:
-        # If remediation_available is true, invoke the third chain to provide the details on the runbook
-        response = remediation_handler.QAChain(prompt3).invoke(
-            {"sechub_finding": sechub_finding, "remediation_runbook": outputParams["remediation_runbook"]}
-        )
-        LOGGER.info("Response_Chain_3: {}".format(response))
+        chain = remediation_handler.QAChain(prompt2, stage="chain_2")
+        return "Response_Chain_2", chain, {"sechub_finding": sechub_finding, "remediation_details": outputParams["remediation_details"]}
+    # If remediation_available is true, invoke the third chain to provide the details on the runbook
+    chain = remediation_handler.QAChain(prompt3, stage="chain_3")
+    return "Response_Chain_3", chain, {"sechub_finding": sechub_finding, "remediation_runbook": outputParams["remediation_runbook"]}
+
+def record_stream_metrics(stage, stream_metrics):
+    LOGGER.info("Streaming generation metrics: {}".format(stream_metrics))
+    for metric, key in (("TimeToFirstToken", "time_to_first_token"), ("TimeToTemplate", "time_to_template")):
+        if stream_metrics[key] is not None:
+            stage.add(metric, stream_metrics[key] * 1000)
+
+def rag_flow(sechub_finding, kb_id):
+    recorder = metrics.get_recorder()
+    with recorder.stage("rag_flow") as flow_stage:
+        cache, cached = get_cached_result(sechub_finding, kb_id)
+        flow_stage.set_property("CacheOutcome", "disabled" if cache is None else "hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+
+        # Chains are built once per container and reused across warm invocations
+        remediation_handler = get_remediation_handler(modelId)
+
+        # Known control playbooks are answered from the control index, anything else through retrieval QA
+        outputParams = get_control_index_output(sechub_finding)
+        if outputParams is None:
+            with recorder.stage("chain_1") as stage:
+                response = remediation_handler.retrievalChain(prompt1, kb_id).invoke(sechub_finding, config=remediation_handler.chain_config(stage))
+            LOGGER.info("Response_Chain_1: {}".format(response))
+            outputParams = get_output_params(response)
+        chain_name, chain, chain_inputs = get_followup_chain(remediation_handler, sechub_finding, outputParams)
+        with recorder.stage(chain_name.replace("Response_Chain", "chain")) as stage:
+            if streaming_generation and chain_name == "Response_Chain_2":
+                # Stream the template and stop generating at the end of the yaml code block
+                response, stream_metrics = remediation_handler.stream_yaml_generation(
+                    prompt2, chain_inputs, config=remediation_handler.chain_config(stage))
+                record_stream_metrics(stage, stream_metrics)
+            else:
+                response = chain.invoke(chain_inputs, config=remediation_handler.chain_config(stage))
+    LOGGER.info("{}: {}".format(chain_name, response))
     # return the response and the resource_type
     LOGGER.info("Final response: {}".format(response))
+    if cache is not None:
+        cache.put(sechub_finding, cache_model_id, kb_id, outputParams, response)
     return response, outputParams["resource_type"]
 
+async def arag_flow(sechub_finding, kb_id):
+    """
+    Async variant of rag_flow used by the batch path, running the chains through ainvoke. The
+    DynamoDB cache calls block, so they run in a worker thread instead of on the event loop.
+    """
+    recorder = metrics.get_recorder()
+    with recorder.stage("rag_flow") as flow_stage:
+        cache, cached = await asyncio.to_thread(get_cached_result, sechub_finding, kb_id)
+        flow_stage.set_property("CacheOutcome", "disabled" if cache is None else "hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+
+        remediation_handler = get_remediation_handler(modelId)
+        outputParams = get_control_index_output(sechub_finding)
+        if outputParams is None:
+            with recorder.stage("chain_1") as stage:
+                response = await remediation_handler.retrievalChain(prompt1, kb_id).ainvoke(sechub_finding, config=remediation_handler.chain_config(stage))
+            LOGGER.info("Response_Chain_1: {}".format(response))
+            outputParams = get_output_params(response)
+        chain_name, chain, chain_inputs = get_followup_chain(remediation_handler, sechub_finding, outputParams)
+        with recorder.stage(chain_name.replace("Response_Chain", "chain")) as stage:
+            if streaming_generation and chain_name == "Response_Chain_2":
+                response, stream_metrics = await remediation_handler.astream_yaml_generation(
+                    prompt2, chain_inputs, config=remediation_handler.chain_config(stage))
+                record_stream_metrics(stage, stream_metrics)
+            else:
+                response = await chain.ainvoke(chain_inputs, config=remediation_handler.chain_config(stage))
+    LOGGER.info("{}: {}".format(chain_name, response))
+    if cache is not None:
+        await asyncio.to_thread(cache.put, sechub_finding, cache_model_id, kb_id, outputParams, response)
+    return response, outputParams["resource_type"]
+
+async def arag_flow_batch(sechub_findings, kb_id, max_concurrency, timeout):
+    """
+    Run arag_flow for each finding with at most max_concurrency findings in flight.
+
+    Args:
+        sechub_findings (list): Distinct finding titles.
+        kb_id (str): The knowledge base id.
+        max_concurrency (int): Maximum number of findings processed concurrently.
+        timeout (float): Seconds to wait before giving up on unfinished findings.
+
+    Returns:
+        dict: finding title -> (response, resource_type), or the exception raised for that finding.
+            Findings that did not finish within timeout map to asyncio.TimeoutError.
+    """
+    if not sechub_findings:
+        # asyncio.wait rejects an empty set of tasks
+        return {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(sechub_finding):
+        async with semaphore:
+            return await arag_flow(sechub_finding, kb_id)
+
+    tasks = {asyncio.ensure_future(run_one(sechub_finding)): sechub_finding for sechub_finding in sechub_findings}
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    # Let the cancelled findings unwind before the loop closes; their worker threads are abandoned
+    await asyncio.gather(*pending, return_exceptions=True)
+    results = {}
+    for task, sechub_finding in tasks.items():
+        if task in pending:
+            results[sechub_finding] = asyncio.TimeoutError()
+        elif task.exception() is not None:
+            results[sechub_finding] = task.exception()
+        else:
+            results[sechub_finding] = task.result()
+    return results
+
+def get_batch_time_budget(context):
+    """
+    Seconds the batch may spend on the chains, keeping a reserve for commits and the agent response.
+    """
+    remaining = context.get_remaining_time_in_millis() / 1000 if context is not None else 900
+    return max(remaining - batch_time_reserve_seconds, 0)
+
+def batch_rag_flow(sechub_findings, kb_id, context):
+    """
+    Run the RAG flow for a list of findings concurrently within the Lambda time budget.
+
+    Equivalent titles are computed once. Returns (response, resource_type) or an exception per finding key.
+    """
+    distinct_findings = {}
+    for sechub_finding in sechub_findings:
+        distinct_findings.setdefault(finding_key(sechub_finding), canonical_finding_title(sechub_finding))
+
+    # A dedicated loop and executor: chain calls that overrun the budget are abandoned instead of
+    # being waited for on shutdown, so the batch always returns inside the Lambda timeout.
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=batch_max_concurrency * 2)
+    loop.set_default_executor(executor)
+    try:
+        results = loop.run_until_complete(arag_flow_batch(
+            list(distinct_findings.values()), kb_id, batch_max_concurrency, get_batch_time_budget(context)
+        ))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        loop.close()
+    return {key: results[sechub_finding] for key, sechub_finding in distinct_findings.items()}
+
+def parse_artifact(remediation_handler, sechub_finding, rag_response, resource_type):
+    """
+    Build the artifact of the yaml code block of a chain 2 response: the template and its parameters file.
+    """
+    with metrics.get_recorder().stage("yaml_parse"):
+        return build_artifact(finding_filename(sechub_finding), remediation_handler.parse_yaml_code(rag_response), resource_type)
+
+def enqueue_remediation(sechub_finding, artifact):
+    """
+    Queue an artifact for the commit queue consumer and return its artifact ID and template path.
+    """
+    with metrics.get_recorder().stage("commit_enqueue"):
+        artifact_id = get_commit_queue().enqueue(sechub_finding, artifact.template_path, artifact.template,
+                                                 artifact.resource_type,
+                                                 related_files={artifact.parameters_path: artifact.parameters})
+    return artifact_id, artifact.template_path
+
+def pending_commit_response(artifact_id, file_path):
+    return "The remediation runbook is queued for commit to {} repo. File : {} Artifact ID : {}. Get the commit with /secHubRemediationStatus/{}".format(github_repo, file_path, artifact_id, artifact_id)
+
+def commit_remediation(remediation_handler, sechub_finding, rag_response, resource_type):
+    """
+    Commit the yaml code block of a chain 2 response to the GitHub repo and describe the commit.
+    In async commit mode the template is queued instead and the response carries its artifact ID.
+    """
+    artifact = parse_artifact(remediation_handler, sechub_finding, rag_response, resource_type)
+    if commit_mode == "async":
+        return pending_commit_response(*enqueue_remediation(sechub_finding, artifact))
+    repo_name = github_owner + "/" + github_repo
+    with metrics.get_recorder().stage("github_commit") as stage:
+        github_commiter = get_github_committer(repo_name)
+        # The template and its parameters file land in the same commit
+        commit, _ = github_commiter.commit_artifacts([artifact])
+        stage.set_property("Committed", commit is not None)
+    if commit is None:
+        return "The remediation runbook in {} repo is already up to date. File : {}".format(github_repo, artifact.template_path)
+    # Return response with link to the commited file.
+    return "The remediation runbook has been committed {} repo. File : {} with commit: {}".format(github_repo, artifact.template_path, commit.sha)
+
+class BadRequestError(ValueError):
+    """
+    A request the API rejects with HTTP status 400.
+    """
+
+def get_batch_findings(event):
+    """
+    Read the list of finding titles from the request body of the batch API call.
+
+    Raises:
+        BadRequestError: sechub_findings is not a JSON array of strings. Titles may contain commas, so
+            an unquoted "[title one, title two]" cannot be split reliably and is rejected too.
+    """
+    properties = event["requestBody"]["content"]["application/json"]["properties"]
+    value = next(item for item in properties if item["name"] == "sechub_findings")["value"]
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = None
+    if not isinstance(value, list) or not all(isinstance(title, str) for title in value):
+        raise BadRequestError('sechub_findings must be a JSON array of finding titles, for example ["title one", "title two"]')
+    return value
+
+def batch_remediate(remediation_handler, event, context):
+    """
+    Handle the batch API: one result per input finding, in input order.
+    """
+    batch_response = remediate_findings(remediation_handler, get_batch_findings(event), context)
+    LOGGER.info("Batch Response: {}".format(batch_response))
+    return json.dumps(batch_response)
+
+def remediate_findings(remediation_handler, sechub_findings, context):
+    """
+    Run the remediation flow for a list of findings concurrently and commit the generated templates
+    together in a single commit.
+
+    Returns:
+        list: One result dict per finding, in input order, with its "status": "completed", "pending"
+            (queued in async commit mode), "failed" or "timed_out".
+    """
+    results = batch_rag_flow(sechub_findings, kb_id, context)
+    batch_response = []
+    # filename -> RemediationArtifact of the templates to commit
+    artifacts = {}
+    # filename -> (artifact ID, repo path) of the templates queued in async commit mode
+    pending = {}
+    for sechub_finding in sechub_findings:
+        result = results[finding_key(sechub_finding)]
+        if isinstance(result, asyncio.TimeoutError):
+            batch_response.append({"sechub_finding": sechub_finding, "status": "timed_out",
+                                   "body": "The remediation did not complete within the Lambda time budget."})
+            continue
+        if isinstance(result, Exception):
+            LOGGER.error("Remediation failed for finding {}: {}".format(sechub_finding, result))
+            batch_response.append({"sechub_finding": sechub_finding, "status": "failed", "body": str(result)})
+            continue
+        rag_response, resource_type = result
+        item = {"sechub_finding": sechub_finding, "status": "completed", "body": rag_response}
+        if "```yaml" in rag_response:
+            filename = finding_filename(sechub_finding)
+            if filename not in artifacts:
+                artifacts[filename] = parse_artifact(remediation_handler, sechub_finding, rag_response, resource_type)
+                if commit_mode == "async":
+                    pending[filename] = enqueue_remediation(sechub_finding, artifacts[filename])
+            if commit_mode == "async":
+                item["status"] = "pending"
+                item["artifact_id"] = pending[filename][0]
+                item["body"] = pending_commit_response(*pending[filename])
+            else:
+                item["template"] = filename
+        batch_response.append(item)
+
+    if artifacts and commit_mode != "async":
+        with metrics.get_recorder().stage("github_commit") as stage:
+            github_commiter = get_github_committer(github_owner + "/" + github_repo)
+            commit, _ = github_commiter.commit_artifacts(list(artifacts.values()))
+            stage.set_property("Committed", commit is not None)
+        committed = {filename: artifact.template_path for filename, artifact in artifacts.items()}
+        for item in batch_response:
+            filename = item.pop("template", None)
+            if filename is not None and commit is None:
+                item["body"] = "The remediation runbook in {} repo is already up to date. File : {}".format(github_repo, committed[filename])
+            elif filename is not None:
+                item["body"] = "The remediation runbook has been committed {} repo. File : {} with commit: {}".format(github_repo, committed[filename], commit.sha)
+    return batch_response
+
+def get_commit_status(artifact_id):
+    """
+    Describe the commit of a template queued in async commit mode.
+    """
+    status = get_commit_queue().get_status(artifact_id)
+    if status is None:
+        status = {"artifact_id": artifact_id, "status": "unknown"}
+    LOGGER.info("Commit status: {}".format(status))
+    return json.dumps(status)
+
+def commit_queue_handler(event, context):
+    """
+    Consume a batch of the SQS commit queue: commit every queued template in one commit and record
+    the commit SHA of each artifact. A failed commit fails the batch, which SQS then redelivers.
+    """
+    messages = [json.loads(record["body"]) for record in event["Records"]]
+    LOGGER.info("Committing {} queued templates".format(len(messages)))
+    recorder = metrics.start_request(ApiPath="commitQueue", ModelId=modelId)
+    try:
+        with recorder.stage("github_commit") as stage:
+            commit = get_commit_queue().process(messages, get_github_committer(github_owner + "/" + github_repo))
+            stage.set_property("Committed", commit is not None)
+            stage.set_property("QueuedTemplates", len(messages))
+    finally:
+        recorder.flush()
+    return {"commit": commit.sha if commit is not None else None, "templates": len(messages)}
+
+def finding_events_handler(event, context):
+    """
+    Consume a batch of "Security Hub Findings - Imported" events from the SQS ingestion queue: run the
+    remediation flow once per distinct control of the batch rather than once per finding, skipping
+    the controls this container remediated within INGESTION_WINDOW_SECONDS. The messages of controls
+    that failed or timed out are reported as batch item failures, which SQS then redelivers.
+    """
+    records = event["Records"]
+    recorder = metrics.start_request(ApiPath="findingEvents", ModelId=modelId)
+    try:
+        with recorder.stage("finding_ingestion") as stage:
+            windows = coalesce_finding_events(records)
+            recent = get_recent_findings()
+            due = [window for window in windows if not recent.is_recent(window.key)]
+            stage.add("IngestedEvents", len(records))
+            stage.add("IngestedFindings", sum(window.findings for window in windows))
+            stage.add("DistinctControls", len(windows))
+            stage.add("RecentControlsSkipped", len(windows) - len(due))
+            stage.add("RemediationRuns", len(due))
+        LOGGER.info("Coalesced {} findings of {} events into {} controls, {} to remediate".format(
+            sum(window.findings for window in windows), len(records), len(windows), len(due)))
+        results = remediate_findings(get_remediation_handler(modelId), [window.sechub_finding for window in due], context) if due else []
+    finally:
+        recorder.flush()
+    failures = []
+    for window, result in zip(due, results):
+        if result["status"] in ("failed", "timed_out"):
+            failures.extend({"itemIdentifier": message_id} for message_id in window.message_ids)
+        else:
+            recent.add(window.key)
+    return {"batchItemFailures": failures}
+
+def cache_invalidation_handler(event, context):
+    """
+    Invalidate the remediation cache. Invoke after the knowledge base data source has been re-synced.
+    """
+    LOGGER.info("Event: {}".format(event))
+    generation = get_remediation_cache().invalidate()
+    return {"cacheGeneration": generation}
+
 #Create a lambda function
 def lambda_handler(event, context):
     LOGGER.info("Event: {}".format(event))
-    remediation_handler = RemediationHandler(modelId)
+    recorder = metrics.start_request(ApiPath=event.get("apiPath"), ModelId=modelId)
+    try:
+        return handle_agent_request(event, context)
+    finally:
+        recorder.flush()
+
+def handle_agent_request(event, context):
+    remediation_handler = get_remediation_handler(modelId)
     action = event["actionGroup"]
     api_path = event["apiPath"]
+    status_code = 200
     if api_path == "/secHubRemediate/{sechub_finding}":
-        sechub_finding = remediation_handler.get_named_parameter(event, "sechub_finding")
+        # Account IDs, ARNs and regions are not part of the finding, the chains and the cache see the canonical title
+        sechub_finding = canonical_finding_title(remediation_handler.get_named_parameter(event, "sechub_finding"))
         rag_response, resource_type = rag_flow(sechub_finding, kb_id)
         LOGGER.info("RAG Response: {}".format(rag_response))
-    # Check if rag_response contains a yaml code block. If it does, parse the yaml code and commit it to CodeCommit repo.
-    if "```yaml" in rag_response:
-        yaml_template = remediation_handler.parse_yaml_code(rag_response)
-        repo_name = github_owner + "/" + github_repo
-        github_commiter = GitHubCommitter(repo_name)
-        commit_response, filepath = github_commiter.commit_file(sechub_finding.replace(" ", ""), yaml_template, resource_type)
-        # Return response with link to the commited file.
-        rag_response = "The remediation runbook has been committed {} repo. File : {} with commit: {}".format(github_repo, filepath, commit_response['commit'].sha)
+        # Check if rag_response contains a yaml code block. If it does, parse the yaml code and commit it to CodeCommit repo.
+        if "```yaml" in rag_response:
+            rag_response = commit_remediation(remediation_handler, sechub_finding, rag_response, resource_type)
+    elif api_path == "/secHubRemediateBatch":
+        try:
+            rag_response = batch_remediate(remediation_handler, event, context)
+        except BadRequestError as e:
+            LOGGER.info("Rejected batch request: {}".format(e))
+            status_code = 400
+            rag_response = json.dumps({"error": str(e)})
+    elif api_path == "/secHubRemediationStatus/{artifact_id}":
+        rag_response = get_commit_status(remediation_handler.get_named_parameter(event, "artifact_id"))
 
     response_body = {
         "application/json": {
@@ -241,7 +647,7 @@ def lambda_handler(event, context):
         "actionGroup": event["actionGroup"],
         "apiPath": event["apiPath"],
         "httpMethod": event["httpMethod"],
-        "httpStatusCode": 200,
+        "httpStatusCode": status_code,
         "responseBody": response_body
     }
     response = {"response": action_response}
@@ -0,0 +1,227 @@
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'BM25KB01'
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kb_index.bm25')
+# Same number of results as the knowledge base retriever configuration of RemediationHandler
+DEFAULT_NUMBER_OF_RESULTS = 4
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have if in into is it its of on or should that the their this to '
+    'was were will with'.split()
+)
+
+# uint32 arrays of the index file, in file order; texts and terms are utf-8 blobs
+UINT32_SECTIONS = ('term_offsets', 'term_postings', 'post_docs', 'post_tfs', 'doc_lengths', 'doc_sources',
+                   'doc_pages', 'text_offsets')
+
+
+def tokenize(text):
+    """
+    Split text into lower-case alphanumeric terms without stopwords.
+    """
+    return [term for term in TOKEN_PATTERN.findall(unicodedata.normalize('NFKC', text).casefold()) if term not in STOPWORDS]
+
+
+def write_index(path, chunks, k1=1.2, b=0.75):
+    """
+    Build a BM25 index over text chunks and write it to path.
+
+    The file holds a JSON header followed by flat uint32 arrays and utf-8 blobs, so Bm25Index can
+    memory-map it and search without deserializing anything.
+
+    Args:
+        path (str): The index file to write.
+        chunks (list): {"text", "source", "page"} dicts, one per retrievable passage.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+    sources = sorted({chunk['source'] for chunk in chunks})
+    postings = {}
+    doc_lengths = array('I')
+    for doc_id, chunk in enumerate(chunks):
+        terms = tokenize(chunk['text'])
+        doc_lengths.append(len(terms))
+        for term, count in Counter(terms).items():
+            postings.setdefault(term.encode('utf-8'), []).append((doc_id, count))
+
+    arrays = {name: array('I') for name in UINT32_SECTIONS}
+    terms = bytearray()
+    arrays['term_offsets'].append(0)
+    arrays['term_postings'].append(0)
+    for term in sorted(postings):
+        terms += term
+        arrays['term_offsets'].append(len(terms))
+        for doc_id, count in postings[term]:
+            arrays['post_docs'].append(doc_id)
+            arrays['post_tfs'].append(count)
+        arrays['term_postings'].append(len(arrays['post_docs']))
+    texts = bytearray()
+    arrays['text_offsets'].append(0)
+    for chunk in chunks:
+        texts += chunk['text'].encode('utf-8')
+        arrays['text_offsets'].append(len(texts))
+        arrays['doc_sources'].append(sources.index(chunk['source']))
+        arrays['doc_pages'].append(chunk.get('page') or 0)
+    arrays['doc_lengths'] = doc_lengths
+
+    blobs = [(name, arrays[name].tobytes()) for name in UINT32_SECTIONS] + [('terms', bytes(terms)), ('texts', bytes(texts))]
+    header = {
+        'k1': k1,
+        'b': b,
+        'doc_count': len(chunks),
+        'avg_doc_length': sum(doc_lengths) / max(len(chunks), 1),
+        'sources': sources,
+        'sections': {},
+    }
+    # Section offsets are relative to the 8-byte aligned end of the header
+    offset = 0
+    for name, blob in blobs:
+        header['sections'][name] = [offset, len(blob)]
+        offset += len(blob) + (-len(blob) % 8)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = len(MAGIC) + 4 + len(header_bytes)
+    data_start += -data_start % 8
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        f.write(b'\0' * (data_start - f.tell()))
+        for _, blob in blobs:
+            f.write(blob + b'\0' * (-len(blob) % 8))
+
+
+class Bm25Index:
+    """
+    Read-only BM25 index over a memory-mapped file written by write_index.
+
+    Opening the index only parses the JSON header; terms, postings and texts are paged in by the
+    operating system as searches touch them.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a BM25 index file".format(path))
+        header_length = struct.unpack_from('<I', self._mmap, len(MAGIC))[0]
+        header_end = len(MAGIC) + 4 + header_length
+        header = json.loads(self._mmap[len(MAGIC) + 4:header_end])
+        data_start = header_end + (-header_end % 8)
+        view = memoryview(self._mmap)
+        sections = {
+            name: view[data_start + offset:data_start + offset + length]
+            for name, (offset, length) in header['sections'].items()
+        }
+        for name in UINT32_SECTIONS:
+            setattr(self, name, sections[name].cast('I'))
+        self.terms = sections['terms']
+        self.texts = sections['texts']
+        self.k1 = header['k1']
+        self.b = header['b']
+        self.doc_count = header['doc_count']
+        self.avg_doc_length = header['avg_doc_length'] or 1.0
+        self.sources = header['sources']
+        self.term_count = len(self.term_offsets) - 1
+
+    def _term_id(self, term):
+        """
+        Binary search the sorted term blob for a term.
+        """
+        low, high = 0, self.term_count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = self.terms[self.term_offsets[middle]:self.term_offsets[middle + 1]].tobytes()
+            if candidate == term:
+                return middle
+            if candidate < term:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def search(self, query, k=DEFAULT_NUMBER_OF_RESULTS):
+        """
+        Return the k best matching chunks for a query.
+
+        Returns:
+            list: (score, chunk id) tuples, best first.
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term.encode('utf-8'))
+            if term_id is None:
+                continue
+            start, end = self.term_postings[term_id], self.term_postings[term_id + 1]
+            document_frequency = end - start
+            idf = math.log(1 + (self.doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for position in range(start, end):
+                doc_id = self.post_docs[position]
+                tf = self.post_tfs[position]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, ((score, doc_id) for doc_id, score in scores.items()))
+
+    def chunk(self, doc_id):
+        """
+        Return the {"text", "source", "page"} of a chunk.
+        """
+        text = self.texts[self.text_offsets[doc_id]:self.text_offsets[doc_id + 1]].tobytes().decode('utf-8')
+        return {'text': text, 'source': self.sources[self.doc_sources[doc_id]], 'page': self.doc_pages[doc_id]}
+
+
+class LocalKnowledgeBaseClient:
+    """
+    Stand-in for the bedrock-agent-runtime client that answers Retrieve calls from a local Bm25Index.
+
+    Both engines only call retrieve() on the knowledge base client, so it can be passed wherever the
+    boto3 client is used, including as the client of LangChain's AmazonKnowledgeBasesRetriever.
+    """
+
+    def __init__(self, bm25_index):
+        self.index = bm25_index
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId=None, retrievalConfiguration=None, **kwargs):
+        vector_search = (retrievalConfiguration or {}).get('vectorSearchConfiguration') or {}
+        k = vector_search.get('numberOfResults', DEFAULT_NUMBER_OF_RESULTS)
+        results = []
+        for score, doc_id in self.index.search(retrievalQuery['text'], k):
+            chunk = self.index.chunk(doc_id)
+            uri = '{}#page={}'.format(chunk['source'], chunk['page'])
+            results.append({
+                'content': {'text': chunk['text']},
+                'location': {'type': 'CUSTOM', 'customDocumentLocation': {'id': uri}},
+                'score': score,
+                'metadata': {'x-amz-bedrock-kb-source-uri': uri},
+            })
+        return {'retrievalResults': results}
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_local_knowledge_base_client():
+    """
+    Get the process-level LocalKnowledgeBaseClient over the index file in LOCAL_INDEX_PATH
+    (kb_index.bm25 next to this module by default).
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                path = os.environ.get('LOCAL_INDEX_PATH', DEFAULT_INDEX_PATH)
+                LOGGER.info("Opening local BM25 index %s", path)
+                _CLIENT = LocalKnowledgeBaseClient(Bm25Index(path))
+    return _CLIENT
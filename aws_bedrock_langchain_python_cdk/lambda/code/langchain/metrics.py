@@ -0,0 +1,221 @@
+import contextvars
+import json
+import os
+import sys
+import time
+
+# Metric name -> CloudWatch unit for everything a stage can record
+METRIC_UNITS = {
+    "Duration": "Milliseconds",
+    "InputTokens": "Count",
+    "OutputTokens": "Count",
+    "RetrievedDocuments": "Count",
+    "CacheHit": "Count",
+    "ControlIndexHit": "Count",
+    "TimeToFirstToken": "Milliseconds",
+    "TimeToTemplate": "Milliseconds",
+    "RateLimitWait": "Milliseconds",
+    "Retries": "Count",
+    "Throttles": "Count",
+    "ConcurrencyLimit": "Count",
+    "InFlight": "Count",
+    "ModelFallbacks": "Count",
+    "ContextTokensIn": "Count",
+    "ContextTokensOut": "Count",
+    "ContextTokensSaved": "Count",
+    "RetrievalEscalations": "Count",
+    "FirstPassEscalations": "Count",
+    "ExtraRetrieveCalls": "Count",
+    "ExtraChain1Calls": "Count",
+    "ExtraContextTokens": "Count",
+    "Chain2CallsAvoided": "Count",
+    "IngestedEvents": "Count",
+    "IngestedFindings": "Count",
+    "DistinctControls": "Count",
+    "RecentControlsSkipped": "Count",
+    "RemediationRuns": "Count",
+}
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SecHubRemediation')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+
+class StageRecord:
+    """
+    Metrics and properties recorded for one execution of a stage.
+    """
+
+    def __init__(self, name, properties, recorder=None):
+        self.name = name
+        self.recorder = recorder
+        self.values = {}
+        self.properties = properties
+        self._config = None
+
+    def add(self, metric, value):
+        """
+        Add value to a metric of this stage, e.g. the tokens of each LLM call in a chain.
+        """
+        self.values[metric] = self.values.get(metric, 0) + value
+
+    def set_property(self, key, value):
+        self.properties[key] = value
+
+    @property
+    def config(self):
+        """
+        LangChain RunnableConfig whose callbacks record token usage and retrieved documents on this stage.
+        """
+        if self._config is None:
+            self._config = {"callbacks": [_stage_callback_handler()(self)]}
+        return self._config
+
+
+class MetricsRecorder:
+    """
+    Collects stage records for one invocation and writes them as CloudWatch Embedded Metric Format log lines.
+    """
+
+    def __init__(self, namespace=METRICS_NAMESPACE, properties=None, stream=None):
+        self.namespace = namespace
+        self.properties = properties or {}
+        self.stream = stream
+        self.records = []
+
+    def stage(self, name, **properties):
+        return _StageContext(self, StageRecord(name, properties, recorder=self))
+
+    def to_emf(self, record):
+        metrics = [{"Name": metric, "Unit": METRIC_UNITS.get(metric, "None")} for metric in record.values]
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Stage"]],
+                    "Metrics": metrics,
+                }],
+            },
+            "Stage": record.name,
+        }
+        document.update(self.properties)
+        document.update(record.properties)
+        document.update(record.values)
+        return document
+
+    def flush(self):
+        """
+        Write one EMF line per recorded stage to stdout, where Lambda forwards it to CloudWatch Logs.
+        """
+        stream = self.stream or sys.stdout
+        records, self.records = self.records, []
+        for record in records:
+            stream.write(json.dumps(self.to_emf(record), default=str) + "\n")
+        stream.flush()
+
+
+class _StageContext:
+    def __init__(self, recorder, record):
+        self.recorder = recorder
+        self.record = record
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record.values["Duration"] = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.record.properties["Error"] = exc_type.__name__
+        self.recorder.records.append(self.record)
+        return False
+
+
+class _NullStage:
+    """
+    Stage handed out when metrics are disabled: records nothing and adds no callbacks.
+    """
+    config = None
+
+    def add(self, metric, value):
+        pass
+
+    def set_property(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NullRecorder:
+    """
+    Recorder used when metrics are disabled. Every call is a no-op on shared singletons.
+    """
+    _stage = _NullStage()
+
+    def stage(self, name, **properties):
+        return self._stage
+
+    def flush(self):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+_CURRENT = contextvars.ContextVar("metrics_recorder", default=NULL_RECORDER)
+
+
+def start_request(**properties):
+    """
+    Start recording metrics for an invocation and make the recorder current for this context.
+    """
+    recorder = MetricsRecorder(properties=properties) if METRICS_ENABLED else NULL_RECORDER
+    _CURRENT.set(recorder)
+    return recorder
+
+
+def get_recorder():
+    """
+    Get the recorder of the current invocation, a NullRecorder when none was started.
+    """
+    return _CURRENT.get()
+
+
+_CALLBACK_HANDLER_CLASS = None
+
+
+def _stage_callback_handler():
+    """
+    Build the LangChain callback handler class on first use, so that disabled metrics never import LangChain.
+    """
+    global _CALLBACK_HANDLER_CLASS
+    if _CALLBACK_HANDLER_CLASS is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class StageCallbackHandler(BaseCallbackHandler):
+            def __init__(self, record):
+                self.record = record
+                self.retriever_starts = {}
+
+            def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+                self.retriever_starts[run_id] = time.perf_counter()
+
+            def on_llm_end(self, response, **kwargs):
+                usage = (response.llm_output or {}).get("usage") or {}
+                self.record.add("InputTokens", usage.get("prompt_tokens", 0))
+                self.record.add("OutputTokens", usage.get("completion_tokens", 0))
+
+            def on_retriever_end(self, documents, *, run_id, **kwargs):
+                self.record.add("RetrievedDocuments", len(documents))
+                start = self.retriever_starts.pop(run_id, None)
+                if start is not None and self.record.recorder is not None:
+                    # Knowledge base retrieval runs inside chain 1, report it as its own stage as well
+                    retrieval = StageRecord("kb_retrieval", dict(self.record.properties))
+                    retrieval.values["Duration"] = (time.perf_counter() - start) * 1000
+                    retrieval.values["RetrievedDocuments"] = len(documents)
+                    self.record.recorder.records.append(retrieval)
+
+        _CALLBACK_HANDLER_CLASS = StageCallbackHandler
+    return _CALLBACK_HANDLER_CLASS
@@ -0,0 +1,104 @@
+import json
+import logging
+from collections import namedtuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import metrics
+from rateGovernor import CircuitOpenError, RateGovernorTimeout
+
+LOGGER = logging.getLogger(__name__)
+
+# Stages of rag_flow that call a model: chain 1 maps the finding to a runbook, chain 2 writes the
+# CloudFormation template, chain 3 describes the runbook
+MODEL_STAGES = ('chain_1', 'chain_2', 'chain_3')
+
+# Inference parameters of every stage that does not set its own (Anthropic messages API names)
+DEFAULT_MODEL_KWARGS = {"max_tokens": 4096, "temperature": 0, "top_p": 0.99}
+
+# model_kwargs name -> Converse inferenceConfig name
+CONVERSE_INFERENCE_PARAMETERS = {
+    "max_tokens": "maxTokens",
+    "temperature": "temperature",
+    "top_p": "topP",
+    "stop_sequences": "stopSequences",
+}
+
+# Errors of the primary model that send a call to the fallback model: throttling and service errors
+# (after the governor's retries), timeouts, and an open circuit breaker
+FALLBACK_ERRORS = (ClientError, BotoCoreError, CircuitOpenError, RateGovernorTimeout)
+
+# Attempts on the primary model of a stage with a fallback: fall back instead of backing off for long
+PRIMARY_MAX_ATTEMPTS = 2
+
+ModelRoute = namedtuple('ModelRoute', ['model_id', 'model_kwargs', 'fallback_model_id', 'latency_budget_seconds'])
+ModelRoute.__doc__ = """
+Model used by one stage.
+
+Args:
+    model_id (str): The Bedrock model id.
+    model_kwargs (dict): Inference parameters, e.g. {"max_tokens": 1024, "temperature": 0}.
+    fallback_model_id (str): Model called when the primary model is throttled, failing or too slow, or None.
+    latency_budget_seconds (float): How long to wait for the primary model before falling back, or None
+        for the default read timeout.
+"""
+
+
+def load_model_routing(routing, model_id, fallback_model_id=None):
+    """
+    Build the model route of every stage.
+
+    Args:
+        routing (str or dict): JSON object (or dict) of stage name -> {"model_id", "model_kwargs",
+            "fallback_model_id", "latency_budget_seconds"}, all optional. Stages that are not listed,
+            and missing keys, take the defaults.
+        model_id (str): The default model id, MODEL_ID.
+        fallback_model_id (str): The default fallback model id, or None for no fallback.
+
+    Returns:
+        dict: Stage name -> ModelRoute, for every stage in MODEL_STAGES.
+    """
+    if isinstance(routing, str):
+        routing = json.loads(routing) if routing.strip() else {}
+    routing = routing or {}
+    unknown = set(routing) - set(MODEL_STAGES)
+    if unknown:
+        raise ValueError("Unknown model routing stages {}, expected {}".format(sorted(unknown), MODEL_STAGES))
+    routes = {}
+    for stage in MODEL_STAGES:
+        config = routing.get(stage) or {}
+        model_kwargs = dict(DEFAULT_MODEL_KWARGS)
+        model_kwargs.update(config.get("model_kwargs") or {})
+        budget = config.get("latency_budget_seconds")
+        routes[stage] = ModelRoute(
+            model_id=config.get("model_id") or model_id,
+            model_kwargs=model_kwargs,
+            fallback_model_id=config.get("fallback_model_id", fallback_model_id) or None,
+            latency_budget_seconds=float(budget) if budget else None,
+        )
+    return routes
+
+
+def routing_key(routes):
+    """
+    Describe the routes as a string, e.g. to keep cache entries of different routings apart.
+    """
+    return json.dumps({stage: [route.model_id, route.model_kwargs] for stage, route in sorted(routes.items())},
+                      sort_keys=True)
+
+
+def converse_inference_config(model_kwargs):
+    """
+    Translate model_kwargs to a Converse inferenceConfig, dropping parameters Converse does not have.
+    """
+    return {CONVERSE_INFERENCE_PARAMETERS[name]: value for name, value in model_kwargs.items()
+            if name in CONVERSE_INFERENCE_PARAMETERS}
+
+
+def record_fallback(stage, route):
+    """
+    Record on the current metrics recorder that a call of a stage went to its fallback model.
+    """
+    LOGGER.warning("%s falling back from %s to %s", stage, route.model_id, route.fallback_model_id)
+    with metrics.get_recorder().stage("model_fallback", RouteStage=stage, ModelId=route.fallback_model_id) as record:
+        record.add("ModelFallbacks", 1)
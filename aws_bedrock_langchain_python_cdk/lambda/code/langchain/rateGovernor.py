@@ -0,0 +1,382 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import (ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+                                 ReadTimeoutError)
+
+import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# Error codes that mean "slow down": they shrink the concurrency limit as well as being retried
+THROTTLING_ERROR_CODES = frozenset(['ThrottlingException', 'TooManyRequestsException'])
+# Error codes worth retrying without backing off the concurrency limit
+TRANSIENT_ERROR_CODES = frozenset(['ServiceUnavailableException', 'InternalServerException',
+                                   'ModelNotReadyException', 'ModelTimeoutException'])
+CONNECTION_ERRORS = (ConnectTimeoutError, ReadTimeoutError, EndpointConnectionError, ConnectionClosedError)
+
+# Operations of the bedrock-runtime and bedrock-agent-runtime clients that go through the governor
+GOVERNED_OPERATIONS = frozenset(['invoke_model', 'invoke_model_with_response_stream', 'converse', 'converse_stream',
+                                 'retrieve', 'retrieve_and_generate'])
+# Streaming operations -> the response key of their event stream, which holds the concurrency slot
+# of the call until it has been read to the end or closed
+STREAMING_OPERATIONS = {'invoke_model_with_response_stream': 'body', 'converse_stream': 'stream'}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the service while the circuit breaker of a governor is open.
+    """
+
+
+class RateGovernorTimeout(Exception):
+    """
+    Raised when a call could not get a request token or a concurrency slot before its deadline.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second, holding at most burst tokens.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """
+        Take a token, waiting for the refill until the monotonic deadline.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - start
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise RateGovernorTimeout("No request token before the deadline")
+            time.sleep(wait)
+
+
+class GovernedStream:
+    """
+    Event stream of a streaming call that gives the call's concurrency slot back once it has been read
+    to the end, closed, or dropped.
+
+    Args:
+        stream: The botocore EventStream.
+        release (callable): Gives the slot back, called once.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            for event in self._stream:
+                yield event
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self.release()
+
+    def __del__(self):
+        self.release()
+
+
+class RateGovernor:
+    """
+    Client-side rate limiting, adaptive concurrency, retries and circuit breaking for one AWS service.
+
+    Every call takes a token from a token bucket and a slot under the concurrency limit. The limit
+    follows AIMD: it grows by 1/limit on every success and halves on every throttling error. Throttling,
+    transient and connection errors are retried with full-jitter exponential backoff until max_attempts
+    or the deadline. After breaker_threshold consecutive failed calls the breaker opens and calls fail
+    fast for breaker_reset_seconds, after which a single trial call decides whether it closes again.
+
+    Args:
+        name (str): Name reported in the metrics, e.g. the service name.
+        rate (float): Sustained requests per second.
+        burst (int): Requests that may be sent at once after an idle period.
+        max_concurrency (int): Upper bound, and starting value, of the concurrency limit.
+        max_attempts (int): Attempts per call, including the first one.
+        deadline_seconds (float): Time budget per call, including waits and retries.
+        base_delay (float): Backoff of the first retry, doubled for every further retry.
+        max_delay (float): Upper bound of a single backoff.
+        breaker_threshold (int): Consecutive failed calls that open the circuit breaker.
+        breaker_reset_seconds (float): How long the breaker stays open.
+    """
+
+    def __init__(self, name, rate=10.0, burst=20, max_concurrency=8, max_attempts=6, deadline_seconds=300.0,
+                 base_delay=0.5, max_delay=20.0, breaker_threshold=5, breaker_reset_seconds=30.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.max_attempts = max_attempts
+        self.deadline_seconds = deadline_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.stats = {'calls': 0, 'retries': 0, 'throttles': 0, 'failures': 0, 'rejected': 0}
+        self._slots = threading.Condition()
+        self._random = random.Random()
+
+    def state(self):
+        """
+        Return the limiter state: concurrency limit, calls in flight and circuit breaker state.
+        """
+        with self._slots:
+            if self.opened_at is None:
+                breaker = 'closed'
+            elif time.monotonic() - self.opened_at < self.breaker_reset_seconds:
+                breaker = 'open'
+            else:
+                breaker = 'half_open'
+            return {'limit': round(self.limit, 2), 'in_flight': self.in_flight, 'breaker': breaker}
+
+    def _before_call(self):
+        """
+        Fail fast while the breaker is open; once it has been open long enough let one trial call through.
+        """
+        with self._slots:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.breaker_reset_seconds or self.trial_in_flight:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError("{} circuit breaker is open".format(self.name))
+            self.trial_in_flight = True
+
+    def _acquire_slot(self, deadline):
+        with self._slots:
+            while self.in_flight >= max(int(self.limit), 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateGovernorTimeout("No concurrency slot before the deadline")
+                self._slots.wait(remaining)
+            self.in_flight += 1
+
+    def _release_slot(self, outcome):
+        with self._slots:
+            self.in_flight -= 1
+            if outcome == 'throttle':
+                self.limit = max(self.limit / 2, 1.0)
+            elif outcome == 'success':
+                self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+            self._slots.notify_all()
+
+    def _count(self, stat):
+        # Governors are shared by the threads of a container, the stats are only updated under the lock
+        with self._slots:
+            self.stats[stat] += 1
+
+    def _after_call(self, succeeded):
+        with self._slots:
+            self.trial_in_flight = False
+            if succeeded:
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.opened_at is not None or self.consecutive_failures >= self.breaker_threshold:
+                LOGGER.warning("%s circuit breaker opened after %s consecutive failures",
+                               self.name, self.consecutive_failures)
+                self.opened_at = time.monotonic()
+
+    def classify(self, error):
+        """
+        Return "throttle", "transient" or None for an error raised by a call.
+        """
+        if isinstance(error, ClientError):
+            code = error.response.get('Error', {}).get('Code')
+            if code in THROTTLING_ERROR_CODES:
+                return 'throttle'
+            if code in TRANSIENT_ERROR_CODES:
+                return 'transient'
+            return None
+        if isinstance(error, CONNECTION_ERRORS):
+            return 'transient'
+        return None
+
+    def backoff(self, attempt):
+        """
+        Full-jitter backoff before retry number attempt (1 for the first retry).
+        """
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, operation, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs) under the governor and record the outcome on the current metrics recorder.
+        """
+        return self.call_with_policy(operation, function, args, kwargs)
+
+    def call_with_policy(self, operation, function, args, kwargs, max_attempts=None, deadline_seconds=None):
+        """
+        Like call, with the attempts and deadline of this call overriding those of the governor.
+
+        The event stream of a streaming operation (see STREAMING_OPERATIONS) is returned as a
+        GovernedStream holding the concurrency slot of the call until it has been consumed.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        deadline_seconds = deadline_seconds or self.deadline_seconds
+        stream_key = STREAMING_OPERATIONS.get(operation)
+        with metrics.get_recorder().stage("rate_governor", Client=self.name, Operation=operation) as stage:
+            try:
+                return self._call(stage, function, args, kwargs, max_attempts, deadline_seconds, stream_key)
+            finally:
+                state = self.state()
+                stage.add("ConcurrencyLimit", state['limit'])
+                stage.add("InFlight", state['in_flight'])
+                stage.set_property("Breaker", state['breaker'])
+
+    def _call(self, stage, function, args, kwargs, max_attempts, deadline_seconds, stream_key=None):
+        self._before_call()
+        deadline = time.monotonic() + deadline_seconds
+        self._count('calls')
+        try:
+            result = self._attempt(stage, function, args, kwargs, max_attempts, deadline, stream_key)
+        except Exception as e:
+            # Errors the service answered with (e.g. ValidationException) say nothing about its health
+            self._after_call(self.classify(e) is None and not isinstance(e, RateGovernorTimeout))
+            raise
+        self._after_call(True)
+        return result
+
+    def _attempt(self, stage, function, args, kwargs, max_attempts, deadline, stream_key=None):
+        attempt = 0
+        while True:
+            attempt += 1
+            stage.add("RateLimitWait", self.bucket.acquire(deadline) * 1000)
+            self._acquire_slot(deadline)
+            outcome = 'error'
+            try:
+                result = function(*args, **kwargs)
+                if stream_key is not None and result.get(stream_key) is not None:
+                    result[stream_key] = GovernedStream(result[stream_key], lambda: self._release_slot('success'))
+                    # The stream gives the slot back
+                    outcome = None
+                    return result
+                outcome = 'success'
+                return result
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    raise
+                outcome = kind
+                if kind == 'throttle':
+                    self._count('throttles')
+                    stage.add("Throttles", 1)
+                delay = self.backoff(attempt)
+                if attempt >= max_attempts or time.monotonic() + delay >= deadline:
+                    LOGGER.warning("%s giving up after %s attempts: %s", self.name, attempt, e)
+                    raise
+                LOGGER.info("%s retrying in %.2fs after attempt %s: %s", self.name, delay, attempt, e)
+                self._count('retries')
+                stage.add("Retries", 1)
+            finally:
+                if outcome is not None:
+                    self._release_slot(outcome)
+            time.sleep(delay)
+
+
+class GovernedClient:
+    """
+    Proxy of a boto3 client whose model invocation and retrieval operations go through a RateGovernor.
+
+    Every other attribute is the client's own, so the proxy can be passed to LangChain wherever the
+    boto3 client is expected. Streaming operations hold their concurrency slot until their event
+    stream has been read or closed.
+
+    Args:
+        client: The boto3 client.
+        governor (RateGovernor): The governor of the client's service.
+        max_attempts (int): Attempts per call through this client, instead of the governor's.
+        deadline_seconds (float): Time budget per call through this client, instead of the governor's.
+    """
+
+    def __init__(self, client, governor, max_attempts=None, deadline_seconds=None):
+        self.client = client
+        self.governor = governor
+        self.max_attempts = max_attempts
+        self.deadline_seconds = deadline_seconds
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name not in GOVERNED_OPERATIONS:
+            return attribute
+
+        def governed(*args, **kwargs):
+            return self.governor.call_with_policy(name, attribute, args, kwargs, self.max_attempts, self.deadline_seconds)
+        return governed
+
+
+_GOVERNORS = {}
+_GOVERNORS_LOCK = threading.Lock()
+
+
+def get_rate_governor(name):
+    """
+    Get the process-level RateGovernor of a service, shared by every handler and client of this container.
+
+    Limits are read from the environment: BEDROCK_RATE_PER_SECOND, BEDROCK_BURST, BEDROCK_MAX_CONCURRENCY,
+    BEDROCK_MAX_ATTEMPTS, BEDROCK_RETRY_BASE_DELAY_SECONDS, BEDROCK_RETRY_DEADLINE_SECONDS,
+    BEDROCK_BREAKER_THRESHOLD and BEDROCK_BREAKER_RESET_SECONDS.
+    """
+    with _GOVERNORS_LOCK:
+        governor = _GOVERNORS.get(name)
+        if governor is None:
+            governor = RateGovernor(
+                name,
+                rate=float(os.environ.get('BEDROCK_RATE_PER_SECOND', '10')),
+                burst=int(os.environ.get('BEDROCK_BURST', '20')),
+                max_concurrency=int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '8')),
+                max_attempts=int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '6')),
+                deadline_seconds=float(os.environ.get('BEDROCK_RETRY_DEADLINE_SECONDS', '300')),
+                base_delay=float(os.environ.get('BEDROCK_RETRY_BASE_DELAY_SECONDS', '0.5')),
+                breaker_threshold=int(os.environ.get('BEDROCK_BREAKER_THRESHOLD', '5')),
+                breaker_reset_seconds=float(os.environ.get('BEDROCK_BREAKER_RESET_SECONDS', '30')),
+            )
+            _GOVERNORS[name] = governor
+    return governor
+
+
+def clear_rate_governors():
+    """
+    Drop every RateGovernor, e.g. between tests.
+    """
+    with _GOVERNORS_LOCK:
+        _GOVERNORS.clear()
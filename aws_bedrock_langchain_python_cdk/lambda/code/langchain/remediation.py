@@ -1,30 +1,163 @@
 import os
-import tempfile
+import threading
+import time
 import boto3
 import logging
+from rateGovernor import GovernedClient, get_rate_governor
+from modelRouting import (DEFAULT_MODEL_KWARGS, FALLBACK_ERRORS, PRIMARY_MAX_ATTEMPTS, ModelRoute, load_model_routing,
+                          record_fallback)
 import warnings
-from langchain_community.chat_models import BedrockChat
-from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
 
+# LangChain and pydantic are imported where the chains are built, not here: they are the bulk of
+# the package import time and requests served from the remediation cache never need them.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
-from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser
-from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
-from pydantic import BaseModel, Field
-
 
 # Supress warnings
 warnings.filterwarnings("ignore")
 
 LOGGER = logging.getLogger(__name__)
 
-class RemediationHandler:
+# Engine used to run the chains: "langchain" (LangChain + BedrockChat) or "converse" (direct
+# bedrock-runtime Converse and bedrock-agent-runtime Retrieve calls, see converseEngine.py)
+REMEDIATION_ENGINE = os.environ.get('REMEDIATION_ENGINE', 'langchain').lower()
+REMEDIATION_ENGINES = ('langchain', 'converse')
+
+# Knowledge base used for chain 1 retrieval: "knowledge_base" (the Bedrock knowledge base KB_ID) or
+# "local" (the BM25 index bundled with the Lambda code, see localRetriever.py)
+RETRIEVER = os.environ.get('RETRIEVER', 'knowledge_base').lower()
+RETRIEVERS = ('knowledge_base', 'local')
+
+# "true" reduces the retrieved passages to the spans about the finding before they are rendered into
+# prompt 1 (see contextCompression.py). Off by default: it saves tokens but can drop the passage naming
+# the runbook.
+CONTEXT_COMPRESSION = os.environ.get('CONTEXT_COMPRESSION', 'false').lower() == 'true'
+
+# Retrieval depth of chain 1: "fixed" (4 results per finding) or "adaptive" (RETRIEVAL_MIN_K results,
+# escalating to RETRIEVAL_MAX_K and a re-query on low confidence, see adaptiveRetrieval.py)
+RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'fixed').lower()
+RETRIEVAL_MODES = ('fixed', 'adaptive')
+
+# A hung connection fails the attempt instead of holding the invocation until the Lambda timeout. The
+# read timeout bounds the wait for a whole (non-streaming) model response.
+BEDROCK_CONNECT_TIMEOUT_SECONDS = int(os.environ.get('BEDROCK_CONNECT_TIMEOUT_SECONDS', '10'))
+BEDROCK_READ_TIMEOUT_SECONDS = int(os.environ.get('BEDROCK_READ_TIMEOUT_SECONDS', '120'))
+
+# Per-stage model routing: a JSON object of stage ("chain_1", "chain_2", "chain_3") -> {"model_id",
+# "model_kwargs", "fallback_model_id", "latency_budget_seconds"}, see modelRouting.py. Stages that are
+# not listed use MODEL_ID, and MODEL_FALLBACK_ID when the primary model is throttled, failing or slow.
+MODEL_ROUTING = os.environ.get('MODEL_ROUTING', '')
+MODEL_FALLBACK_ID = os.environ.get('MODEL_FALLBACK_ID') or None
+
+# BedrockChat re-raises every error of the service as a ValueError
+LANGCHAIN_FALLBACK_ERRORS = FALLBACK_ERRORS + (ValueError,)
+
+# Process-level registry of RemediationHandler instances, keyed by (engine, modelId, region).
+# Lambda reuses the execution environment between warm invocations, so the boto3 clients,
+# LLM and chains built by a handler are shared by every request served by this container.
+_HANDLER_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def model_governor_name(model_id):
     """
-    This class encapsulates the functionality of identifying and handling remediation for Security Hub findings.
-    It provides methods for retrieving LLM, analyzing findings, generating remediation instructions,
-    and committing remediation code to a CodeCommit repository.
+    Name of the rate governor of a model with its own limits: the primary and fallback models of routed
+    stages, whose Bedrock quotas are independent.
+    """
+    return "bedrock-runtime/" + model_id
+
+
+def get_handler_class(engine):
+    """
+    Get the RemediationHandler class implementing an engine.
+    """
+    if engine == 'langchain':
+        return RemediationHandler
+    if engine == 'converse':
+        from converseEngine import ConverseRemediationHandler
+        return ConverseRemediationHandler
+    raise ValueError("Unknown remediation engine {}, expected one of {}".format(engine, REMEDIATION_ENGINES))
+
+
+def get_remediation_handler(modelId, region=None, engine=None):
+    """
+    Get the RemediationHandler for the given model and region, building it on first use.
+
+    Args:
+        modelId (str): The Bedrock model id used by the chains.
+        region (str): The AWS region of the Bedrock clients. Defaults to AWS_DEFAULT_REGION.
+        engine (str): "langchain" or "converse". Defaults to the REMEDIATION_ENGINE environment variable.
+
+    Returns:
+        BaseRemediationHandler: The handler of the engine, shared by all invocations in this container.
+    """
+    region = region or os.environ['AWS_DEFAULT_REGION']
+    engine = engine or REMEDIATION_ENGINE
+    key = (engine, modelId, region)
+    handler = _HANDLER_REGISTRY.get(key)
+    if handler is None:
+        with _REGISTRY_LOCK:
+            handler = _HANDLER_REGISTRY.get(key)
+            if handler is None:
+                LOGGER.info("Building %s RemediationHandler for model %s in %s", engine, modelId, region)
+                handler = get_handler_class(engine)(modelId, region=region)
+                _HANDLER_REGISTRY[key] = handler
+    return handler
+
+
+def clear_remediation_handlers():
+    """
+    Drop every cached RemediationHandler so the next request rebuilds clients and chains.
+    """
+    with _REGISTRY_LOCK:
+        _HANDLER_REGISTRY.clear()
+
+
+class YamlTemplateStream:
+    """
+    Accumulates streamed model output and detects when the ```yaml code block has been closed.
+    """
+    OPEN_FENCE = "```yaml"
+    CLOSE_FENCE = "```"
+
+    def __init__(self):
+        self.text = ""
+        self.yaml_start = None
+        self.complete = False
+
+    def feed(self, token):
+        """
+        Append a streamed token.
+
+        Returns:
+            bool: True once the closing fence of the yaml code block has been received.
+        """
+        # Fences can be split across tokens, so search from just before the new token
+        search_from = max(len(self.text) - len(self.OPEN_FENCE), 0)
+        self.text += token
+        if self.yaml_start is None:
+            index = self.text.find(self.OPEN_FENCE, search_from)
+            if index == -1:
+                return False
+            self.yaml_start = index + len(self.OPEN_FENCE)
+            search_from = self.yaml_start
+        index = self.text.find(self.CLOSE_FENCE, max(search_from, self.yaml_start))
+        if index != -1:
+            # Drop anything the model wrote after the closing fence
+            self.text = self.text[:index + len(self.CLOSE_FENCE)]
+            self.complete = True
+        return self.complete
+
+
+class BaseRemediationHandler:
+    """
+    This class encapsulates the functionality of identifying and handling remediation for Security Hub findings
+    that does not depend on the remediation engine: the Bedrock clients and model routes, the chain cache, and
+    parsing of the generated templates and agent parameters.
+
+    An engine subclass builds the chains: answerChain, _build_retrieval_chain and QAChain, chain_config,
+    and stream_yaml_generation and astream_yaml_generation.
     """
 
     def __init__(self, modelId, region=os.environ['AWS_DEFAULT_REGION']):
@@ -32,29 +165,120 @@ class RemediationHandler:
         Initialize the RemediationHandler instance with necessary AWS clients and configurations.
         """
         self.modelId = modelId
+        self.region = region
+        self.routes = load_model_routing(MODEL_ROUTING, modelId, MODEL_FALLBACK_ID)
+        self.context_compression = CONTEXT_COMPRESSION
+        self.retrieval_mode = RETRIEVAL_MODE
         self.s3_client = boto3.client("s3", region_name=region)
-        boto_config = boto3.session.Config(connect_timeout=900, read_timeout=900, retries={"max_attempts": 0})
-        self.bedrock_runtime = boto3.client(service_name="bedrock-runtime", config=boto_config, region_name=region)
-        self.bedrock_client = boto3.client(service_name="bedrock-agent-runtime", config=boto_config, region_name=region)
+        # Retries are left to the rate governors shared by every handler of the container (see rateGovernor.py)
+        self.boto_config = boto3.session.Config(connect_timeout=BEDROCK_CONNECT_TIMEOUT_SECONDS,
+                                                read_timeout=BEDROCK_READ_TIMEOUT_SECONDS, retries={"max_attempts": 0})
+        self.bedrock_runtime = GovernedClient(
+            boto3.client(service_name="bedrock-runtime", config=self.boto_config, region_name=region),
+            get_rate_governor("bedrock-runtime"))
+        self.bedrock_client = GovernedClient(
+            boto3.client(service_name="bedrock-agent-runtime", config=self.boto_config, region_name=region),
+            get_rate_governor("bedrock-agent-runtime"))
+        # Built lazily and reused: the model clients of each route, and chains keyed by
+        # (stage, template, knowledge base id)
+        self._model_clients = {}
+        self._chains = {}
+        self._chains_lock = threading.Lock()
+        # Model clients are built while a chain is being built under _chains_lock
+        self._model_clients_lock = threading.Lock()
 
-    def get_llm(self):
+    def get_knowledge_base_client(self):
         """
-        Get the LLM (Large Language Model) instance used for generating remediation instructions.
+        Get the client that answers knowledge base Retrieve calls, as selected by the RETRIEVER environment variable.
 
         Returns:
-            BedrockChat: An instance of the BedrockChat LLM with the specified configuration.
+            The bedrock-agent-runtime client, or a localRetriever.LocalKnowledgeBaseClient for RETRIEVER=local.
         """
-        model_kwargs = {
-            "max_tokens": 4096,
-            "temperature": 0,
-            "top_p": 0.99
-        }
-        llm = BedrockChat(
-            client=self.bedrock_runtime,  # Set the client for Bedrock
-            model_id=self.modelId,  # Set the foundation model
-            model_kwargs=model_kwargs  # Configure the properties for Claude
-        )
-        return llm
+        if RETRIEVER == 'local':
+            from localRetriever import get_local_knowledge_base_client
+            return get_local_knowledge_base_client()
+        return self.bedrock_client
+
+    def render_context(self, sechub_finding, passages):
+        """
+        Render retrieved passage texts for the {context} placeholder of prompt 1, compressed when
+        CONTEXT_COMPRESSION is true.
+        """
+        if self.context_compression:
+            from contextCompression import compress_retrieved_context
+            return compress_retrieved_context(sechub_finding, passages)
+        return "\n\n".join(passages)
+
+    def get_route(self, stage=None):
+        """
+        Get the ModelRoute of a stage ("chain_1", "chain_2" or "chain_3").
+
+        Without a stage, the route of the handler's own model with the default model_kwargs.
+        """
+        if stage is None:
+            return ModelRoute(self.modelId, dict(DEFAULT_MODEL_KWARGS), MODEL_FALLBACK_ID, None)
+        return self.routes[stage]
+
+    def get_model_client(self, route):
+        """
+        Get the bedrock-runtime client that calls the primary model of a route.
+
+        Routes with a fallback model or a latency budget get a client of their own: its read timeout and
+        deadline are the latency budget, and it gives up after PRIMARY_MAX_ATTEMPTS attempts so that a
+        throttled primary model falls back instead of backing off for minutes. The primary model of a
+        route with a fallback has a rate governor of its own (see model_governor_name), so that its
+        throttling never shrinks the limits, or opens the circuit breaker, of the other models.
+        """
+        if route.fallback_model_id is None and route.latency_budget_seconds is None:
+            return self.bedrock_runtime
+        has_fallback = route.fallback_model_id is not None
+        key = (route.model_id if has_fallback else None, route.latency_budget_seconds, has_fallback)
+        client = self._model_clients.get(key)
+        if client is None:
+            with self._model_clients_lock:
+                client = self._model_clients.get(key)
+                if client is None:
+                    config = self.boto_config
+                    if route.latency_budget_seconds is not None:
+                        config = config.merge(boto3.session.Config(read_timeout=route.latency_budget_seconds))
+                    client = GovernedClient(
+                        boto3.client(service_name="bedrock-runtime", config=config, region_name=self.region),
+                        get_rate_governor(model_governor_name(route.model_id) if has_fallback else "bedrock-runtime"),
+                        max_attempts=PRIMARY_MAX_ATTEMPTS if has_fallback else None,
+                        deadline_seconds=route.latency_budget_seconds)
+                    self._model_clients[key] = client
+        return client
+
+    def get_fallback_client(self, route):
+        """
+        Get the bedrock-runtime client that calls the fallback model of a route.
+
+        It shares the connections of the handler's client, under the rate governor of the fallback model:
+        the fallback still answers while the primary model is throttled or its circuit breaker is open.
+        """
+        key = ("fallback", route.fallback_model_id)
+        client = self._model_clients.get(key)
+        if client is None:
+            with self._model_clients_lock:
+                client = self._model_clients.get(key)
+                if client is None:
+                    client = GovernedClient(self.bedrock_runtime.client,
+                                            get_rate_governor(model_governor_name(route.fallback_model_id)))
+                    self._model_clients[key] = client
+        return client
+
+    def _get_or_build_chain(self, key, build):
+        """
+        Return the chain cached under key, calling build() to create it on first use.
+        """
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._chains_lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    chain = build()
+                    self._chains[key] = chain
+        return chain
 
     def retrievalChain(self, template, knowledge_id):
         """
@@ -67,8 +291,142 @@ class RemediationHandler:
 
         Returns:
             RetrievalChain: The retrieval chain for the given template, knowledge base ID, and parser.
+            The chain is built once per handler and reused by later calls with the same arguments.
 
         """
+        if self.retrieval_mode == 'adaptive':
+            return self._get_or_build_chain(
+                ("adaptive", "chain_1", template, knowledge_id),
+                lambda: self._build_adaptive_retrieval_chain(template, knowledge_id)
+            )
+        return self._get_or_build_chain(
+            ("retrieval", "chain_1", template, knowledge_id),
+            lambda: self._build_retrieval_chain(template, knowledge_id)
+        )
+
+    def _build_adaptive_retrieval_chain(self, template, knowledge_id):
+        from adaptiveRetrieval import AdaptiveRetrievalChain, AdaptiveRetriever
+        retriever = AdaptiveRetriever(self.get_knowledge_base_client(), knowledge_id)
+        return AdaptiveRetrievalChain(self, retriever, self.answerChain(template))
+
+    def _start_stream_metrics(self):
+        return {"start": time.perf_counter(), "time_to_first_token": None, "time_to_template": None, "stopped_early": False}
+
+    def _update_stream_metrics(self, metrics, template_stream, text):
+        if metrics["time_to_first_token"] is None:
+            metrics["time_to_first_token"] = time.perf_counter() - metrics["start"]
+        if template_stream.feed(text):
+            metrics["time_to_template"] = time.perf_counter() - metrics["start"]
+            metrics["stopped_early"] = True
+            return True
+        return False
+
+    def parse_yaml_code(self, string_output):
+        """
+        Extract the YAML code block from the given string output.
+
+        Args:
+            string_output (str): The string containing the YAML code block.
+
+        Returns:
+            str: The YAML code of the block.
+        """
+        return string_output.split("```yaml")[1].split("```")[0]
+
+    def get_named_parameter(self, event, name):
+        """
+        Get the value of a named parameter from the event dictionary.
+
+        Args:
+            event (dict): The event dictionary containing the parameters.
+            name (str): The name of the parameter to retrieve.
+
+        Returns:
+            str: The value of the named parameter.
+        """
+        return next(item for item in event["parameters"] if item["name"] == name)["value"]
+
+
+class RemediationHandler(BaseRemediationHandler):
+    """
+    The LangChain remediation engine. It provides methods for retrieving LLM, analyzing findings, generating
+    remediation instructions and streaming the CloudFormation generation with BedrockChat.
+    """
+
+    def __init__(self, modelId, region=os.environ['AWS_DEFAULT_REGION']):
+        super().__init__(modelId, region=region)
+        # Built lazily and reused: the LLM of each route
+        self._llms = {}
+
+    def get_llm(self, stage=None):
+        """
+        Get the LLM (Large Language Model) instance used for generating remediation instructions.
+
+        Args:
+            stage (str): The stage the LLM is used by, which selects its model and model_kwargs (see
+                MODEL_ROUTING). Defaults to the handler's own model.
+
+        Returns:
+            BedrockChat: An instance of the BedrockChat LLM with the specified configuration, or a
+            runnable falling back from it to the fallback model of the stage.
+        """
+        llm = self._llms.get(stage)
+        if llm is not None:
+            return llm
+        from langchain_community.chat_models import BedrockChat
+        route = self.get_route(stage)
+        llm = BedrockChat(
+            client=self.get_model_client(route),  # Set the client for Bedrock
+            model_id=route.model_id,  # Set the foundation model
+            model_kwargs=dict(route.model_kwargs)  # Configure the properties for Claude
+        )
+        if route.fallback_model_id is not None:
+            from langchain_core.runnables import RunnableLambda
+
+            def start_fallback(prompt):
+                record_fallback(stage, route)
+                return prompt
+
+            fallback = BedrockChat(client=self.get_fallback_client(route), model_id=route.fallback_model_id,
+                                   model_kwargs=dict(route.model_kwargs))
+            llm = llm.with_fallbacks([RunnableLambda(start_fallback) | fallback],
+                                     exceptions_to_handle=LANGCHAIN_FALLBACK_ERRORS)
+        self._llms[stage] = llm
+        return llm
+
+    def chain_config(self, stage):
+        """
+        Get the config passed to the chains of a metrics stage, with the callbacks recording tokens and documents.
+        """
+        return stage.config
+
+    def answerChain(self, template):
+        """
+        Create the chain 1 prompt, model and parser without the retrieval step, for callers that
+        retrieve the {context} themselves.
+
+        Args:
+            template (str): The chain 1 template.
+
+        Returns:
+            A chain taking {"context", "$security_hub_finding_title"} and returning the parsed output.
+        """
+        from langchain.prompts import PromptTemplate
+        parser = self.get_pydantic_parser()
+        return (
+            PromptTemplate(
+                input_variables=["context", "$security_hub_finding_title"],
+                partial_variables={"format_instructions": parser.get_format_instructions()},
+                template=template,
+                )
+            | self.get_llm("chain_1")
+            | parser
+        )
+
+    def _build_retrieval_chain(self, template, knowledge_id):
+        from langchain.prompts import PromptTemplate
+        from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
+        from langchain_core.runnables import RunnableLambda, RunnablePassthrough, RunnableParallel
         retriever = AmazonKnowledgeBasesRetriever(
             knowledge_base_id=knowledge_id,
             retrieval_config={
@@ -77,13 +435,19 @@ class RemediationHandler:
                     "overrideSearchType": "HYBRID"
                 }
             },
-            client=self.bedrock_client,
+            client=self.get_knowledge_base_client(),
         )
-        llm = self.get_llm()
+        llm = self.get_llm("chain_1")
         parser = self.get_pydantic_parser()
         setup_and_retrieval = RunnableParallel(
             {"context": retriever, "$security_hub_finding_title": RunnablePassthrough()}
         )
+        if self.context_compression:
+            def compress(inputs):
+                passages = [document.page_content for document in inputs["context"]]
+                finding = inputs["$security_hub_finding_title"]
+                return dict(inputs, context=self.render_context(finding, passages))
+            setup_and_retrieval = setup_and_retrieval | RunnableLambda(compress)
         retrieval_chain = (
             setup_and_retrieval
             | PromptTemplate(
@@ -96,15 +460,21 @@ class RemediationHandler:
         )
         return retrieval_chain
 
-    def QAChain(self, template):
+    def QAChain(self, template, stage=None):
         """
         Create a QA chain for the given template
         Args:
             template (str): The template to be used for the QA chain.
+            stage (str): The stage running the chain, which selects its model (see get_llm).
         Returns:
-            QAChain: The QA chain for the given template.
+            QAChain: The QA chain for the given template, reused by later calls with the same template.
         """
-        llm = self.get_llm()
+        return self._get_or_build_chain(("qa", stage, template), lambda: self._build_qa_chain(template, stage))
+
+    def _build_qa_chain(self, template, stage=None):
+        from langchain.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        llm = self.get_llm(stage)
         qa_chain = (
             PromptTemplate.from_template(template)
             | llm
@@ -112,52 +482,79 @@ class RemediationHandler:
         )
         
         return qa_chain
-    
-    def get_pydantic_parser(self):
-        """
-        Create a parser for the output of the retrieval chain.
 
+    def streamingChain(self, template, stage="chain_2"):
+        """
+        Create a chain for the given template that yields the raw message chunks of the LLM.
+        Args:
+            template (str): The template to be used for the chain.
+            stage (str): The stage running the chain, which selects its model (see get_llm).
         Returns:
-            PydanticOutputParser: The parser for the output of the retrieval chain.
+            Runnable: The streaming chain for the given template.
         """
-        class sechub_output(BaseModel):
-            remediation_details: str = Field(description="remediation_details")
-            remediation_available: bool = Field(description="remediation_available")
-            remediation_runbook: str = Field(description="remediation_runbook")
-            security_hub_finding_title: str = Field(description="security_hub_finding_title")
-            resource_type: str = Field(description="resource_type")
+        def build():
+            from langchain.prompts import PromptTemplate
+            return PromptTemplate.from_template(template) | self.get_llm(stage)
 
-        return PydanticOutputParser(pydantic_object=sechub_output)
-    
-    def parse_yaml_code(self, string_output):
+        return self._get_or_build_chain(("stream", stage, template), build)
+
+    def stream_yaml_generation(self, template, inputs, config=None):
         """
-        Parse the YAML code from the given string output and save it to a file.
+        Stream the CloudFormation generation and stop reading as soon as the yaml code block is closed.
 
         Args:
-            string_output (str): The string containing the YAML code block.
-            filename (str): The filename to be used for the generated YAML file.
+            template (str): The template to be used for the generation.
+            inputs (dict): The template inputs.
+            config (dict): The chain config of the metrics stage, see chain_config.
 
         Returns:
-            str: The filename of the generated YAML file.
+            tuple: The generated text up to the closing fence, and a dict with time_to_first_token and
+            time_to_template in seconds and whether the stream was stopped early.
         """
-        yaml_code = string_output.split("```yaml")[1].split("```")[0]
-        # Write yaml_code to a temp file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.yaml') as f:
-            f.write(yaml_code)
-            f.close()
-            file_path = f.name
-        return file_path
-
+        metrics = self._start_stream_metrics()
+        template_stream = YamlTemplateStream()
+        stream = self.streamingChain(template).stream(inputs, config=config)
+        try:
+            for chunk in stream:
+                if self._update_stream_metrics(metrics, template_stream, chunk.content):
+                    break
+        finally:
+            # Closing the generator abandons the Bedrock response stream
+            stream.close()
+        metrics.pop("start")
+        return template_stream.text, metrics
 
-    def get_named_parameter(self, event, name):
+    async def astream_yaml_generation(self, template, inputs, config=None):
         """
-        Get the value of a named parameter from the event dictionary.
+        Async variant of stream_yaml_generation.
+        """
+        metrics = self._start_stream_metrics()
+        template_stream = YamlTemplateStream()
+        stream = self.streamingChain(template).astream(inputs, config=config)
+        try:
+            async for chunk in stream:
+                if self._update_stream_metrics(metrics, template_stream, chunk.content):
+                    break
+        finally:
+            await stream.aclose()
+        metrics.pop("start")
+        return template_stream.text, metrics
 
-        Args:
-            event (dict): The event dictionary containing the parameters.
-            name (str): The name of the parameter to retrieve.
+    def get_pydantic_parser(self):
+        """
+        Create a parser for the output of the retrieval chain.
 
         Returns:
-            str: The value of the named parameter.
+            PydanticOutputParser: The parser for the output of the retrieval chain.
         """
-        return next(item for item in event["parameters"] if item["name"] == name)["value"]
\ No newline at end of file
+        from langchain_core.output_parsers import PydanticOutputParser
+        from pydantic import BaseModel, Field
+
+        class sechub_output(BaseModel):
+            remediation_details: str = Field(description="remediation_details")
+            remediation_available: bool = Field(description="remediation_available")
+            remediation_runbook: str = Field(description="remediation_runbook")
+            security_hub_finding_title: str = Field(description="security_hub_finding_title")
+            resource_type: str = Field(description="resource_type")
+
+        return PydanticOutputParser(pydantic_object=sechub_output)
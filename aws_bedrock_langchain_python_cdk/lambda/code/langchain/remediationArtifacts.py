@@ -0,0 +1,212 @@
+import json
+import logging
+import posixpath
+import re
+from collections import namedtuple
+
+from gitHubCommit import template_file_path
+
+# PyYAML is imported by the functions that use it, once a template was generated
+
+LOGGER = logging.getLogger(__name__)
+
+# The deploy stage of the pipeline reads the parameters of stack <name> from this directory
+PARAMETERS_DIRECTORY = 'deploy/parameters'
+PARAMETERS_SUFFIX = '-params.json'
+
+RemediationArtifact = namedtuple('RemediationArtifact', ['stack_name', 'template_path', 'template', 'parameters_path',
+                                                         'parameters', 'resource_type'])
+RemediationArtifact.__doc__ = """
+A generated remediation template and the files derived from it, committed together.
+
+Args:
+    stack_name (str): The stack the pipeline deploys the template as.
+    template_path (str): Path of the template in the repo, e.g. "S3/GenRem-S3.4.yaml".
+    template (str): The template.
+    parameters_path (str): Path of the parameters file, e.g. "deploy/parameters/S3-GenRem-S3-4-params.json".
+    parameters (str): The parameters file, in the format of the CloudFormation CLI --parameters option.
+    resource_type (str): The resource type of the finding.
+"""
+
+
+def stack_name(template_path):
+    """
+    Name of the stack the pipeline deploys a template as: its path in the repo without the extension,
+    with the characters a stack name cannot have replaced by "-" (the deploy buildspec does the same).
+    The directory is part of it, as resource types are free text and the same file name can end up in
+    several resource type directories, e.g. "S3/GenRem-S3.4.yaml" and "S3 Bucket/GenRem-S3.4.yaml".
+    """
+    return re.sub(r'[^A-Za-z0-9-]', '-', posixpath.splitext(posixpath.normpath(template_path))[0])
+
+
+def parameters_file_path(name):
+    return '{}/{}{}'.format(PARAMETERS_DIRECTORY, name, PARAMETERS_SUFFIX)
+
+
+def is_parameters_file(path):
+    return path.startswith(PARAMETERS_DIRECTORY + '/') and path.endswith(PARAMETERS_SUFFIX)
+
+
+def _cfn_tag(loader, tag_suffix, node):
+    """
+    Construct a CloudFormation short-form function (!Ref, !Sub, !GetAtt, ...) as its long form.
+    """
+    import yaml
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if tag_suffix == 'Ref':
+        return {'Ref': value}
+    if tag_suffix == 'Condition':
+        return {'Condition': value}
+    if tag_suffix == 'GetAtt' and isinstance(value, str):
+        value = value.split('.', 1)
+    return {'Fn::' + tag_suffix: value}
+
+
+_CFN_LOADER = None
+
+
+def _cfn_loader():
+    global _CFN_LOADER
+    if _CFN_LOADER is None:
+        import yaml
+
+        class CfnLoader(yaml.SafeLoader):
+            pass
+
+        CfnLoader.add_multi_constructor('!', _cfn_tag)
+        _CFN_LOADER = CfnLoader
+    return _CFN_LOADER
+
+
+def load_template(template):
+    """
+    Load a CloudFormation template in YAML or JSON. Short-form functions such as !Ref and !Sub, and
+    any other local tag, are loaded as their long form ({"Ref": ...}, {"Fn::Sub": ...}).
+
+    Raises:
+        yaml.YAMLError: The template is not valid YAML.
+    """
+    import yaml
+    return yaml.load(template, Loader=_cfn_loader())
+
+
+def _parameter_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ','.join(_parameter_value(item) for item in value)
+    return str(value)
+
+
+def template_parameter_declarations(template):
+    """
+    Get the Parameters section of a template.
+
+    Returns:
+        dict: Parameter name -> declaration dict in template order, empty when the template has no
+        parameters or cannot be parsed.
+    """
+    import yaml
+    try:
+        document = load_template(template)
+    except yaml.YAMLError as e:
+        LOGGER.warning("Could not parse the template parameters: {}".format(e))
+        return {}
+    parameters = document.get('Parameters') if isinstance(document, dict) else None
+    if not isinstance(parameters, dict):
+        return {}
+    return {str(key): declaration if isinstance(declaration, dict) else {} for key, declaration in parameters.items()}
+
+
+def template_parameters(template):
+    """
+    Build the parameter list of a template from its Parameters section: the Default of each
+    parameter, or its first AllowedValues entry. Parameters with neither are left out, for the
+    operator to add to the parameters file; until then the deployment fails on the missing value.
+
+    Returns:
+        list: {"ParameterKey", "ParameterValue"} dicts in template order, empty when the template
+        has no parameters or cannot be parsed.
+    """
+    result = []
+    unset = []
+    for key, declaration in template_parameter_declarations(template).items():
+        allowed_values = declaration.get('AllowedValues')
+        if 'Default' in declaration:
+            value = _parameter_value(declaration['Default'])
+        elif isinstance(allowed_values, list) and allowed_values:
+            value = _parameter_value(allowed_values[0])
+        else:
+            unset.append(key)
+            continue
+        result.append({'ParameterKey': key, 'ParameterValue': value})
+    if unset:
+        LOGGER.warning("Parameters without a Default or AllowedValues, set them in the parameters file: {}".format(unset))
+    return result
+
+
+def render_parameters(parameters):
+    return json.dumps(parameters, indent=2) + '\n'
+
+
+def merge_parameters(generated, existing, template=None):
+    """
+    Keep the values of an existing parameters file for the parameters the new template still declares.
+
+    Args:
+        generated (str): The parameters file derived from the new template.
+        existing (str): The parameters file on the branch, which operators may have edited.
+        template (str): The new template. When given, the values operators set for parameters the
+            generated file leaves out (see template_parameters) are kept too.
+
+    Returns:
+        str: The parameters of the new template, with the existing values where there are any.
+    """
+    try:
+        values = {item['ParameterKey']: item['ParameterValue'] for item in json.loads(existing)}
+    except (ValueError, TypeError, KeyError) as e:
+        LOGGER.warning("Ignoring an invalid parameters file: {}".format(e))
+        return generated
+    defaults = {item['ParameterKey']: item['ParameterValue'] for item in json.loads(generated)}
+    names = list(template_parameter_declarations(template)) if template is not None else list(defaults)
+    parameters = [{'ParameterKey': name, 'ParameterValue': values.get(name, defaults.get(name))}
+                  for name in names if name in values or name in defaults]
+    return render_parameters(parameters)
+
+
+def build_artifact(filename, template, resource_type):
+    """
+    Build the artifact of a generated template: the template and its parameters file.
+
+    Args:
+        filename (str): The template file name of the finding (see findingKey.finding_filename).
+        template (str): The generated template.
+        resource_type (str): The resource type of the finding.
+
+    Returns:
+        RemediationArtifact: The artifact.
+    """
+    template_path = template_file_path(resource_type, filename)
+    name = stack_name(template_path)
+    return RemediationArtifact(name, template_path, template, parameters_file_path(name),
+                               render_parameters(template_parameters(template)), resource_type)
+
+
+def artifact_files(artifacts):
+    """
+    Collect the files of artifacts to commit.
+
+    Returns:
+        dict: File path in the repo -> file content, templates first.
+    """
+    files = {}
+    for artifact in artifacts:
+        files[artifact.template_path] = artifact.template
+    for artifact in artifacts:
+        files[artifact.parameters_path] = artifact.parameters
+    return files
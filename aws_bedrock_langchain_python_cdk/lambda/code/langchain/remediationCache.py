@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+
+from findingKey import finding_key
+
+LOGGER = logging.getLogger(__name__)
+
+# Item holding the cache generation. Bumping it invalidates every entry written before,
+# which is how a knowledge base re-sync is propagated to all Lambda containers.
+GENERATION_KEY = '__generation__'
+
+
+class LocalCacheStore:
+    """
+    In-memory stand-in for the DynamoDB cache table, used in tests and when no table is configured.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def get_item(self, key):
+        item = self.items.get(key)
+        if item is None or item['expires_at'] <= time.time():
+            return None
+        return item['value']
+
+    def put_item(self, key, value, expires_at):
+        with self._lock:
+            self.items[key] = {'value': value, 'expires_at': expires_at}
+
+    def get_generation(self):
+        return self.generation
+
+    def bump_generation(self):
+        with self._lock:
+            self.generation += 1
+            return self.generation
+
+
+class DynamoDBCacheStore:
+    """
+    Cache store backed by a DynamoDB table with partition key 'pk' and TTL attribute 'expires_at'.
+    """
+
+    def __init__(self, table_name, region=None):
+        region = region or os.environ['AWS_DEFAULT_REGION']
+        self.table = boto3.resource('dynamodb', region_name=region).Table(table_name)
+
+    def get_item(self, key):
+        item = self.table.get_item(Key={'pk': key}).get('Item')
+        # DynamoDB deletes expired items lazily, so the TTL is checked on read as well
+        if item is None or int(item['expires_at']) <= time.time():
+            return None
+        return json.loads(item['value'])
+
+    def put_item(self, key, value, expires_at):
+        self.table.put_item(Item={'pk': key, 'value': json.dumps(value), 'expires_at': int(expires_at)})
+
+    def get_generation(self):
+        item = self.table.get_item(Key={'pk': GENERATION_KEY}).get('Item')
+        return int(item['generation']) if item else 0
+
+    def bump_generation(self):
+        response = self.table.update_item(
+            Key={'pk': GENERATION_KEY},
+            UpdateExpression='ADD generation :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['generation'])
+
+
+class RemediationCache:
+    """
+    Two-tier cache of rag_flow results: an in-process LRU with TTL in front of a shared store.
+
+    Entries are keyed by the normalized finding title, the model id and the knowledge base id, and
+    hold the chain 1 output fields together with the final chain 2/3 response.
+    """
+
+    def __init__(self, store=None, max_entries=256, ttl_seconds=86400, generation_check_seconds=60):
+        self.store = store if store is not None else LocalCacheStore()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_check_seconds = generation_check_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self.stats = {'local_hits': 0, 'remote_hits': 0, 'misses': 0}
+
+    def _current_generation(self):
+        """
+        Return the store generation, re-reading it at most every generation_check_seconds.
+
+        When the store cannot be read the last known generation is kept until the next check, and None
+        is returned if there is none yet: without a generation, invalidations cannot be seen.
+        """
+        now = time.monotonic()
+        if self._generation is None or now - self._generation_checked_at >= self.generation_check_seconds:
+            try:
+                generation = self.store.get_generation()
+            except Exception as e:
+                LOGGER.warning("Remediation cache generation lookup failed: %s", e)
+                if self._generation is not None:
+                    self._generation_checked_at = now
+                return self._generation
+            if generation != self._generation:
+                with self._lock:
+                    self._entries.clear()
+            self._generation = generation
+            self._generation_checked_at = now
+        return self._generation
+
+    def make_key(self, sechub_finding, model_id, kb_id):
+        """
+        Build the cache key for a finding title, model id and knowledge base id, or None when the cache
+        generation is unknown and the cache must be bypassed.
+        """
+        generation = self._current_generation()
+        if generation is None:
+            return None
+        raw = "|".join([str(generation), model_id, kb_id, finding_key(sechub_finding)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, sechub_finding, model_id, kb_id):
+        """
+        Look up a cached result.
+
+        Returns:
+            dict: {"sechub_output": dict, "response": str} or None on a miss.
+        """
+        key = self.make_key(sechub_finding, model_id, kb_id)
+        if key is None:
+            self._count('misses')
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return entry[1]
+        try:
+            value = self.store.get_item(key)
+        except Exception as e:
+            LOGGER.warning("Remediation cache store lookup failed: %s", e)
+            value = None
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('remote_hits')
+        self._put_local(key, value, now + self.ttl_seconds)
+        return value
+
+    def put(self, sechub_finding, model_id, kb_id, sechub_output, response):
+        """
+        Store the chain 1 output fields and the final response for a finding.
+        """
+        key = self.make_key(sechub_finding, model_id, kb_id)
+        if key is None:
+            return
+        value = {'sechub_output': sechub_output, 'response': response}
+        expires_at = time.time() + self.ttl_seconds
+        self._put_local(key, value, expires_at)
+        try:
+            self.store.put_item(key, value, expires_at)
+        except Exception as e:
+            LOGGER.warning("Remediation cache store write failed: %s", e)
+
+    def _count(self, stat):
+        # The cache is shared by the threads of a container, the stats are only updated under the lock
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _put_local(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Invalidate every cached result, e.g. after the knowledge base has been re-synced.
+
+        Returns:
+            int: The new cache generation.
+        """
+        generation = self.store.bump_generation()
+        with self._lock:
+            self._entries.clear()
+        self._generation = generation
+        self._generation_checked_at = time.monotonic()
+        LOGGER.info("Remediation cache invalidated, generation is now %s", generation)
+        return generation
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_remediation_cache():
+    """
+    Get the process-level RemediationCache, backed by the DynamoDB table named in CACHE_TABLE_NAME
+    or by a LocalCacheStore when the variable is not set.
+    """
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                table_name = os.environ.get('CACHE_TABLE_NAME')
+                store = DynamoDBCacheStore(table_name) if table_name else LocalCacheStore()
+                _CACHE = RemediationCache(
+                    store=store,
+                    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', '256')),
+                    ttl_seconds=int(os.environ.get('CACHE_TTL_SECONDS', '86400'))
+                )
+    return _CACHE
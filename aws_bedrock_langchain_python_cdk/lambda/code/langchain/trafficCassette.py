@@ -0,0 +1,370 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import boto3
+
+LOGGER = logging.getLogger(__name__)
+
+# "record" captures the HTTP traffic of the Bedrock, Secrets Manager and GitHub clients to CASSETTE_PATH,
+# "replay" serves it back from the cassette without reaching the services, "off" leaves the clients alone
+CASSETTE_MODE = os.environ.get('CASSETTE_MODE', 'off').lower()
+CASSETTE_PATH = os.environ.get('CASSETTE_PATH', 'cassette.jsonl')
+# Replayed responses wait for the latency they were recorded with ("recorded") or are served at once ("zero")
+CASSETTE_LATENCY = os.environ.get('CASSETTE_LATENCY', 'recorded').lower()
+CASSETTE_LATENCIES = ('recorded', 'zero')
+# Replayed responses are matched on the whole request, body included ("request"), or on the service and
+# path only ("operation"), which replays the recorded answers in order after a prompt changed
+CASSETTE_MATCH = os.environ.get('CASSETTE_MATCH', 'request').lower()
+CASSETTE_MATCHES = ('request', 'operation')
+
+# botocore service ids of the clients whose traffic is recorded. The github-token secret is recorded so
+# that GitHubCommitter starts without AWS credentials on replay, its value is redacted.
+RECORDED_SERVICES = ('bedrock-runtime', 'bedrock-agent-runtime', 'secrets-manager')
+REDACTED_SECRET = 'cassette-redacted'
+
+# Response headers that differ on every call and are left out of the cassette
+VOLATILE_HEADERS = frozenset((
+    'date', 'connection', 'keep-alive', 'server', 'set-cookie', 'x-amzn-requestid', 'x-amzn-trace-id',
+    'x-amz-apigw-id', 'x-github-request-id', 'x-ratelimit-reset', 'x-ratelimit-used', 'x-ratelimit-remaining',
+))
+
+
+class CassetteMissError(Exception):
+    """
+    A replayed request has no recorded response in the cassette.
+    """
+
+
+def body_digest(body):
+    """
+    Digest of a request body. JSON bodies are digested in canonical form, so that the key order of the
+    client does not matter.
+
+    Args:
+        body (bytes, str or None): The request body.
+
+    Returns:
+        str: The first 20 hex digits of its SHA-256.
+    """
+    if body is None:
+        body = b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except ValueError:
+        pass
+    return hashlib.sha256(body).hexdigest()[:20]
+
+
+def request_path(url):
+    """
+    Path and query of a request url: cassettes recorded in one region or against one GitHub host replay
+    against any other.
+    """
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class BufferedRaw(io.BytesIO):
+    """
+    A recorded response body standing in for the urllib3 response botocore reads bodies and event
+    streams from.
+    """
+
+    def stream(self, amt=1024, **kwargs):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+
+class Cassette:
+    """
+    Recorded request/response pairs, stored as one compact JSON object per line (gzip compressed when
+    the path ends with .gz).
+
+    In record mode every interaction is appended to the file as soon as it completes, so an interrupted
+    run keeps what it recorded. In replay mode, the recorded responses of a request are served in the
+    order they were recorded; once they are used up they are served again from the first one, so a
+    trace can be replayed any number of times.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" or "replay".
+        latency (str): "recorded" or "zero", see CASSETTE_LATENCY.
+        match (str): "request" or "operation", see CASSETTE_MATCH.
+    """
+
+    def __init__(self, path, mode='replay', latency='recorded', match='request'):
+        for name, value, allowed in (('mode', mode, ('record', 'replay')), ('latency', latency, CASSETTE_LATENCIES),
+                                     ('match', match, CASSETTE_MATCHES)):
+            if value not in allowed:
+                raise ValueError("Unknown cassette {} {}, expected one of {}".format(name, value, allowed))
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.match = match
+        self.stats = {'recorded': 0, 'replayed': 0, 'repeated': 0, 'missed': 0}
+        self._lock = threading.Lock()
+        self._file = None
+        # key -> the interactions recorded for it, and how many times it was replayed
+        self._recorded = {}
+        self._served = {}
+        if mode == 'replay':
+            for interaction in self.load(path):
+                key = self.key(interaction['service'], interaction['method'], interaction['path'], interaction['request'])
+                self._recorded.setdefault(key, []).append(interaction)
+            self._served = dict.fromkeys(self._recorded, 0)
+            LOGGER.info("Replaying {} interactions from {}".format(sum(map(len, self._recorded.values())), path))
+
+    @staticmethod
+    def load(path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def key(self, service, method, path, digest):
+        if self.match == 'operation':
+            return (service, method, path)
+        return (service, method, path, digest)
+
+    def record(self, service, method, url, request_body, status, headers, body, seconds):
+        """
+        Append an interaction to the cassette.
+
+        Args:
+            service (str): The botocore service id, or "github".
+            method (str): The HTTP method.
+            url (str): The request url.
+            request_body: The request body, only its digest is kept.
+            status (int): The response status code.
+            headers (dict): The response headers.
+            body (bytes): The response body.
+            seconds (float): How long the service took to answer.
+        """
+        interaction = {
+            'service': service, 'method': method, 'path': request_path(url), 'request': body_digest(request_body),
+            'status': status, 'seconds': round(seconds, 4),
+            'headers': {name.lower(): value for name, value in headers.items() if name.lower() not in VOLATILE_HEADERS},
+        }
+        try:
+            interaction['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            # Event streams are binary
+            interaction['body_base64'] = base64.b64encode(body).decode('ascii')
+        line = json.dumps(interaction, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                opener = gzip.open if self.path.endswith('.gz') else open
+                self._file = opener(self.path, 'at', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            self.stats['recorded'] += 1
+
+    def play(self, service, method, url, request_body):
+        """
+        Get the recorded response of a request, after waiting for its recorded latency unless latency is "zero".
+
+        Returns:
+            tuple: (status, headers, body bytes) of the recorded response.
+
+        Raises:
+            CassetteMissError: The request was never recorded.
+        """
+        key = self.key(service, method, request_path(url), body_digest(request_body))
+        with self._lock:
+            recorded = self._recorded.get(key)
+            if recorded is None:
+                self.stats['missed'] += 1
+                raise CassetteMissError("No recorded response for {} {} {} (request {})".format(
+                    service, method, request_path(url), body_digest(request_body)))
+            served = self._served[key]
+            interaction = recorded[served % len(recorded)]
+            self._served[key] = served + 1
+            self.stats['replayed'] += 1
+            if served >= len(recorded):
+                self.stats['repeated'] += 1
+        if self.latency == 'recorded':
+            time.sleep(interaction['seconds'])
+        if 'body_base64' in interaction:
+            body = base64.b64decode(interaction['body_base64'])
+        else:
+            body = interaction['body'].encode('utf-8')
+        return interaction['status'], interaction['headers'], body
+
+    def unused(self):
+        """
+        Number of recorded interactions that were not replayed, e.g. because a change removed a model call.
+        """
+        with self._lock:
+            return sum(max(len(recorded) - self._served[key], 0) for key, recorded in self._recorded.items())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def redact_secret(body):
+    """
+    Replace the SecretString of a GetSecretValue response.
+    """
+    response = json.loads(body)
+    if 'SecretString' in response:
+        response['SecretString'] = REDACTED_SECRET
+    return json.dumps(response).encode('utf-8')
+
+
+class _CassetteClientMixin:
+    """
+    Base class added to the recorded boto3 clients: sends their requests through the cassette.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        cassette = _CASSETTE
+        if cassette is None:
+            return
+        from botocore.httpsession import URLLib3Session
+        config = self.meta.config
+        http_session = URLLib3Session(proxies=config.proxies, timeout=(config.connect_timeout, config.read_timeout),
+                                      max_pool_connections=config.max_pool_connections,
+                                      proxies_config=config.proxies_config) if cassette.mode == 'record' else None
+        service = self.meta.service_model.service_id.hyphenize()
+
+        def before_send(request, **kwargs):
+            return _send_botocore_request(cassette, service, http_session, request)
+        self.meta.events.register('before-send', before_send)
+
+
+def _send_botocore_request(cassette, service, http_session, request):
+    from botocore.awsrequest import AWSResponse
+    if cassette.mode == 'replay':
+        status, headers, body = cassette.play(service, request.method, request.url, request.body)
+    else:
+        start = time.perf_counter()
+        response = http_session.send(request)
+        # Event streams are read whole, the recorded latency is the time to the last event
+        body = response.content
+        seconds = time.perf_counter() - start
+        status = response.status_code
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        if service == 'secrets-manager':
+            body = redact_secret(body)
+            headers.pop('content-length', None)
+        cassette.record(service, request.method, request.url, request.body, status, headers, body, seconds)
+    return AWSResponse(request.url, status, headers, BufferedRaw(body))
+
+
+def _add_client_mixin(base_classes, **kwargs):
+    base_classes.insert(0, _CassetteClientMixin)
+
+
+def _send_github_request(cassette, hosts, send):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+    from datetime import timedelta
+
+    def cassette_send(session, request, **kwargs):
+        if urlsplit(request.url).netloc not in hosts:
+            return send(session, request, **kwargs)
+        if cassette.mode == 'record':
+            start = time.perf_counter()
+            response = send(session, request, **kwargs)
+            body = response.content
+            # The body is recorded decoded
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+            cassette.record('github', request.method, request.url, request.body, response.status_code, headers, body,
+                            time.perf_counter() - start)
+            return response
+        status, headers, body = cassette.play('github', request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        return response
+    return cassette_send
+
+
+_CASSETTE = None
+_ORIGINAL_SEND = None
+_INSTALL_LOCK = threading.Lock()
+
+
+def get_cassette():
+    """
+    Get the installed Cassette, None unless install_cassette was called.
+    """
+    return _CASSETTE
+
+
+def install_cassette(path=None, mode=None, latency=None, match=None, github_urls=None):
+    """
+    Send the traffic of the boto3 clients of RECORDED_SERVICES created from now on, and of the requests
+    sessions to the GitHub API, through a cassette. Arguments default to the CASSETTE_* environment
+    variables.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" or "replay".
+        latency (str): "recorded" or "zero".
+        match (str): "request" or "operation".
+        github_urls (list): Base urls of the GitHub API whose requests are recorded. Defaults to
+            GITHUB_API_URL.
+
+    Returns:
+        Cassette: The installed cassette.
+    """
+    global _CASSETTE, _ORIGINAL_SEND
+    import requests
+    with _INSTALL_LOCK:
+        if _CASSETTE is not None:
+            raise RuntimeError("A cassette is already installed")
+        cassette = Cassette(path or CASSETTE_PATH, mode or CASSETTE_MODE, latency or CASSETTE_LATENCY,
+                            match or CASSETTE_MATCH)
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        for service in RECORDED_SERVICES:
+            boto3.DEFAULT_SESSION.events.register('creating-client-class.' + service, _add_client_mixin)
+        hosts = {urlsplit(url).netloc for url in github_urls or
+                 [os.environ.get('GITHUB_API_URL', 'https://api.github.com')]}
+        _ORIGINAL_SEND = requests.Session.send
+        requests.Session.send = _send_github_request(cassette, hosts, _ORIGINAL_SEND)
+        _CASSETTE = cassette
+    LOGGER.info("Cassette {} installed in {} mode".format(cassette.path, cassette.mode))
+    return cassette
+
+
+def uninstall_cassette():
+    """
+    Stop sending traffic through the installed cassette and close it. Clients created while it was
+    installed keep using it.
+    """
+    global _CASSETTE, _ORIGINAL_SEND
+    import requests
+    with _INSTALL_LOCK:
+        if _CASSETTE is None:
+            return
+        for service in RECORDED_SERVICES:
+            boto3.DEFAULT_SESSION.events.unregister('creating-client-class.' + service, _add_client_mixin)
+        requests.Session.send = _ORIGINAL_SEND
+        _CASSETTE.close()
+        _CASSETTE, _ORIGINAL_SEND = None, None
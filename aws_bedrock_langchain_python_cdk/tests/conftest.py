@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The Lambda code is deployed as a flat asset directory and imports its modules by file name
+# (e.g. ``from remediation import RemediationHandler``), so the tests import it the same way.
+LAMBDA_CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda', 'code', 'langchain')
+if LAMBDA_CODE_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_CODE_DIR)
+
+for key, value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'KB_ID': 'TESTKBID',
+    'MODEL_ID': 'anthropic.claude-3-sonnet-20240229-v1:0',
+    'GITHUB_REPO': 'test-repo',
+    'GITHUB_OWNER': 'test-owner',
+}.items():
+    os.environ.setdefault(key, value)
+
+from fake_github import FakeGitHubServer  # noqa: E402
+
+
+@pytest.fixture
+def fake_github():
+    with FakeGitHubServer('test-owner/test-repo') as server:
+        yield server
@@ -0,0 +1,306 @@
+"""
+A local fake of the subset of the GitHub REST API used by GitHubCommitter.
+
+Serves one repository from memory over HTTP so PyGithub can be pointed at it with base_url.
+Git objects are content addressed like in git, so blob SHAs match what GitHub would return.
+Latency and failures can be injected for tests and benchmarks.
+"""
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _object_sha(kind, payload):
+    return hashlib.sha1((kind + json.dumps(payload, sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+class FakeGitHubRepository:
+    """
+    In-memory state of a single repository: blobs, trees (flat path -> blob sha maps), commits and branches.
+    """
+
+    def __init__(self, full_name, default_branch="main"):
+        self.full_name = full_name
+        self.default_branch = default_branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.branches = {}
+        self.lock = threading.RLock()
+        initial_tree = self._store_tree({})
+        self.branches[default_branch] = self._store_commit("Initial commit", initial_tree, [])
+
+    def _store_blob(self, data):
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def _store_tree(self, entries):
+        sha = _object_sha("tree", entries)
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def _store_commit(self, message, tree_sha, parents):
+        sha = _object_sha("commit", {"message": message, "tree": tree_sha, "parents": parents, "time": time.time_ns()})
+        self.commits[sha] = {"message": message, "tree": tree_sha, "parents": parents}
+        return sha
+
+    def head_files(self, branch=None):
+        """
+        Return {path: content} of the branch head.
+        """
+        with self.lock:
+            tree = self.trees[self.commits[self.branches[branch or self.default_branch]]["tree"]]
+            return {path: self.blobs[sha].decode("utf-8") for path, sha in tree.items()}
+
+    def commit_count(self, branch=None):
+        with self.lock:
+            count, sha = 0, self.branches[branch or self.default_branch]
+            while self.commits[sha]["parents"]:
+                count += 1
+                sha = self.commits[sha]["parents"][0]
+            return count
+
+    def push(self, files, message="Concurrent commit", branch=None):
+        """
+        Commit {path: content} directly to a branch, as another client would.
+        """
+        with self.lock:
+            branch = branch or self.default_branch
+            head = self.branches[branch]
+            entries = dict(self.trees[self.commits[head]["tree"]])
+            for path, content in files.items():
+                entries[path] = self._store_blob(content.encode("utf-8"))
+            self.branches[branch] = self._store_commit(message, self._store_tree(entries), [head])
+            return self.branches[branch]
+
+
+class FakeGitHubServer:
+    """
+    HTTP server for a FakeGitHubRepository.
+
+    Attributes:
+        latency (float): Seconds to sleep before answering each request.
+        failures (list): (method, path regex, status) tuples; each fails the next matching request once.
+        valid_tokens (set): When set, requests whose token is not in it get 401 Bad credentials.
+        before_request (callable): Called with (method, path) before a request is handled.
+        requests (list): (method, path) of every request received.
+    """
+
+    def __init__(self, full_name="test-owner/test-repo", default_branch="main", latency=0.0):
+        self.repo = FakeGitHubRepository(full_name, default_branch)
+        self.latency = latency
+        self.failures = []
+        self.valid_tokens = None
+        self.before_request = None
+        self.requests = []
+        self.tokens_seen = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self._server.server_address[1])
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, method, pattern=""):
+        return sum(1 for m, path in self.requests if m == method and re.search(pattern, path))
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                path = unquote(parsed.path)
+                server.requests.append((method, path))
+                token = self.headers.get("Authorization", "").replace("token ", "").replace("Bearer ", "")
+                server.tokens_seen.append(token)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.before_request is not None:
+                    server.before_request(method, path)
+                if server.valid_tokens is not None and token not in server.valid_tokens:
+                    return self._send(401, {"message": "Bad credentials"})
+                for failure in list(server.failures):
+                    if failure[0] == method and re.search(failure[1], path):
+                        server.failures.remove(failure)
+                        return self._send(failure[2], {"message": "Injected failure"})
+                status, payload = server._route(method, path, parse_qs(parsed.query), body)
+                self._send(status, payload)
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+        return Handler
+
+    # Routing
+
+    def _repo_url(self):
+        return "{}/repos/{}".format(self.url, self.repo.full_name)
+
+    def _commit_json(self, sha):
+        commit = self.repo.commits[sha]
+        return {
+            "sha": sha,
+            "url": "{}/git/commits/{}".format(self._repo_url(), sha),
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"], "url": "{}/git/trees/{}".format(self._repo_url(), commit["tree"])},
+            "parents": [{"sha": parent, "url": "{}/git/commits/{}".format(self._repo_url(), parent)} for parent in commit["parents"]],
+        }
+
+    def _ref_json(self, branch):
+        sha = self.repo.branches[branch]
+        return {
+            "ref": "refs/heads/" + branch,
+            "url": "{}/git/refs/heads/{}".format(self._repo_url(), branch),
+            "object": {"sha": sha, "type": "commit", "url": "{}/git/commits/{}".format(self._repo_url(), sha)},
+        }
+
+    def _file_json(self, path, blob_sha, with_content=True):
+        data = {
+            "type": "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": blob_sha,
+            "size": len(self.repo.blobs[blob_sha]),
+            "url": "{}/contents/{}".format(self._repo_url(), path),
+        }
+        if with_content:
+            data["encoding"] = "base64"
+            data["content"] = base64.b64encode(self.repo.blobs[blob_sha]).decode("ascii")
+        return data
+
+    def _route(self, method, path, query, body):
+        prefix = "/repos/" + self.repo.full_name
+        if not path.startswith(prefix):
+            return 404, {"message": "Not Found"}
+        path = path[len(prefix):]
+        with self.repo.lock:
+            if method == "GET" and path == "":
+                return 200, {
+                    "full_name": self.repo.full_name,
+                    "name": self.repo.full_name.split("/")[1],
+                    "default_branch": self.repo.default_branch,
+                    "url": self._repo_url(),
+                }
+            match = re.fullmatch(r"/git/refs?/heads/(.+)", path)
+            if match:
+                branch = match.group(1)
+                if branch not in self.repo.branches:
+                    return 404, {"message": "Not Found"}
+                if method == "GET":
+                    return 200, self._ref_json(branch)
+                if method == "PATCH":
+                    new_sha = body["sha"]
+                    current = self.repo.branches[branch]
+                    if not body.get("force") and current not in self.repo.commits[new_sha]["parents"]:
+                        return 422, {"message": "Update is not a fast forward"}
+                    self.repo.branches[branch] = new_sha
+                    return 200, self._ref_json(branch)
+            match = re.fullmatch(r"/git/commits/(\w+)", path)
+            if match and method == "GET":
+                if match.group(1) not in self.repo.commits:
+                    return 404, {"message": "Not Found"}
+                return 200, self._commit_json(match.group(1))
+            if path == "/git/commits" and method == "POST":
+                sha = self.repo._store_commit(body["message"], body["tree"], body["parents"])
+                return 201, self._commit_json(sha)
+            if path == "/git/blobs" and method == "POST":
+                data = base64.b64decode(body["content"]) if body.get("encoding") == "base64" else body["content"].encode("utf-8")
+                sha = self.repo._store_blob(data)
+                return 201, {"sha": sha, "url": "{}/git/blobs/{}".format(self._repo_url(), sha)}
+            if path == "/git/trees" and method == "POST":
+                entries = dict(self.repo.trees[body["base_tree"]]) if body.get("base_tree") else {}
+                for element in body["tree"]:
+                    if element.get("content") is not None:
+                        entries[element["path"]] = self.repo._store_blob(element["content"].encode("utf-8"))
+                    elif element.get("sha") is None:
+                        entries.pop(element["path"], None)
+                    else:
+                        entries[element["path"]] = element["sha"]
+                sha = self.repo._store_tree(entries)
+                return 201, self._tree_json(sha)
+            match = re.fullmatch(r"/git/trees/(\w+)", path)
+            if match and method == "GET":
+                return 200, self._tree_json(match.group(1))
+            match = re.fullmatch(r"/contents/(.*)", path)
+            if match:
+                return self._contents(method, match.group(1).strip("/"), query, body)
+        return 404, {"message": "Not Found"}
+
+    def _tree_json(self, sha):
+        return {
+            "sha": sha,
+            "url": "{}/git/trees/{}".format(self._repo_url(), sha),
+            "truncated": False,
+            "tree": [{"path": path, "mode": "100644", "type": "blob", "sha": blob_sha} for path, blob_sha in sorted(self.repo.trees[sha].items())],
+        }
+
+    def _contents(self, method, path, query, body):
+        branch = (query.get("ref") or [body.get("branch") or self.repo.default_branch])[0]
+        head = self.repo.branches[branch]
+        entries = self.repo.trees[self.repo.commits[head]["tree"]]
+        if method == "GET":
+            if path in entries:
+                return 200, self._file_json(path, entries[path])
+            children = sorted(p for p in entries if p.startswith(path + "/") and "/" not in p[len(path) + 1:])
+            if children:
+                return 200, [self._file_json(child, entries[child], with_content=False) for child in children]
+            return 404, {"message": "Not Found"}
+        if method == "PUT":
+            if path in entries and body.get("sha") != entries[path]:
+                return 409, {"message": "{} does not match {}".format(path, body.get("sha"))}
+            if path not in entries and body.get("sha"):
+                return 404, {"message": "Not Found"}
+            new_entries = dict(entries)
+            new_entries[path] = self.repo._store_blob(base64.b64decode(body["content"]))
+            commit_sha = self.repo._store_commit(body["message"], self.repo._store_tree(new_entries), [head])
+            self.repo.branches[branch] = commit_sha
+            return (200 if body.get("sha") else 201), {
+                "content": self._file_json(path, new_entries[path], with_content=False),
+                "commit": self._commit_json(commit_sha),
+            }
+        return 404, {"message": "Not Found"}
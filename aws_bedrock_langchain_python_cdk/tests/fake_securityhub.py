@@ -0,0 +1,72 @@
+"""
+A local fake of the Security Hub GetFindings API used by the finding backfill.
+
+Keeps ASFF findings in memory and pages through them like Security Hub: MaxResults of 1 to 100,
+opaque NextToken values that can be expired, and the ComplianceStatus, RecordState and
+WorkflowStatus string filters (EQUALS and NOT_EQUALS). moto's Security Hub ignores filters, so
+the backfill's filtering is tested against this fake.
+"""
+import threading
+import uuid
+
+from botocore.exceptions import ClientError
+
+FILTER_FIELDS = {
+    "ComplianceStatus": lambda finding: (finding.get("Compliance") or {}).get("Status"),
+    "RecordState": lambda finding: finding.get("RecordState", "ACTIVE"),
+    "WorkflowStatus": lambda finding: (finding.get("Workflow") or {}).get("Status", "NEW"),
+}
+
+
+def _invalid_input(message):
+    return ClientError({"Error": {"Code": "InvalidInputException", "Message": message}}, "GetFindings")
+
+
+def _matches(finding, filters):
+    for name, conditions in (filters or {}).items():
+        value = FILTER_FIELDS[name](finding)
+        equals = [condition["Value"] for condition in conditions if condition["Comparison"] == "EQUALS"]
+        not_equals = [condition["Value"] for condition in conditions if condition["Comparison"] == "NOT_EQUALS"]
+        if equals and value not in equals or value in not_equals:
+            return False
+    return True
+
+
+class FakeSecurityHub:
+    """
+    securityhub client stand-in with batch_import_findings and get_findings.
+    """
+
+    def __init__(self):
+        self.findings = []
+        self.requests = []
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def batch_import_findings(self, Findings):
+        with self._lock:
+            self.findings.extend(Findings)
+        return {"SuccessCount": len(Findings), "FailedCount": 0, "FailedFindings": []}
+
+    def get_findings(self, Filters=None, MaxResults=100, NextToken=None):
+        if not 1 <= MaxResults <= 100:
+            raise _invalid_input("MaxResults must be a number between 1 and 100")
+        with self._lock:
+            self.requests.append(NextToken)
+            if NextToken is None:
+                offset = 0
+            elif NextToken in self._tokens:
+                offset = self._tokens[NextToken]
+            else:
+                raise _invalid_input("The next token is invalid or expired")
+            matching = [finding for finding in self.findings if _matches(finding, Filters)]
+            response = {"Findings": matching[offset:offset + MaxResults]}
+            if offset + MaxResults < len(matching):
+                token = uuid.uuid4().hex
+                self._tokens[token] = offset + MaxResults
+                response["NextToken"] = token
+        return response
+
+    def expire_tokens(self):
+        with self._lock:
+            self._tokens.clear()
@@ -0,0 +1,130 @@
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import index
+import metrics
+from adaptiveRetrieval import REQUERY_SUFFIX, AdaptiveRetrievalChain, AdaptiveRetriever
+from contextCompression import estimate_tokens
+from remediation import RemediationHandler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+FINDING = '[S3.4] S3 buckets should have server-side encryption enabled'
+
+S3_ROWS = ("ASR-Enabl eDefaultEncryption S3 S3 buckets should have server-si de encryption activated S3.4 S3.4 2.1.1")
+RELEASE_NOTES = "March 2023 Release 2.0.0: Added support for security controls and CIS v1.4.0 standards."
+INSTALL_GUIDE = "Deploy the admin stack in the Security Hub administrator account before the member stacks."
+
+
+def retrieval_results(*texts):
+    return {'retrievalResults': [{'content': {'text': text}, 'location': {}, 'score': 1.0 - i / 10.0}
+                                 for i, text in enumerate(texts)]}
+
+
+def answer(available):
+    return SimpleNamespace(remediation_available=available)
+
+
+@pytest.fixture
+def recorder():
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    token = metrics._CURRENT.set(recorder)
+    yield recorder
+    metrics._CURRENT.reset(token)
+
+
+def test_confident_results_stay_at_min_k(recorder):
+    client = MagicMock()
+    client.retrieve.return_value = retrieval_results(S3_ROWS, RELEASE_NOTES)
+
+    result = AdaptiveRetriever(client, 'KB', min_k=2, max_k=8).retrieve(FINDING)
+
+    assert not result.escalated and result.reason is None
+    assert client.retrieve.call_count == 1
+    assert client.retrieve.call_args.kwargs['retrievalConfiguration']['vectorSearchConfiguration']['numberOfResults'] == 2
+
+
+def test_low_confidence_results_escalate_with_a_requery(recorder):
+    client = MagicMock()
+    client.retrieve.side_effect = [retrieval_results(RELEASE_NOTES, INSTALL_GUIDE),
+                                   retrieval_results(S3_ROWS, RELEASE_NOTES)]
+
+    result = AdaptiveRetriever(client, 'KB', min_k=2, max_k=8).retrieve(FINDING)
+
+    assert result.escalated and result.reason == 'no_playbook' and result.k == 8
+    assert result.passages == [RELEASE_NOTES, INSTALL_GUIDE, S3_ROWS]
+    query = client.retrieve.call_args.kwargs
+    assert query['retrievalQuery']['text'] == FINDING + REQUERY_SUFFIX
+    assert query['retrievalConfiguration']['vectorSearchConfiguration']['numberOfResults'] == 8
+
+
+def test_false_answer_escalates_and_records_the_avoided_chain_2_call(recorder):
+    client = MagicMock()
+    client.retrieve.side_effect = [retrieval_results(S3_ROWS, RELEASE_NOTES),
+                                   retrieval_results(INSTALL_GUIDE, S3_ROWS)]
+    contexts = []
+
+    def answer_chain(inputs, config=None):
+        contexts.append(inputs['context'])
+        return answer(INSTALL_GUIDE in inputs['context'])
+    handler = SimpleNamespace(render_context=lambda finding, passages: "\n\n".join(passages))
+    chain = AdaptiveRetrievalChain(handler, AdaptiveRetriever(client, 'KB', min_k=2, max_k=8),
+                                   SimpleNamespace(invoke=answer_chain))
+
+    assert chain.invoke(FINDING).remediation_available
+    assert len(contexts) == 2
+    record = next(record for record in recorder.records if record.name == 'adaptive_retrieval')
+    assert record.values['ExtraRetrieveCalls'] == record.values['ExtraChain1Calls'] == 1
+    assert record.values['Chain2CallsAvoided'] == 1
+    assert record.values['FirstPassEscalations'] == 0
+    assert record.values['ExtraContextTokens'] > 0
+    assert record.properties['EscalationReason'] == 'low_confidence_output'
+
+
+def test_first_pass_escalation_records_the_extra_tokens_but_no_avoided_chain_2_call(recorder):
+    client = MagicMock()
+    client.retrieve.side_effect = [retrieval_results(RELEASE_NOTES, INSTALL_GUIDE),
+                                   retrieval_results(S3_ROWS, RELEASE_NOTES)]
+    contexts = []
+
+    def answer_chain(inputs, config=None):
+        contexts.append(inputs['context'])
+        return answer(S3_ROWS in inputs['context'])
+    handler = SimpleNamespace(render_context=lambda finding, passages: "\n\n".join(passages))
+    chain = AdaptiveRetrievalChain(handler, AdaptiveRetriever(client, 'KB', min_k=2, max_k=8),
+                                   SimpleNamespace(invoke=answer_chain))
+
+    assert chain.invoke(FINDING).remediation_available
+    # Chain 1 answers once, from the escalated passages
+    assert len(contexts) == 1
+    record = next(record for record in recorder.records if record.name == 'adaptive_retrieval')
+    assert record.values['ExtraRetrieveCalls'] == 1
+    assert record.values['ExtraChain1Calls'] == 0
+    # The first passages were never answered from, the runbook found is not credited to the escalation
+    assert record.values['FirstPassEscalations'] == 1
+    assert record.values['Chain2CallsAvoided'] == 0
+    assert 0 < record.values['ExtraContextTokens'] < estimate_tokens(contexts[0])
+    assert record.properties['EscalationReason'] == 'no_playbook'
+
+
+def test_adaptive_mode_builds_the_retrieval_chain_around_chain_1(recorder):
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    output = {'remediation_details': 'd', 'remediation_available': True, 'remediation_runbook': 'ASR-EnableDefaultEncryption',
+              'security_hub_finding_title': FINDING, 'resource_type': 'S3'}
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.side_effect = lambda *args, **kwargs: MagicMock()
+        handler = RemediationHandler(MODEL_ID, region='us-east-1')
+    handler.retrieval_mode = 'adaptive'
+    handler.bedrock_client.client.retrieve.return_value = retrieval_results(S3_ROWS, RELEASE_NOTES)
+    handler._llms['chain_1'] = RunnableLambda(lambda prompt: AIMessage(content=json.dumps(output)))
+
+    chain = handler.retrievalChain(index.prompt1, 'KB')
+
+    assert isinstance(chain, AdaptiveRetrievalChain)
+    assert chain.invoke(FINDING).remediation_runbook == 'ASR-EnableDefaultEncryption'
+    assert handler.bedrock_client.client.retrieve.call_count == 1
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import index
+
+
+class FakeChain:
+    def __init__(self, handler, result):
+        self.handler = handler
+        self.result = result
+
+    async def ainvoke(self, inputs, config=None):
+        self.handler.in_flight += 1
+        self.handler.max_in_flight = max(self.handler.max_in_flight, self.handler.in_flight)
+        try:
+            await asyncio.sleep(self.handler.delay)
+        finally:
+            self.handler.in_flight -= 1
+        self.handler.calls.append(inputs)
+        return self.result(inputs)
+
+
+class FakeHandler:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    def chain_config(self, stage):
+        return None
+
+    def retrievalChain(self, template, knowledge_id):
+        return FakeChain(self, lambda title: SimpleNamespace(
+            remediation_runbook='AWS-Runbook-' + title,
+            remediation_details='details',
+            remediation_available=True,
+            resource_type='S3 Bucket'
+        ))
+
+    def QAChain(self, template, stage=None):
+        return FakeChain(self, lambda inputs: 'Runbook for ' + inputs['sechub_finding'])
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def fake_handler(monkeypatch):
+    handler = FakeHandler()
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    return handler
+
+
+def batch_event(value):
+    return {
+        'actionGroup': 'remediation',
+        'apiPath': '/secHubRemediateBatch',
+        'httpMethod': 'POST',
+        'requestBody': {'content': {'application/json': {'properties': [
+            {'name': 'sechub_findings', 'type': 'array', 'value': value}
+        ]}}}
+    }
+
+
+def test_batch_returns_one_result_per_input_and_dedupes(fake_handler):
+    event = batch_event(json.dumps(['S3 finding', 'EC2 finding', 's3  finding']))
+
+    response = index.lambda_handler(event, FakeContext(900000))
+    body = json.loads(response['response']['responseBody']['application/json']['body'])
+
+    assert [item['sechub_finding'] for item in body] == ['S3 finding', 'EC2 finding', 's3  finding']
+    assert all(item['status'] == 'completed' for item in body)
+    assert body[0]['body'] == body[2]['body'] == 'Runbook for S3 finding'
+    # Two distinct findings, two chain calls each
+    assert len(fake_handler.calls) == 4
+
+
+def test_batch_accepts_array_value(fake_handler):
+    assert index.get_batch_findings(batch_event(['S3 finding', 'EC2 finding'])) == ['S3 finding', 'EC2 finding']
+
+
+@pytest.mark.parametrize('value', ['[S3 finding, EC2 finding]', '"S3 finding"', '{"title": "S3 finding"}', '[1, 2]'])
+def test_batch_rejects_anything_but_a_json_array_of_titles(fake_handler, value):
+    response = index.lambda_handler(batch_event(value), FakeContext(900000))
+
+    assert response['response']['httpStatusCode'] == 400
+    body = json.loads(response['response']['responseBody']['application/json']['body'])
+    assert 'JSON array' in body['error']
+    assert fake_handler.calls == []
+
+
+def test_batch_cache_calls_run_off_the_event_loop(fake_handler, monkeypatch):
+    class FakeCache:
+        stats = {}
+
+        def __init__(self):
+            self.threads = []
+
+        def get(self, *args):
+            self.threads.append(threading.get_ident())
+            return None
+
+        def put(self, *args):
+            self.threads.append(threading.get_ident())
+
+    cache = FakeCache()
+    monkeypatch.setattr(index, 'cache_enabled', True)
+    monkeypatch.setattr(index, 'get_remediation_cache', lambda: cache)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await index.arag_flow('S3 finding', 'KB')
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+
+    assert len(cache.threads) == 2
+    assert loop_thread not in cache.threads
+
+
+def test_batch_concurrency_is_bounded(fake_handler, monkeypatch):
+    monkeypatch.setattr(index, 'batch_max_concurrency', 2)
+    findings = ['finding {}'.format(i) for i in range(8)]
+
+    results = index.batch_rag_flow(findings, 'KB', FakeContext(900000))
+
+    assert len(results) == 8
+    assert fake_handler.max_in_flight == 2
+
+
+def test_batch_reports_findings_that_miss_the_time_budget(fake_handler, monkeypatch):
+    monkeypatch.setattr(index, 'batch_time_reserve_seconds', 0)
+    fake_handler.delay = 5
+
+    response = index.lambda_handler(batch_event('["S3 finding"]'), FakeContext(100))
+    body = json.loads(response['response']['responseBody']['application/json']['body'])
+
+    assert body[0]['status'] == 'timed_out'
+
+
+def test_abandoned_findings_are_unwound_before_the_loop_closes(monkeypatch):
+    monkeypatch.setattr(index, 'batch_time_reserve_seconds', 0)
+    unwound = []
+
+    async def slow_flow(sechub_finding, kb_id):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            # Cleanup that itself awaits, e.g. closing a client session
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            unwound.append(sechub_finding)
+            raise
+
+    monkeypatch.setattr(index, 'arag_flow', slow_flow)
+
+    results = index.batch_rag_flow(['S3 finding', 'EC2 finding'], 'KB', FakeContext(100))
+
+    assert all(isinstance(result, asyncio.TimeoutError) for result in results.values())
+    assert sorted(unwound) == ['EC2 finding', 'S3 finding']
+
+
+def test_empty_batch_returns_an_empty_list(fake_handler):
+    response = index.lambda_handler(batch_event('[]'), FakeContext(900000))
+
+    assert response['response']['httpStatusCode'] == 200
+    assert json.loads(response['response']['responseBody']['application/json']['body']) == []
@@ -0,0 +1,165 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+import index
+import commitQueue
+from commitQueue import CommitQueue, LocalCommitQueue, SqsCommitQueue, commit_queue_settings
+from gitHubCommit import GitHubCommitter
+
+NO_THROTTLE = {'seconds_between_requests': None, 'seconds_between_writes': None}
+YAML_RESPONSE = "Here is the template:\n```yaml\nResources: {}\n```\n"
+
+
+@pytest.fixture
+def committer(fake_github):
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.return_value.get_secret_value.return_value = {'SecretString': 'test-token'}
+        yield GitHubCommitter('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+
+
+@pytest.fixture
+def commit_queue(monkeypatch):
+    queue = CommitQueue()
+    monkeypatch.setattr(index, 'get_commit_queue', lambda: queue)
+    return queue
+
+
+def test_drain_coalesces_a_batch_into_one_commit(commit_queue, committer, fake_github):
+    first = commit_queue.enqueue('[S3.4] finding', 'S3/GenRem-S3.4.yaml', 'v1', 'S3')
+    second = commit_queue.enqueue('[EC2.6] finding', 'EC2/GenRem-EC2.6.yaml', 'ec2', 'EC2')
+    third = commit_queue.enqueue('S3.4 finding again', 'S3/GenRem-S3.4.yaml', 'v2', 'S3')
+    assert commit_queue.get_status(first)['status'] == 'pending'
+
+    [commit] = commit_queue.drain(committer)
+
+    assert fake_github.repo.commit_count() == 1
+    assert fake_github.repo.head_files() == {'S3/GenRem-S3.4.yaml': 'v2', 'EC2/GenRem-EC2.6.yaml': 'ec2'}
+    for artifact_id in (first, second, third):
+        status = commit_queue.get_status(artifact_id)
+        assert status['status'] == 'committed'
+        assert status['commit_sha'] == commit.sha
+
+    again = commit_queue.enqueue('[S3.4] finding', 'S3/GenRem-S3.4.yaml', 'v2', 'S3')
+    assert commit_queue.drain(committer) == [None]
+    assert commit_queue.get_status(again)['status'] == 'unchanged'
+    assert commit_queue.drain(committer) == []
+
+
+def test_failed_commit_is_recorded_and_raised(commit_queue):
+    class FailingCommitter:
+        def commit_contents(self, files, resource_types):
+            raise RuntimeError('branch protected')
+
+    artifact_id = commit_queue.enqueue('[S3.4] finding', 'S3/GenRem-S3.4.yaml', 'v1', 'S3')
+    with pytest.raises(RuntimeError):
+        commit_queue.drain(FailingCommitter())
+    status = commit_queue.get_status(artifact_id)
+    assert status['status'] == 'failed'
+    assert status['error'] == 'branch protected'
+
+
+def test_older_template_processed_late_does_not_revert_the_file(commit_queue, committer, fake_github):
+    older = commit_queue.enqueue('[S3.4] finding', 'S3/GenRem-S3.4.yaml', 'v1', 'S3')
+    newer = commit_queue.enqueue('S3.4 finding again', 'S3/GenRem-S3.4.yaml', 'v2', 'S3')
+    ec2 = commit_queue.enqueue('[EC2.6] finding', 'EC2/GenRem-EC2.6.yaml', 'ec2', 'EC2')
+    [(_, older_message), (_, newer_message), (_, ec2_message)] = commit_queue.queue.receive()
+
+    # E.g. the batch of the older template failed and was redelivered after the newer one was committed
+    commit = commit_queue.process([newer_message], committer)
+    late = commit_queue.process([older_message, ec2_message], committer)
+
+    assert fake_github.repo.head_files()['S3/GenRem-S3.4.yaml'] == 'v2'
+    assert fake_github.repo.head_files()['EC2/GenRem-EC2.6.yaml'] == 'ec2'
+    assert commit_queue.get_status(newer)['commit_sha'] == commit.sha
+    assert commit_queue.get_status(older)['status'] == 'superseded'
+    assert commit_queue.get_status(ec2)['commit_sha'] == late.sha
+
+    # A batch with nothing left to commit does not call GitHub
+    again = commit_queue.enqueue('[S3.4] finding', 'S3/GenRem-S3.4.yaml', 'v0', 'S3')
+    older_message['artifact_id'] = again
+    fake_github.requests.clear()
+    assert commit_queue.process([older_message], committer) is None
+    assert commit_queue.get_status(again)['status'] == 'superseded'
+    assert fake_github.requests == []
+
+
+def test_sqs_messages_are_grouped_by_file():
+    with patch('boto3.client') as mock_boto3_client:
+        queue = SqsCommitQueue('https://sqs/commits.fifo', region='us-east-1')
+        for artifact_id, file_path in (('a', 'S3 Bucket/GenRem-S3.4.yaml'), ('b', 'S3 Bucket/GenRem-S3.4.yaml'),
+                                       ('c', 'EC2/GenRem-EC2.6.yaml')):
+            queue.send({'artifact_id': artifact_id, 'file_path': file_path})
+    calls = [call.kwargs for call in mock_boto3_client.return_value.send_message.call_args_list]
+
+    assert [call['MessageDeduplicationId'] for call in calls] == ['a', 'b', 'c']
+    assert calls[0]['MessageGroupId'] == calls[1]['MessageGroupId'] != calls[2]['MessageGroupId']
+    assert ' ' not in calls[0]['MessageGroupId'] and len(calls[0]['MessageGroupId']) <= 128
+
+
+class FakeHandler:
+    def __init__(self, template):
+        self.template = template
+
+    def get_named_parameter(self, event, name):
+        return next(item for item in event["parameters"] if item["name"] == name)["value"]
+
+    def parse_yaml_code(self, string_output):
+        return self.template
+
+
+def agent_event(api_path, name, value):
+    return {'actionGroup': 'remediation', 'apiPath': api_path, 'httpMethod': 'GET',
+            'parameters': [{'name': name, 'type': 'string', 'value': value}]}
+
+
+def response_body(response):
+    return response['response']['responseBody']['application/json']['body']
+
+
+def test_async_mode_responds_before_the_commit(monkeypatch, commit_queue, committer, fake_github):
+    handler = FakeHandler('Resources: {}\n')
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'rag_flow', lambda sechub_finding, kb_id: (YAML_RESPONSE, 'S3'))
+    monkeypatch.setattr(index, 'commit_mode', 'async')
+    monkeypatch.setattr(index, 'get_github_committer', lambda repo: pytest.fail('agent path must not commit'))
+
+    body = response_body(index.lambda_handler(
+        agent_event('/secHubRemediate/{sechub_finding}', 'sechub_finding', '[S3.4] S3 buckets should be encrypted'), None))
+
+    assert 'S3/GenRem-S3.4.yaml' in body
+    [(_, message)] = list(commit_queue.queue.receive())
+    artifact_id = message['artifact_id']
+    assert artifact_id in body
+    assert message['content'] == 'Resources: {}\n'
+    status_event = agent_event('/secHubRemediationStatus/{artifact_id}', 'artifact_id', artifact_id)
+    assert json.loads(response_body(index.lambda_handler(status_event, None)))['status'] == 'pending'
+
+    # The SQS consumer receives the queued message as a record of its event
+    monkeypatch.setattr(index, 'get_github_committer', lambda repo: committer)
+    result = index.commit_queue_handler({'Records': [{'body': json.dumps(message)}]}, None)
+
+    assert result == {'commit': fake_github.repo.branches['main'], 'templates': 1}
+    status = json.loads(response_body(index.lambda_handler(status_event, None)))
+    assert status['status'] == 'committed'
+    assert status['commit_sha'] == fake_github.repo.branches['main']
+    assert fake_github.repo.head_files() == {'S3/GenRem-S3.4.yaml': 'Resources: {}\n',
+                                             'deploy/parameters/S3-GenRem-S3-4-params.json': '[]\n'}
+
+
+def test_status_of_unknown_artifact(commit_queue):
+    event = agent_event('/secHubRemediationStatus/{artifact_id}', 'artifact_id', 'nope')
+    assert json.loads(response_body(index.lambda_handler(event, None))) == {'artifact_id': 'nope', 'status': 'unknown'}
+
+
+def test_async_mode_needs_a_queue_unless_local_is_explicit(monkeypatch):
+    monkeypatch.delenv('COMMIT_QUEUE_URL', raising=False)
+    monkeypatch.setenv('COMMIT_STATUS_TABLE_NAME', 'status-table')
+    with pytest.raises(ValueError, match='COMMIT_QUEUE_URL'):
+        commit_queue_settings()
+
+    monkeypatch.setenv('COMMIT_QUEUE_URL', 'local')
+    monkeypatch.delenv('COMMIT_STATUS_TABLE_NAME')
+    monkeypatch.setattr(commitQueue, '_COMMIT_QUEUE', None)
+    assert isinstance(commitQueue.get_commit_queue().queue, LocalCommitQueue)
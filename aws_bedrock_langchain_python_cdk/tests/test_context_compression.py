@@ -0,0 +1,89 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import index
+import metrics
+from contextCompression import compress_context, estimate_tokens
+from remediation import RemediationHandler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+S3_ROWS = ("ASR-Confi gureS3Buc ketPublicAccessBlo ck S3 buckets should prohibit public read access S3.2 S3.2 2.1.5.2 "
+           "ASR-Enabl eDefaultEncryption S3 S3 buckets should have server-si de encryption activated S3.4 S3.4 2.1.1")
+RELEASE_NOTES = ("March 2023 Release 2.0.0: Added support for security controls and CIS v1.4.0 standards, five new "
+                 "remediations to FSBP standards and the service catalog AppRegistry integration. ") * 6
+FILLER = " ".join("word{}".format(i) for i in range(200))
+
+
+def test_keeps_the_spans_of_the_control_and_drops_unrelated_passages():
+    passages = [FILLER + " " + S3_ROWS + " " + FILLER, RELEASE_NOTES]
+
+    compressed = compress_context('[S3.4] S3 buckets should have server-side encryption enabled', passages, window=12)
+
+    assert 'ASR-Enabl eDefaultEncryption' in compressed.text
+    assert 'S3.4' in compressed.text
+    assert 'Release 2.0.0' not in compressed.text
+    assert 'word10 ' not in compressed.text
+    assert compressed.tokens_out < compressed.tokens_in / 4
+
+
+def test_drops_text_repeated_by_overlapping_chunks():
+    first = FILLER + " " + S3_ROWS
+    second = S3_ROWS + " CloudTrail log file validation should be enabled CloudTrail.4"
+
+    compressed = compress_context('[S3.4] S3 buckets should have server-side encryption enabled', [first, second])
+
+    assert compressed.text.count('ASR-Enabl eDefaultEncryption') == 1
+
+
+def test_falls_back_to_passages_in_retrieval_order_within_budget():
+    passages = ['passage one ' + FILLER, 'passage two ' + FILLER]
+
+    compressed = compress_context('Completely unrelated finding title', passages, token_budget=100)
+
+    assert compressed.text.startswith('passage one')
+    assert compressed.tokens_out <= 100
+    assert estimate_tokens(compressed.text) == compressed.tokens_out
+
+
+@pytest.fixture
+def handler():
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.side_effect = lambda *args, **kwargs: MagicMock()
+        handler = RemediationHandler(MODEL_ID, region='us-east-1')
+    # Compression is opt-in (CONTEXT_COMPRESSION=true)
+    assert handler.context_compression is False
+    handler.context_compression = True
+    yield handler
+
+
+def test_retrieval_chain_renders_the_compressed_context(handler):
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    handler.bedrock_client.client.retrieve.return_value = {'retrievalResults': [
+        {'content': {'text': FILLER + " " + S3_ROWS}, 'location': {}, 'score': 0.9},
+        {'content': {'text': RELEASE_NOTES}, 'location': {}, 'score': 0.5}]}
+    prompts = []
+    output = {'remediation_details': 'd', 'remediation_available': True, 'remediation_runbook': 'ASR-EnableDefaultEncryption',
+              'security_hub_finding_title': 't', 'resource_type': 'S3'}
+
+    def model(prompt):
+        prompts.append(prompt.to_string())
+        return AIMessage(content=json.dumps(output))
+    handler._llms['chain_1'] = RunnableLambda(model)
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    token = metrics._CURRENT.set(recorder)
+    try:
+        response = handler.retrievalChain(index.prompt1, 'KB').invoke('[S3.4] S3 buckets should have server-side encryption enabled')
+    finally:
+        metrics._CURRENT.reset(token)
+
+    assert response.remediation_runbook == 'ASR-EnableDefaultEncryption'
+    assert 'ASR-Enabl eDefaultEncryption' in prompts[0]
+    assert 'Release 2.0.0' not in prompts[0]
+    record = next(record for record in recorder.records if record.name == 'context_compression')
+    assert record.values['ContextTokensSaved'] == record.values['ContextTokensIn'] - record.values['ContextTokensOut'] > 0
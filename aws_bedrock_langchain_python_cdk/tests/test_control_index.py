@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+
+import index
+from controlIndex import ControlIndex, find_control_ids, get_control_index, title_key
+
+
+@pytest.fixture
+def control_index():
+    return ControlIndex.load()
+
+
+def test_bundled_index_maps_controls_to_playbooks(control_index):
+    assert control_index.controls['CloudTrail.1']['runbook'] == 'ASR-CreateCloudTrailMultiRegionTrail'
+    assert control_index.controls['S3.4']['runbook'] == 'ASR-EnableDefaultEncryptionS3'
+    assert control_index.controls['Config.1']['runbook'] == 'ASR-EnableAWSConfig'
+    assert control_index.controls['EC2.13']['runbook'] == 'AWS-DisablePublicAccessForSecurityGroup'
+    assert all(control['runbook'].startswith(('ASR-', 'AWS-')) for control in control_index.controls.values())
+
+
+@pytest.mark.parametrize('title, expected', [
+    ('[S3.4] S3 buckets should have server-side encryption enabled', ['S3.4']),
+    ('CloudTrail.1 CloudTrail should be enabled', ['CloudTrail.1']),
+    ('S3 buckets should block public access (s3.8)', ['s3.8']),
+    ('PCI.CloudTrail.2 encryption', []),
+    ('Ensure no security groups allow ingress from 0.0.0.0/0 to port 22', []),
+])
+def test_find_control_ids(title, expected):
+    assert find_control_ids(title) == expected
+
+
+def test_lookup_by_control_id_and_title(control_index):
+    assert control_index.lookup('[s3.4] anything')[0] == 'S3.4'
+    # The match ignores spacing and punctuation
+    assert control_index.lookup('Ensure CloudTrail trails are integrated with Amazon CloudWatch Logs.')[0] == 'CloudTrail.5'
+    assert title_key('SNS topics should be encrypted at-rest') == title_key('SNS topics should be encrypted at rest')
+    assert control_index.lookup('S3 buckets should have lifecycle policies') is None
+    assert control_index.lookup('[Foo.1] Unknown control') is None
+
+
+@pytest.mark.parametrize('control_id, title', [
+    ('S3.4', 'S3 buckets should have server-side encryption enabled'),
+    ('CloudTrail.1', 'CloudTrail should be enabled and configured with at least one multi-Region trail'),
+    ('CloudTrail.2', 'CloudTrail should have encryption at rest enabled'),
+    ('CloudTrail.5', 'Ensure CloudTrail trails are integrated with Amazon CloudWatch Logs'),
+    ('CloudWatch.1', 'Ensure a log metric filter and alarm exist for unauthorized API calls'),
+    ('CloudWatch.9', 'Ensure a log metric filter and alarm exist for AWS Config configuration changes'),
+    ('IAM.7', 'Password policies for IAM users should have strong configurations'),
+    ('RDS.5', 'RDS DB instances should be configured with multiple Availability Zones'),
+    ('SNS.2', 'Logging of delivery status should be enabled for notification messages sent to a topic'),
+])
+def test_security_hub_titles_are_indexed(control_index, control_id, title):
+    # Security Hub control titles, without the control ID
+    assert control_index.controls[control_id]['title'] == title
+    assert control_index.lookup(title)[0] == control_id
+
+
+def test_output_params_take_the_runbook_path(control_index):
+    output = control_index.get_output_params('[Lambda.1] Lambda function policies should prohibit public access')
+    assert output['remediation_available'] is True
+    assert output['remediation_runbook'] == 'ASR-RemoveLambdaPublicAccess'
+    assert output['resource_type'] == 'Lambda'
+    assert 'Lambda.1' in output['remediation_details']
+
+
+class FakeHandler:
+    def __init__(self):
+        self.templates = []
+
+    def chain_config(self, stage):
+        return None
+
+    def retrievalChain(self, template, knowledge_id):
+        raise AssertionError('chain 1 must be skipped for indexed controls')
+
+    def QAChain(self, template, stage=None):
+        self.templates.append(template)
+        return SimpleNamespace(invoke=lambda inputs, config=None: 'Use ' + inputs['remediation_runbook'])
+
+
+def test_rag_flow_skips_chain_1_on_index_match(monkeypatch):
+    handler = FakeHandler()
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    assert get_control_index() is not None
+
+    response, resource_type = index.rag_flow('[EC2.6] VPC flow logging should be enabled in all VPCs', 'KB')
+
+    assert response == 'Use ASR-EnableVPCFlowLogs'
+    assert resource_type == 'EC2'
+    assert handler.templates == [index.prompt3]
+
+
+def test_rag_flow_falls_back_to_chain_1(monkeypatch):
+    handler = FakeHandler()
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    with pytest.raises(AssertionError, match='chain 1'):
+        index.rag_flow('S3 buckets should have lifecycle policies', 'KB')
+
+
+def test_bundled_index_is_up_to_date_with_the_pdf(control_index):
+    pytest.importorskip('pypdf')
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+    from build_control_index import DEFAULT_PDF, build_index
+
+    built, skipped = build_index(DEFAULT_PDF)
+    assert skipped == []
+    assert built['controls'] == control_index.controls
+    assert built['titles'] == control_index.titles
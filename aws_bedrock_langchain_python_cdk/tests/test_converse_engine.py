@@ -0,0 +1,115 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import index
+from converseEngine import ConverseRemediationHandler, get_format_instructions, parse_sechub_output
+from remediation import RemediationHandler, clear_remediation_handlers, get_remediation_handler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+CHAIN1_OUTPUT = {
+    'remediation_details': 'Enables default encryption',
+    'remediation_available': False,
+    'remediation_runbook': 'no remediation available',
+    'security_hub_finding_title': 'S3 buckets should have server-side encryption enabled',
+    'resource_type': 'S3 Bucket',
+}
+
+
+def converse_reply(text):
+    return {'output': {'message': {'role': 'assistant', 'content': [{'text': text}]}},
+            'usage': {'inputTokens': 100, 'outputTokens': 20}}
+
+
+@pytest.fixture
+def handler():
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.side_effect = lambda *args, **kwargs: MagicMock()
+        yield ConverseRemediationHandler(MODEL_ID, region='us-east-1')
+
+
+def test_format_instructions_match_langchain_parser():
+    with patch('boto3.client'):
+        langchain_handler = RemediationHandler(MODEL_ID, region='us-east-1')
+    assert get_format_instructions() == langchain_handler.get_pydantic_parser().get_format_instructions()
+
+
+def test_parse_sechub_output_accepts_fenced_and_bare_json():
+    fenced = parse_sechub_output("Here you go:\n```json\n" + json.dumps(CHAIN1_OUTPUT) + "\n```")
+    bare = parse_sechub_output("Result: " + json.dumps(dict(CHAIN1_OUTPUT, remediation_available='true')))
+    assert fenced.resource_type == 'S3 Bucket'
+    assert fenced.remediation_available is False
+    assert bare.remediation_available is True
+
+
+def test_parse_sechub_output_rejects_missing_fields():
+    with pytest.raises(ValueError):
+        parse_sechub_output(json.dumps({'remediation_details': 'x'}))
+
+
+def test_retrieval_chain_renders_prompt1_with_retrieved_context(handler):
+    handler.bedrock_client.client.retrieve.return_value = {'retrievalResults': [
+        {'content': {'text': 'passage one'}}, {'content': {'text': 'passage two'}}]}
+    handler.bedrock_runtime.client.converse.return_value = converse_reply(json.dumps(CHAIN1_OUTPUT))
+
+    output = handler.retrievalChain(index.prompt1, 'KB').invoke(CHAIN1_OUTPUT['security_hub_finding_title'])
+
+    assert output.remediation_details == 'Enables default encryption'
+    retrieve = handler.bedrock_client.client.retrieve.call_args.kwargs
+    assert retrieve['knowledgeBaseId'] == 'KB'
+    assert retrieve['retrievalQuery'] == {'text': CHAIN1_OUTPUT['security_hub_finding_title']}
+    converse = handler.bedrock_runtime.client.converse.call_args.kwargs
+    prompt = converse['messages'][0]['content'][0]['text']
+    assert 'passage one\n\npassage two' in prompt
+    assert '<security_hub_finding_title>' + CHAIN1_OUTPUT['security_hub_finding_title'] in prompt
+    assert get_format_instructions() in prompt
+    assert converse['inferenceConfig'] == {'maxTokens': 4096, 'temperature': 0, 'topP': 0.99}
+
+
+def test_stream_yaml_generation_stops_at_closing_fence(handler):
+    stream = MagicMock()
+    chunks = ['Template:\n``', '`yaml\nResources: {}\n`', '``\nTrailing prose', ' never read']
+    stream.__iter__.return_value = iter([{'contentBlockDelta': {'delta': {'text': chunk}}} for chunk in chunks])
+    handler.bedrock_runtime.client.converse_stream.return_value = {'stream': stream}
+
+    text, stream_metrics = handler.stream_yaml_generation(index.prompt2, {'sechub_finding': 'f', 'remediation_details': 'd'})
+
+    assert text == 'Template:\n```yaml\nResources: {}\n```'
+    assert stream_metrics['stopped_early'] is True
+    stream.close.assert_called_once()
+
+
+def test_rag_flow_with_converse_engine(handler, monkeypatch):
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    monkeypatch.setattr(index, 'control_index_enabled', False)
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    handler.bedrock_client.client.retrieve.return_value = {'retrievalResults': []}
+    handler.bedrock_runtime.client.converse.side_effect = [
+        converse_reply(json.dumps(CHAIN1_OUTPUT)),
+        converse_reply("```yaml\nResources: {}\n```"),
+    ]
+
+    response, resource_type = index.rag_flow(CHAIN1_OUTPUT['security_hub_finding_title'], 'KB')
+
+    assert response == "```yaml\nResources: {}\n```"
+    assert resource_type == 'S3 Bucket'
+    prompt2 = handler.bedrock_runtime.client.converse.call_args.kwargs['messages'][0]['content'][0]['text']
+    assert 'Enables default encryption' in prompt2
+
+
+def test_registry_selects_engine():
+    clear_remediation_handlers()
+    try:
+        with patch('boto3.client'):
+            assert isinstance(get_remediation_handler(MODEL_ID, engine='converse'), ConverseRemediationHandler)
+            assert type(get_remediation_handler(MODEL_ID, engine='langchain')) is RemediationHandler
+            # The engines share a base class, the converse engine has none of the LangChain methods
+            assert not issubclass(ConverseRemediationHandler, RemediationHandler)
+            assert not hasattr(ConverseRemediationHandler, 'get_llm')
+            assert not hasattr(ConverseRemediationHandler, 'streamingChain')
+            with pytest.raises(ValueError):
+                get_remediation_handler(MODEL_ID, engine='unknown')
+    finally:
+        clear_remediation_handlers()
@@ -0,0 +1,159 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+import index
+from fake_securityhub import FakeSecurityHub
+from findingBackfill import BackfillCheckpoint, run_backfill
+from gitHubCommit import GitHubCommitter
+from test_batch_remediation import FakeChain, FakeHandler
+
+NO_THROTTLE = {'seconds_between_requests': None, 'seconds_between_writes': None}
+CONTROLS = [('S3.{}'.format(i), 'S3 control {} should pass'.format(i)) for i in range(1, 26)]
+
+
+def asff(number, control, title, status='FAILED', **fields):
+    finding = {
+        'SchemaVersion': '2018-10-08', 'Id': 'finding-{}'.format(number), 'ProductArn': 'arn:aws:securityhub:::product',
+        'GeneratorId': 'security-control/' + control, 'AwsAccountId': '111111111111', 'Types': ['Software and Configuration Checks'],
+        'CreatedAt': '2024-01-01T00:00:00Z', 'UpdatedAt': '2024-01-01T00:00:00Z', 'Severity': {'Label': 'MEDIUM'},
+        'Title': title, 'Description': title, 'Resources': [{'Type': 'AwsS3Bucket', 'Id': 'arn:aws:s3:::bucket-{}'.format(number)}],
+        'Compliance': {'Status': status, 'SecurityControlId': control},
+    }
+    finding.update(fields)
+    return finding
+
+
+@pytest.fixture
+def securityhub():
+    client = FakeSecurityHub()
+    # 10 failed findings per control, and findings the backfill must not pick up
+    client.batch_import_findings(Findings=[asff(i, *CONTROLS[i % len(CONTROLS)]) for i in range(250)])
+    client.batch_import_findings(Findings=[
+        asff(1000, 'EC2.1', 'Passed control', status='PASSED'),
+        asff(1001, 'EC2.2', 'Archived finding', RecordState='ARCHIVED'),
+        asff(1002, 'EC2.3', 'Suppressed finding', Workflow={'Status': 'SUPPRESSED'}),
+    ])
+    return client
+
+
+class Remediations:
+    """
+    remediate callable recording the titles of each chunk, failing for the titles in fail.
+    """
+
+    def __init__(self, fail=(), interrupt_after=None):
+        self.chunks = []
+        self.fail = set(fail)
+        self.interrupt_after = interrupt_after
+
+    def __call__(self, sechub_findings):
+        if self.interrupt_after is not None and len(self.chunks) == self.interrupt_after:
+            raise KeyboardInterrupt()
+        self.chunks.append(sechub_findings)
+        return [{'sechub_finding': title, 'status': 'failed' if title in self.fail else 'completed', 'body': 'b'}
+                for title in sechub_findings]
+
+    def titles(self):
+        return [title for chunk in self.chunks for title in chunk]
+
+
+def test_backfill_remediates_each_failed_control_once(securityhub, tmp_path):
+    remediations = Remediations()
+
+    report = run_backfill(securityhub, BackfillCheckpoint(str(tmp_path / 'checkpoint.json')), remediations, chunk_size=10)
+
+    assert report == {'findings': 250, 'controls': 25, 'remediated': 25, 'failed': {}}
+    assert sorted(remediations.titles()) == sorted('[{}] {}'.format(*control) for control in CONTROLS)
+    assert [len(chunk) for chunk in remediations.chunks] == [10, 10, 5]
+    # Three pages of 100 findings
+    assert len(securityhub.requests) == 3
+
+
+def test_interrupted_backfill_resumes_where_it_stopped(securityhub, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with pytest.raises(KeyboardInterrupt):
+        run_backfill(securityhub, BackfillCheckpoint(path), Remediations(interrupt_after=1), chunk_size=10)
+
+    remediations = Remediations(fail=['[S3.25] S3 control 25 should pass'])
+    report = run_backfill(securityhub, BackfillCheckpoint(path), remediations, chunk_size=10)
+
+    # The scan is not repeated and the first chunk is not remediated again
+    assert len(securityhub.requests) == 3
+    assert len(remediations.titles()) == 15
+    assert report['remediated'] == 24 and list(report['failed']) == ['S3.25']
+
+    # Failed controls are retried by the next run
+    remediations = Remediations()
+    report = run_backfill(securityhub, BackfillCheckpoint(path), remediations, chunk_size=10)
+    assert remediations.titles() == ['[S3.25] S3 control 25 should pass']
+    assert report['remediated'] == 25 and report['failed'] == {}
+
+
+def test_scan_starts_over_when_the_saved_token_expired(securityhub, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = BackfillCheckpoint(path)
+    response = securityhub.get_findings(Filters={'ComplianceStatus': [{'Value': 'FAILED', 'Comparison': 'EQUALS'}]})
+    checkpoint.state['next_token'] = response['NextToken']
+    checkpoint.state['controls'] = {'S3.1': {'sechub_finding': '[S3.1] S3 control 1 should pass', 'findings': 4}}
+    checkpoint.save()
+    securityhub.expire_tokens()
+
+    report = run_backfill(securityhub, BackfillCheckpoint(path), Remediations(), chunk_size=10)
+
+    assert report['findings'] == 250 and report['controls'] == 25
+
+
+class TemplateHandler(FakeHandler):
+    """
+    Generates a template (chain 2) for every finding.
+    """
+
+    def retrievalChain(self, template, knowledge_id):
+        return FakeChain(self, lambda title: SimpleNamespace(
+            remediation_runbook='no remediation available', remediation_details='details',
+            remediation_available=False, resource_type='S3 Bucket'))
+
+    def QAChain(self, template, stage=None):
+        return FakeChain(self, lambda inputs: "```yaml\nDescription: {}\nResources: {{}}\n```".format(inputs['sechub_finding']))
+
+    def parse_yaml_code(self, string_output):
+        return string_output.split("```yaml")[1].split("```")[0]
+
+
+def test_backfill_commits_each_chunk_through_the_github_committer(securityhub, tmp_path, fake_github, monkeypatch):
+    handler = TemplateHandler(delay=0)
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.return_value.get_secret_value.return_value = {'SecretString': 'test-token'}
+        committer = GitHubCommitter('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+    monkeypatch.setattr(index, 'get_github_committer', lambda repo: committer)
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'commit_mode', 'sync')
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    monkeypatch.setattr(index, 'control_index_enabled', False)
+
+    report = run_backfill(securityhub, BackfillCheckpoint(str(tmp_path / 'checkpoint.json')),
+                          lambda titles: index.remediate_findings(handler, titles, None), chunk_size=10)
+
+    assert report['remediated'] == 25
+    assert fake_github.repo.commit_count() == 3
+    files = fake_github.repo.head_files()
+    assert 'S3 Bucket/GenRem-S3.25.yaml' in files and 'deploy/parameters/S3-Bucket-GenRem-S3-25-params.json' in files
+
+
+def test_backfill_requests_are_valid_for_the_securityhub_api(tmp_path):
+    moto = pytest.importorskip('moto')
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client('securityhub', region_name='us-east-1')
+        client.enable_security_hub()
+        # moto ignores GetFindings filters, so only failed findings are imported
+        client.batch_import_findings(Findings=[asff(i, *CONTROLS[i % 3]) for i in range(120)])
+
+        report = run_backfill(client, BackfillCheckpoint(str(tmp_path / 'checkpoint.json')), Remediations())
+
+    assert (report['findings'], report['controls'], report['remediated']) == (120, 3, 3)
+    assert json.load(open(str(tmp_path / 'checkpoint.json')))['scan_complete']
@@ -0,0 +1,113 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import findingEvents
+import index
+import metrics
+from findingEvents import RecentFindings, coalesce_finding_events, finding_title
+from test_batch_remediation import FakeContext, FakeHandler
+
+S3_TITLE = 'S3 general purpose buckets should have server-side encryption enabled'
+EC2_TITLE = 'EC2 instances should use Instance Metadata Service Version 2 (IMDSv2)'
+
+
+def asff(title, control=None, resource='arn:aws:s3:::bucket', **fields):
+    finding = {'Title': title, 'Resources': [{'Id': resource}], 'Compliance': {'Status': 'FAILED'}}
+    if control:
+        finding['Compliance']['SecurityControlId'] = control
+    finding.update(fields)
+    return finding
+
+
+def sqs_record(message_id, *findings):
+    event = {'source': 'aws.securityhub', 'detail-type': 'Security Hub Findings - Imported',
+             'detail': {'findings': list(findings)}}
+    return {'messageId': message_id, 'body': json.dumps(event)}
+
+
+def burst():
+    return [
+        sqs_record('m1', asff(S3_TITLE, 'S3.4', 'arn:aws:s3:::logs-111111111111')),
+        sqs_record('m2', asff(EC2_TITLE, 'EC2.8', 'arn:aws:ec2:us-east-1:111111111111:instance/i-0123456789abcdef0')),
+        sqs_record('m3', asff(S3_TITLE, 'S3.4', 'arn:aws:s3:::data-222222222222'),
+                   asff(S3_TITLE, 'S3.4', 'arn:aws:s3:::web-222222222222')),
+        sqs_record('m4', asff(EC2_TITLE, GeneratorId='security-control/EC2.8')),
+        sqs_record('m5', asff('Unusual API calls from a known malicious IP address')),
+    ]
+
+
+def test_burst_is_coalesced_by_control_id():
+    windows = coalesce_finding_events(burst() + [{'messageId': 'm6', 'body': 'not json'}])
+
+    assert [(window.key, window.findings, window.message_ids) for window in windows] == [
+        ('S3.4', 3, ['m1', 'm3']),
+        ('EC2.8', 2, ['m2', 'm4']),
+        ('unusual api calls from a known malicious ip address', 1, ['m5']),
+    ]
+    assert windows[0].sechub_finding == '[S3.4] ' + S3_TITLE
+
+
+def test_control_id_falls_back_to_the_standard_control():
+    finding = asff('1.4 Ensure no root user access key exists', ProductFields={'ControlId': 'IAM.4'})
+    assert finding_title(finding) == '[IAM.4] 1.4 Ensure no root user access key exists'
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    handler = FakeHandler(delay=0)
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(index, 'get_remediation_handler', lambda modelId: handler)
+    monkeypatch.setattr(index, 'cache_enabled', False)
+    monkeypatch.setattr(index, 'control_index_enabled', False)
+    monkeypatch.setattr(findingEvents, '_RECENT_FINDINGS', RecentFindings(900, clock=lambda: clock.now))
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    monkeypatch.setattr(metrics, 'start_request', lambda **properties: recorder)
+    return SimpleNamespace(handler=handler, clock=clock, recorder=recorder)
+
+
+def remediated_findings(handler):
+    return sorted(inputs['sechub_finding'] for inputs in handler.calls if isinstance(inputs, dict))
+
+
+def test_remediation_runs_once_per_control_within_the_window(ingestion):
+    response = index.finding_events_handler({'Records': burst()}, FakeContext(900000))
+
+    assert response == {'batchItemFailures': []}
+    assert remediated_findings(ingestion.handler) == ['Unusual API calls from a known malicious IP address',
+                                                      '[EC2.8] ' + EC2_TITLE, '[S3.4] ' + S3_TITLE]
+    emf = [json.loads(line) for line in ingestion.recorder.stream.getvalue().splitlines()]
+    record = next(document for document in emf if document['Stage'] == 'finding_ingestion')
+    assert (record['IngestedEvents'], record['IngestedFindings'], record['RemediationRuns']) == (5, 6, 3)
+
+    # Later findings of the same controls are skipped until the window has passed
+    del ingestion.handler.calls[:]
+    index.finding_events_handler({'Records': burst()[:2]}, FakeContext(900000))
+    assert ingestion.handler.calls == []
+    ingestion.clock.now = 900
+    index.finding_events_handler({'Records': burst()[:2]}, FakeContext(900000))
+    assert remediated_findings(ingestion.handler) == ['[EC2.8] ' + EC2_TITLE, '[S3.4] ' + S3_TITLE]
+
+
+def test_messages_of_failed_controls_are_reported_for_redelivery(ingestion, monkeypatch):
+    retrieval_chain = ingestion.handler.retrievalChain
+
+    def failing_retrieval_chain(template, knowledge_id):
+        chain = retrieval_chain(template, knowledge_id)
+        result = chain.result
+
+        def fail_s3(title):
+            if title.startswith('[S3.4]'):
+                raise RuntimeError('model unavailable')
+            return result(title)
+        chain.result = fail_s3
+        return chain
+    monkeypatch.setattr(ingestion.handler, 'retrievalChain', failing_retrieval_chain)
+
+    response = index.finding_events_handler({'Records': burst()}, FakeContext(900000))
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'm1'}, {'itemIdentifier': 'm3'}]}
+    assert not findingEvents.get_recent_findings().is_recent('S3.4')
+    assert findingEvents.get_recent_findings().is_recent('EC2.8')
@@ -0,0 +1,58 @@
+import pytest
+
+from findingKey import canonical_finding_title, find_control_id, finding_filename, finding_key
+from remediationCache import LocalCacheStore, RemediationCache
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+
+@pytest.mark.parametrize('title', [
+    '[S3.4] S3 buckets should have server-side encryption enabled',
+    'S3.4 S3 buckets should have server-side encryption enabled',
+    '[s3.4]  S3 buckets should have server-side encryption enabled.',
+    'S3 buckets should have server-side encryption enabled (S3.4)',
+    '[S3.4] S3 general purpose buckets should have server-side encryption enabled - arn:aws:s3:::my-bucket',
+])
+def test_control_findings_share_the_control_key(title):
+    assert finding_key(title) == 'S3.4'
+    assert finding_filename(title) == 'S3.4'
+    assert canonical_finding_title(title).startswith('[S3.4] ')
+
+
+def test_volatile_identifiers_are_stripped():
+    title = ('S3 buckets should have  server-side encryption enabled. arn:aws:s3:::my-bucket '
+             'in account 123456789012 us-east-1')
+    assert canonical_finding_title(title) == 'S3 buckets should have server-side encryption enabled'
+    assert finding_key(title) == 's3 buckets should have server-side encryption enabled'
+    assert canonical_finding_title('EC2 instance i-0abcdef1234567890 should not have a public IPv4 address') == \
+        'EC2 instance should not have a public IPv4 address'
+    assert canonical_finding_title('Lambda function policies should prohibit public access (region: eu-west-2)') == \
+        'Lambda function policies should prohibit public access'
+
+
+def test_versions_and_cidrs_are_kept():
+    assert find_control_id('Load balancers should only allow TLSv1.2') is None
+    assert canonical_finding_title('Ensure no security groups allow ingress from 0.0.0.0/0 to port 22') == \
+        'Ensure no security groups allow ingress from 0.0.0.0/0 to port 22'
+    assert finding_filename('Ensure no security groups allow ingress from 0.0.0.0/0 to port 22') == \
+        'ensure-no-security-groups-allow-ingress-from-0.0.0.0-0-to-port-22'
+
+
+def test_unknown_bracketed_control_is_kept():
+    assert canonical_finding_title('[Foo.1] Unknown control in region eu-west-2') == '[Foo.1] Unknown control'
+    assert finding_key('[Foo.1] Unknown control') == 'Foo.1'
+
+
+def test_long_filenames_are_shortened_with_a_hash():
+    title = 'Resources should be configured ' + 'very ' * 40 + 'carefully'
+    filename = finding_filename(title)
+    assert len(filename) <= 100
+    assert filename != finding_filename(title + ' indeed')
+    assert '/' not in finding_filename('Ensure a/b paths are safe')
+
+
+def test_equivalent_findings_share_a_cache_entry():
+    cache = RemediationCache(store=LocalCacheStore())
+    cache.put('[S3.4] S3 buckets should have server-side encryption enabled', MODEL_ID, 'KB', {'resource_type': 'S3'}, 'r')
+    assert cache.get('S3 general purpose buckets should have server-side encryption enabled (s3.4) '
+                     'for 123456789012', MODEL_ID, 'KB') is not None
@@ -0,0 +1,185 @@
+from unittest.mock import patch
+
+import pytest
+from github import GithubException
+
+from gitHubCommit import GitHubCommitter, clear_github_committers, get_github_committer, git_blob_sha, template_file_path
+
+# PyGithub spaces out requests to respect GitHub's secondary rate limits; not needed locally
+NO_THROTTLE = {'seconds_between_requests': None, 'seconds_between_writes': None}
+
+
+@pytest.fixture
+def committer(fake_github):
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.return_value.get_secret_value.return_value = {'SecretString': 'test-token'}
+        yield GitHubCommitter('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+
+
+def commit_templates(committer, templates):
+    """
+    Commit (filename, file_content, resource_type) templates at their template file paths.
+    """
+    files = {template_file_path(resource_type, filename): content for filename, content, resource_type in templates}
+    return committer.commit_contents(files, [resource_type for _, _, resource_type in templates])
+
+
+def test_commit_creates_then_updates(committer, fake_github):
+    commit, file_paths = commit_templates(committer, [('S3Finding', 'v1', 'S3 Bucket')])
+    assert file_paths == ['S3 Bucket/GenRem-S3Finding.yaml']
+    assert commit.sha == fake_github.repo.branches['main']
+
+    commit_templates(committer, [('S3Finding', 'v2', 'S3 Bucket')])
+    assert fake_github.repo.head_files() == {'S3 Bucket/GenRem-S3Finding.yaml': 'v2'}
+
+
+def test_commit_creates_a_single_commit(committer, fake_github):
+    templates = [
+        ('S3Finding', 's3 template', 'S3 Bucket'),
+        ('EC2Finding', 'ec2 template', 'EC2 Instance'),
+        ('IAMFinding', 'iam template', 'IAM Role'),
+    ]
+
+    commit, file_paths = commit_templates(committer, templates)
+
+    assert file_paths == ['S3 Bucket/GenRem-S3Finding.yaml', 'EC2 Instance/GenRem-EC2Finding.yaml', 'IAM Role/GenRem-IAMFinding.yaml']
+    assert fake_github.repo.branches['main'] == commit.sha
+    assert fake_github.repo.commit_count() == 1
+    assert fake_github.repo.head_files() == {
+        'S3 Bucket/GenRem-S3Finding.yaml': 's3 template',
+        'EC2 Instance/GenRem-EC2Finding.yaml': 'ec2 template',
+        'IAM Role/GenRem-IAMFinding.yaml': 'iam template',
+    }
+    # One tree, one commit and one ref update regardless of the number of files
+    assert fake_github.count('POST', '/git/trees$') == 1
+    assert fake_github.count('POST', '/git/commits$') == 1
+    assert fake_github.count('PATCH', '/git/refs?/heads/main$') == 1
+    assert fake_github.count('PUT', '/contents/') == 0
+
+
+def test_commit_keeps_existing_files(committer, fake_github):
+    fake_github.repo.push({'README.md': 'readme'})
+    commit_templates(committer, [('S3Finding', 's3 template', 'S3 Bucket')])
+    assert fake_github.repo.head_files()['README.md'] == 'readme'
+
+
+def test_commit_retries_when_branch_moves(committer, fake_github):
+    def move_branch_once(method, path):
+        if method == 'PATCH' and fake_github.before_request is not None:
+            fake_github.before_request = None
+            fake_github.repo.push({'other.yaml': 'concurrent change'})
+    fake_github.before_request = move_branch_once
+
+    commit, _ = commit_templates(committer, [('S3Finding', 's3 template', 'S3 Bucket')])
+
+    assert fake_github.repo.branches['main'] == commit.sha
+    assert fake_github.repo.head_files() == {'other.yaml': 'concurrent change', 'S3 Bucket/GenRem-S3Finding.yaml': 's3 template'}
+    assert fake_github.count('PATCH', '/git/refs?/heads/main$') == 2
+
+
+def test_commit_gives_up_after_max_attempts(committer, fake_github):
+    fake_github.before_request = lambda method, path: method == 'PATCH' and fake_github.repo.push({'other.yaml': path})
+
+    with pytest.raises(GithubException) as error:
+        committer.create_tree_commit({'a.yaml': 'a'}, 'message', max_attempts=2)
+    assert error.value.status == 422
+
+
+def test_git_blob_sha_matches_github():
+    # `printf 'hello\n' | git hash-object --stdin`
+    assert git_blob_sha('hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+
+def test_commit_skips_identical_content(committer, fake_github):
+    commit_templates(committer, [('S3Finding', 'same', 'S3 Bucket')])
+    fake_github.requests.clear()
+
+    commit, file_paths = commit_templates(committer, [('S3Finding', 'same', 'S3 Bucket')])
+
+    assert commit is None
+    assert file_paths == ['S3 Bucket/GenRem-S3Finding.yaml']
+    assert fake_github.repo.commit_count() == 1
+    # Answered from the cached listing of the unchanged head, after a single ref lookup
+    assert fake_github.requests == [('GET', '/repos/test-owner/test-repo/git/ref/heads/main')]
+
+
+def test_branch_is_listed_once_for_many_files(committer, fake_github):
+    fake_github.repo.push({'S3 Bucket/GenRem-A.yaml': 'a', 'S3 Bucket/GenRem-B.yaml': 'b', 'S3 Bucket/notes.md': 'notes'})
+
+    for template in [('A', 'a', 'S3 Bucket'), ('B', 'b2', 'S3 Bucket'), ('C', 'c', 'S3 Bucket')]:
+        commit_templates(committer, [template])
+
+    assert fake_github.count('GET', '/git/trees/') == 1
+    assert fake_github.count('GET', '/contents/') == 0
+    head_sha, shas = committer.branch_files
+    assert head_sha == fake_github.repo.branches['main']
+    assert set(shas) == {'S3 Bucket/GenRem-A.yaml', 'S3 Bucket/GenRem-B.yaml', 'S3 Bucket/GenRem-C.yaml'}
+    assert fake_github.repo.head_files()['S3 Bucket/GenRem-B.yaml'] == 'b2'
+    assert fake_github.repo.commit_count() == 3
+
+
+def test_commits_from_other_containers_are_seen(committer, fake_github):
+    commit_templates(committer, [('A', 'a', 'S3 Bucket')])
+    # Another container, or the commit queue consumer, changes the file
+    fake_github.repo.push({'S3 Bucket/GenRem-A.yaml': 'other'})
+
+    commit, _ = commit_templates(committer, [('A', 'a', 'S3 Bucket')])
+
+    assert commit is not None
+    assert fake_github.repo.head_files()['S3 Bucket/GenRem-A.yaml'] == 'a'
+
+
+def test_commit_skips_unchanged_files(committer, fake_github):
+    fake_github.repo.push({'S3 Bucket/GenRem-S3Finding.yaml': 's3 template'})
+    templates = [('S3Finding', 's3 template', 'S3 Bucket')]
+
+    commit, file_paths = commit_templates(committer, templates)
+
+    assert commit is None
+    assert file_paths == ['S3 Bucket/GenRem-S3Finding.yaml']
+    assert fake_github.count('POST', '/git/') == 0
+
+    templates.append(('EC2Finding', 'ec2 template', 'EC2 Instance'))
+    commit, _ = commit_templates(committer, templates)
+    assert commit is not None
+    assert fake_github.repo.commit_count() == 2
+
+
+def test_committer_is_cached_per_container(fake_github):
+    clear_github_committers()
+    with patch('boto3.client') as mock_boto3_client:
+        secrets = mock_boto3_client.return_value
+        secrets.get_secret_value.return_value = {'SecretString': 'test-token'}
+        first = get_github_committer('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+        commit_templates(first, [('A', 'a', 'S3 Bucket')])
+        fake_github.requests.clear()
+
+        second = get_github_committer('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+        commit_templates(second, [('B', 'b', 'S3 Bucket')])
+
+    clear_github_committers()
+    assert second is first
+    assert secrets.get_secret_value.call_count == 1
+    # Only the commit itself: no repo metadata or contents lookups
+    assert [path for method, path in fake_github.requests if method == 'GET' and '/git/' not in path] == []
+    assert fake_github.count('POST', '/git/commits$') == 1
+
+
+def test_rotated_token_is_fetched_again_on_401(committer, fake_github):
+    committer.client.get_secret_value.return_value = {'SecretString': 'rotated-token'}
+    fake_github.valid_tokens = {'rotated-token'}
+
+    commit, _ = commit_templates(committer, [('A', 'a', 'S3 Bucket')])
+
+    assert commit is not None
+    assert committer.oauth_token == 'rotated-token'
+    assert fake_github.count('GET', '/repos/test-owner/test-repo$') == 1
+
+
+def test_token_is_refreshed_after_ttl(committer, fake_github):
+    committer.token_ttl_seconds = 0
+    committer.client.get_secret_value.return_value = {'SecretString': 'new-token'}
+
+    commit_templates(committer, [('A', 'a', 'S3 Bucket')])
+
+    assert fake_github.tokens_seen[-1] == 'new-token'
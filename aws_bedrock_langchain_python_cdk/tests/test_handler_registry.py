@@ -0,0 +1,35 @@
+import pytest
+from remediation import RemediationHandler, clear_remediation_handlers, get_remediation_handler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    clear_remediation_handlers()
+    yield
+    clear_remediation_handlers()
+
+
+def test_registry_returns_same_handler_for_model_and_region():
+    handler = get_remediation_handler(MODEL_ID)
+    assert isinstance(handler, RemediationHandler)
+    assert get_remediation_handler(MODEL_ID) is handler
+    assert get_remediation_handler(MODEL_ID, region='us-east-1') is handler
+
+
+def test_registry_keys_on_model_and_region():
+    handler = get_remediation_handler(MODEL_ID)
+    assert get_remediation_handler('anthropic.claude-3-haiku-20240307-v1:0') is not handler
+    assert get_remediation_handler(MODEL_ID, region='eu-west-1') is not handler
+
+
+def test_chains_are_built_once_per_handler():
+    handler = get_remediation_handler(MODEL_ID)
+    retrieval_chain = handler.retrievalChain('{context} {$security_hub_finding_title} {format_instructions}', 'KB1')
+    qa_chain = handler.QAChain('{sechub_finding}')
+
+    assert handler.retrievalChain('{context} {$security_hub_finding_title} {format_instructions}', 'KB1') is retrieval_chain
+    assert handler.retrievalChain('{context} {$security_hub_finding_title} {format_instructions}', 'KB2') is not retrieval_chain
+    assert handler.QAChain('{sechub_finding}') is qa_chain
+    assert handler.get_llm() is handler.get_llm()
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+LAMBDA_CODE_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambda', 'code', 'langchain')
+
+
+def test_index_import_defers_langchain_and_github():
+    # A fresh interpreter, the test process has already imported everything
+    code = "import sys, json, index; print(json.dumps(sorted(m for m in ('langchain', 'langchain_core', 'langchain_community', 'pydantic', 'github') if m in sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=LAMBDA_CODE_DIR, env=dict(os.environ),
+                            capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_converse_engine_never_loads_langchain():
+    code = (
+        "import sys, json, index\n"
+        "handler = index.get_remediation_handler(index.modelId)\n"
+        "handler.retrievalChain(index.prompt1, index.kb_id)\n"
+        "handler.QAChain(index.prompt2)\n"
+        "print(json.dumps(sorted(m for m in ('langchain', 'langchain_core', 'langchain_community', 'pydantic') if m in sys.modules)))"
+    )
+    env = dict(os.environ, REMEDIATION_ENGINE='converse')
+    result = subprocess.run([sys.executable, '-c', code], cwd=LAMBDA_CODE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pytest
+
+import remediation
+from localRetriever import DEFAULT_INDEX_PATH, Bm25Index, LocalKnowledgeBaseClient, tokenize, write_index
+from remediation import RemediationHandler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+CHUNKS = [
+    {'text': 'ASR-EnableDefaultEncryptionS3 enables default server-side encryption on S3 buckets.', 'source': 'asr.pdf', 'page': 3},
+    {'text': 'ASR-CreateCloudTrailMultiRegionTrail creates a multi-Region CloudTrail trail.', 'source': 'asr.pdf', 'page': 4},
+    {'text': 'VPC flow logs capture IP traffic going to and from network interfaces in a VPC.', 'source': 'vpc.txt', 'page': 1},
+    {'text': 'Amazon S3 buckets store objects. Bucket encryption protects objects at rest in S3.', 'source': 'vpc.txt', 'page': 1},
+]
+
+
+@pytest.fixture
+def bm25_index(tmp_path):
+    path = tmp_path / 'kb.bm25'
+    write_index(str(path), CHUNKS)
+    return Bm25Index(str(path))
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize('S3 buckets should have server-side encryption enabled') == [
+        's3', 'buckets', 'server', 'side', 'encryption', 'enabled']
+
+
+def test_search_ranks_matching_chunks(bm25_index):
+    results = bm25_index.search('S3 buckets should have server-side encryption enabled', k=2)
+    assert [doc_id for _, doc_id in results] == [0, 3]
+    assert results[0][0] > results[1][0]
+    assert bm25_index.search('CloudTrail should be enabled', k=4)[0][1] == 1
+    assert bm25_index.search('unrelated words only') == []
+    assert bm25_index.chunk(2) == CHUNKS[2]
+
+
+def test_retrieve_returns_knowledge_base_response_shape(bm25_index):
+    response = LocalKnowledgeBaseClient(bm25_index).retrieve(
+        retrievalQuery={'text': 'VPC flow logging'},
+        knowledgeBaseId='TESTKBID',
+        retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 1, 'overrideSearchType': 'HYBRID'}},
+    )
+    [result] = response['retrievalResults']
+    assert result['content']['text'] == CHUNKS[2]['text']
+    assert result['location'] == {'type': 'CUSTOM', 'customDocumentLocation': {'id': 'vpc.txt#page=1'}}
+    assert result['score'] > 0
+
+
+def test_langchain_retriever_accepts_local_client(bm25_index):
+    from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
+
+    retriever = AmazonKnowledgeBasesRetriever(
+        knowledge_base_id='TESTKBID',
+        retrieval_config={'vectorSearchConfiguration': {'numberOfResults': 2}},
+        client=LocalKnowledgeBaseClient(bm25_index),
+    )
+    documents = retriever.invoke('S3 buckets should have server-side encryption enabled')
+    assert [document.page_content for document in documents] == [CHUNKS[0]['text'], CHUNKS[3]['text']]
+    assert documents[0].metadata['location']['customDocumentLocation']['id'] == 'asr.pdf#page=3'
+
+
+def test_handler_uses_local_client_when_selected(monkeypatch, tmp_path):
+    import localRetriever
+    path = tmp_path / 'kb.bm25'
+    write_index(str(path), CHUNKS)
+    monkeypatch.setenv('LOCAL_INDEX_PATH', str(path))
+    monkeypatch.setattr(localRetriever, '_CLIENT', None)
+    with patch('boto3.client'):
+        handler = RemediationHandler(MODEL_ID, region='us-east-1')
+
+    assert handler.get_knowledge_base_client() is handler.bedrock_client
+    monkeypatch.setattr(remediation, 'RETRIEVER', 'local')
+    client = handler.get_knowledge_base_client()
+    assert isinstance(client, LocalKnowledgeBaseClient)
+    assert client.index.doc_count == len(CHUNKS)
+
+
+def test_bundled_index_finds_asr_playbooks():
+    bm25_index = Bm25Index(DEFAULT_INDEX_PATH)
+    results = bm25_index.search('S3 general purpose buckets should have server-side encryption enabled', k=4)
+    assert results
+    assert all(bm25_index.chunk(doc_id)['source'] for _, doc_id in results)
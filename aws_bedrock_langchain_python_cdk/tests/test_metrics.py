@@ -0,0 +1,69 @@
+import io
+import json
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
+
+import metrics
+
+
+def test_stage_records_are_written_as_emf_lines():
+    stream = io.StringIO()
+    recorder = metrics.MetricsRecorder(namespace="Test", properties={"ApiPath": "/secHubRemediate"}, stream=stream)
+    with recorder.stage("chain_1") as stage:
+        stage.add("InputTokens", 10)
+        stage.add("InputTokens", 5)
+        stage.set_property("CacheOutcome", "miss")
+    recorder.flush()
+
+    document = json.loads(stream.getvalue())
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["Stage"]]
+    assert {metric["Name"]: metric["Unit"] for metric in directive["Metrics"]} == {
+        "InputTokens": "Count", "Duration": "Milliseconds"}
+    assert document["Stage"] == "chain_1"
+    assert document["ApiPath"] == "/secHubRemediate"
+    assert document["CacheOutcome"] == "miss"
+    assert document["InputTokens"] == 15
+    assert document["Duration"] >= 0
+    assert recorder.records == []
+
+
+def test_failed_stage_is_recorded_with_its_error():
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    with pytest.raises(ValueError):
+        with recorder.stage("yaml_parse"):
+            raise ValueError("no yaml")
+    assert recorder.records[0].properties["Error"] == "ValueError"
+    assert "Duration" in recorder.records[0].values
+
+
+def test_callbacks_count_tokens_and_time_retrieval():
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    with recorder.stage("chain_1") as stage:
+        handler = stage.config["callbacks"][0]
+        run_id = uuid.uuid4()
+        handler.on_retriever_start({}, "query", run_id=run_id)
+        handler.on_retriever_end([Document(page_content="a"), Document(page_content="b")], run_id=run_id)
+        handler.on_llm_end(LLMResult(generations=[], llm_output={"usage": {"prompt_tokens": 120, "completion_tokens": 30}}))
+
+    retrieval, chain = recorder.records
+    assert retrieval.name == "kb_retrieval"
+    assert retrieval.values["RetrievedDocuments"] == 2
+    assert chain.values["RetrievedDocuments"] == 2
+    assert chain.values["InputTokens"] == 120
+    assert chain.values["OutputTokens"] == 30
+
+
+def test_disabled_metrics_are_a_no_op(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    recorder = metrics.start_request(ApiPath="/secHubRemediate")
+    assert recorder is metrics.NULL_RECORDER
+    assert metrics.get_recorder() is recorder
+    with recorder.stage("chain_1") as stage:
+        stage.add("InputTokens", 1)
+    assert stage.config is None
+    assert recorder.stage("chain_2") is stage
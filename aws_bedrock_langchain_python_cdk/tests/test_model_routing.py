@@ -0,0 +1,133 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+import metrics
+import remediation
+from converseEngine import ConverseRemediationHandler
+from modelRouting import DEFAULT_MODEL_KWARGS, converse_inference_config, load_model_routing, routing_key
+from rateGovernor import clear_rate_governors, get_rate_governor
+from remediation import RemediationHandler, model_governor_name
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+HAIKU_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+FALLBACK_ID = 'anthropic.claude-3-5-sonnet-20240620-v1:0'
+
+ROUTING = {
+    'chain_1': {'model_id': HAIKU_ID, 'model_kwargs': {'max_tokens': 1024}},
+    'chain_2': {'fallback_model_id': FALLBACK_ID, 'latency_budget_seconds': 30},
+}
+
+
+def throttled():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'Converse')
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    monkeypatch.setattr(remediation, 'MODEL_ROUTING', json.dumps(ROUTING))
+    monkeypatch.setenv('BEDROCK_RETRY_BASE_DELAY_SECONDS', '0.001')
+    clear_rate_governors()
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.side_effect = lambda *args, **kwargs: MagicMock()
+        yield mock_boto3_client
+    clear_rate_governors()
+
+
+@pytest.fixture
+def recorder():
+    recorder = metrics.MetricsRecorder(stream=io.StringIO())
+    token = metrics._CURRENT.set(recorder)
+    yield recorder
+    metrics._CURRENT.reset(token)
+
+
+def test_routes_default_to_model_id_and_default_kwargs():
+    routes = load_model_routing(ROUTING, MODEL_ID)
+
+    assert routes['chain_1'].model_id == HAIKU_ID
+    assert routes['chain_1'].model_kwargs == dict(DEFAULT_MODEL_KWARGS, max_tokens=1024)
+    assert routes['chain_2'].model_id == MODEL_ID
+    assert routes['chain_2'].fallback_model_id == FALLBACK_ID
+    assert routes['chain_2'].latency_budget_seconds == 30.0
+    assert routes['chain_3'] == load_model_routing('', MODEL_ID)['chain_3']
+    assert routing_key(routes) != routing_key(load_model_routing('', MODEL_ID))
+
+
+def test_unknown_stage_is_rejected():
+    with pytest.raises(ValueError):
+        load_model_routing('{"chain_4": {}}', MODEL_ID)
+
+
+def test_converse_inference_config_renames_parameters():
+    assert converse_inference_config({'max_tokens': 10, 'top_p': 0.5, 'top_k': 5, 'stop_sequences': ['x']}) == \
+        {'maxTokens': 10, 'topP': 0.5, 'stopSequences': ['x']}
+
+
+def test_langchain_stages_get_their_own_models(routed):
+    handler = RemediationHandler(MODEL_ID, region='us-east-1')
+
+    chain_1 = handler.get_llm('chain_1')
+    assert chain_1.model_id == HAIKU_ID
+    assert chain_1.model_kwargs['max_tokens'] == 1024
+    assert handler.get_llm('chain_3').model_id == MODEL_ID
+    assert handler.get_llm('chain_2').fallbacks[0].last.model_id == FALLBACK_ID
+    # Only the chain 2 primary model needs a client with its own timeout
+    assert routed.call_count == 4
+    assert routed.call_args.kwargs['config'].read_timeout == 30.0
+
+
+def test_langchain_falls_back_when_primary_is_throttled(routed, recorder):
+    handler = RemediationHandler(MODEL_ID, region='us-east-1')
+    primary = handler.get_model_client(handler.get_route('chain_2')).client
+    primary.invoke_model.side_effect = throttled()
+    body = {'content': [{'type': 'text', 'text': 'from fallback'}], 'usage': {'input_tokens': 1, 'output_tokens': 2}}
+    handler.bedrock_runtime.client.invoke_model.return_value = {'body': io.BytesIO(json.dumps(body).encode())}
+
+    output = handler.QAChain('{sechub_finding}', stage='chain_2').invoke({'sechub_finding': 'finding'})
+
+    assert output == 'from fallback'
+    assert primary.invoke_model.call_count == 2
+    assert handler.bedrock_runtime.client.invoke_model.call_args.kwargs['modelId'] == FALLBACK_ID
+    fallback = [record for record in recorder.records if record.name == 'model_fallback']
+    assert fallback[0].values['ModelFallbacks'] == 1
+    assert fallback[0].properties['ModelId'] == FALLBACK_ID
+
+
+def test_converse_uses_route_and_falls_back(routed, recorder):
+    handler = ConverseRemediationHandler(MODEL_ID, region='us-east-1')
+    reply = {'output': {'message': {'content': [{'text': 'ok'}]}}, 'usage': {'inputTokens': 1, 'outputTokens': 1}}
+    handler.bedrock_runtime.client.converse.return_value = reply
+
+    assert handler.QAChain('{sechub_finding}', stage='chain_3').invoke({'sechub_finding': 'finding'}) == 'ok'
+    assert handler.bedrock_runtime.client.converse.call_args.kwargs['modelId'] == MODEL_ID
+
+    assert handler.inference_config('chain_1')['maxTokens'] == 1024
+
+    primary = handler.get_model_client(handler.get_route('chain_2')).client
+    primary.converse.side_effect = throttled()
+    assert handler.QAChain('{sechub_finding}', stage='chain_2').invoke({'sechub_finding': 'finding'}) == 'ok'
+    assert handler.bedrock_runtime.client.converse.call_args.kwargs['modelId'] == FALLBACK_ID
+    assert [record.name for record in recorder.records].count('model_fallback') == 1
+
+
+def test_fallback_answers_while_the_primary_breaker_is_open(routed, recorder):
+    handler = ConverseRemediationHandler(MODEL_ID, region='us-east-1')
+    reply = {'output': {'message': {'content': [{'text': 'ok'}]}}, 'usage': {'inputTokens': 1, 'outputTokens': 1}}
+    handler.bedrock_runtime.client.converse.return_value = reply
+    primary = handler.get_model_client(handler.get_route('chain_2')).client
+    primary.converse.side_effect = throttled()
+
+    for _ in range(6):
+        assert handler.QAChain('{sechub_finding}', stage='chain_2').invoke({'sechub_finding': 'finding'}) == 'ok'
+
+    assert get_rate_governor(model_governor_name(MODEL_ID)).state()['breaker'] == 'open'
+    # Once open, the breaker fails fast without calling the primary model
+    assert primary.converse.call_count < 12
+    assert get_rate_governor(model_governor_name(FALLBACK_ID)).state()['breaker'] == 'closed'
+    assert get_rate_governor('bedrock-runtime').state()['breaker'] == 'closed'
+    assert handler.bedrock_runtime.client.converse.call_args.kwargs['modelId'] == FALLBACK_ID
+    assert [record.name for record in recorder.records].count('model_fallback') == 6
@@ -0,0 +1,195 @@
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+import metrics
+from rateGovernor import CircuitOpenError, GovernedClient, RateGovernor, RateGovernorTimeout, TokenBucket
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'InvokeModel')
+
+
+class FlakyOperation:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'ok': kwargs}
+
+
+def governor(**kwargs):
+    options = dict(rate=1000.0, burst=1000, max_concurrency=8, base_delay=0.001, max_delay=0.002)
+    options.update(kwargs)
+    return RateGovernor('bedrock-runtime', **options)
+
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(rate=50.0, burst=1)
+    deadline = time.monotonic() + 5
+    assert bucket.acquire(deadline) < 0.01
+    start = time.perf_counter()
+    bucket.acquire(deadline)
+    assert time.perf_counter() - start >= 0.015
+    with pytest.raises(RateGovernorTimeout):
+        bucket.acquire(time.monotonic())
+
+
+def test_throttles_are_retried_and_halve_the_concurrency_limit():
+    limiter = governor()
+    operation = FlakyOperation([client_error('ThrottlingException'), client_error('ThrottlingException')])
+
+    assert limiter.call('invoke_model', operation, modelId='m') == {'ok': {'modelId': 'm'}}
+
+    assert operation.calls == 3
+    assert limiter.stats['retries'] == 2
+    assert limiter.stats['throttles'] == 2
+    # 8 -> 4 -> 2, then one additive increase of 1/2 for the success
+    assert limiter.state() == {'limit': 2.5, 'in_flight': 0, 'breaker': 'closed'}
+
+
+def test_stats_are_exact_under_concurrent_calls():
+    limiter = governor(rate=100000.0, burst=100000, base_delay=0.0, max_delay=0.0)
+
+    def call(i):
+        return limiter.call('invoke_model', FlakyOperation([client_error('ThrottlingException')]), modelId=i)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(call, range(400)))
+
+    assert limiter.stats == {'calls': 400, 'retries': 400, 'throttles': 400, 'failures': 0, 'rejected': 0}
+
+
+def test_transient_errors_are_retried_without_backing_off():
+    limiter = governor()
+    operation = FlakyOperation([client_error('ServiceUnavailableException'), ReadTimeoutError(endpoint_url='x')])
+    limiter.call('converse', operation)
+    assert operation.calls == 3
+    assert limiter.state()['limit'] == 8
+
+
+def test_other_errors_are_not_retried():
+    limiter = governor()
+    operation = FlakyOperation([client_error('ValidationException')])
+    with pytest.raises(ClientError):
+        limiter.call('converse', operation)
+    assert operation.calls == 1
+    assert limiter.consecutive_failures == 0
+
+
+def test_retries_stop_at_max_attempts():
+    limiter = governor(max_attempts=3)
+    operation = FlakyOperation([client_error('ThrottlingException')] * 5)
+    with pytest.raises(ClientError):
+        limiter.call('converse', operation)
+    assert operation.calls == 3
+
+
+def test_retries_stop_at_the_deadline():
+    limiter = governor(base_delay=10, max_delay=10, deadline_seconds=0.5)
+    limiter._random.seed(1)
+    operation = FlakyOperation([client_error('ThrottlingException')] * 5)
+    start = time.perf_counter()
+    with pytest.raises(ClientError):
+        limiter.call('converse', operation)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_circuit_breaker_opens_and_recovers():
+    limiter = governor(max_attempts=1, breaker_threshold=2, breaker_reset_seconds=0.05)
+    failing = FlakyOperation([client_error('ServiceUnavailableException')] * 3)
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            limiter.call('converse', failing)
+    assert limiter.state()['breaker'] == 'open'
+    with pytest.raises(CircuitOpenError):
+        limiter.call('converse', failing)
+    assert failing.calls == 2
+
+    time.sleep(0.06)
+    assert limiter.state()['breaker'] == 'half_open'
+    # A failed trial call opens the breaker again right away
+    with pytest.raises(ClientError):
+        limiter.call('converse', failing)
+    assert limiter.state()['breaker'] == 'open'
+
+    time.sleep(0.06)
+    limiter.call('converse', FlakyOperation([]))
+    assert limiter.state()['breaker'] == 'closed'
+    assert limiter.stats['rejected'] == 1
+
+
+def test_governed_client_only_wraps_model_and_retrieval_calls():
+    class Client:
+        meta = 'meta'
+
+        def retrieve(self, **kwargs):
+            return 'retrieved'
+
+    limiter = governor()
+    client = GovernedClient(Client(), limiter)
+    assert client.meta == 'meta'
+    assert client.retrieve(retrievalQuery={'text': 'q'}) == 'retrieved'
+    assert limiter.stats['calls'] == 1
+
+
+class EventStream:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.closed = True
+
+
+def test_streams_hold_their_slot_until_consumed():
+    class Client:
+        def converse_stream(self, **kwargs):
+            return {'stream': EventStream([{'contentBlockDelta': {'delta': {'text': 'a'}}}, {'messageStop': {}}])}
+
+    limiter = governor(max_concurrency=1, deadline_seconds=0.05)
+    client = GovernedClient(Client(), limiter)
+
+    stream = client.converse_stream(modelId='m')['stream']
+    assert limiter.state()['in_flight'] == 1
+    # The only slot is taken until the stream is read
+    with pytest.raises(RateGovernorTimeout):
+        client.converse_stream(modelId='m')
+    assert len(list(stream)) == 2
+    assert limiter.state()['in_flight'] == 0
+
+    # Closing a stream early gives its slot back too, once
+    stream = client.converse_stream(modelId='m')['stream']
+    stream.close()
+    stream.close()
+    assert limiter.state() == {'limit': 1.0, 'in_flight': 0, 'breaker': 'closed'}
+
+
+def test_calls_are_recorded_as_metrics():
+    stream = io.StringIO()
+    recorder = metrics.MetricsRecorder(stream=stream)
+    metrics._CURRENT.set(recorder)
+    try:
+        governor().call('invoke_model', FlakyOperation([client_error('ThrottlingException')]))
+    finally:
+        metrics._CURRENT.set(metrics.NULL_RECORDER)
+    recorder.flush()
+    [line] = stream.getvalue().splitlines()
+    document = json.loads(line)
+    assert document['Stage'] == 'rate_governor'
+    assert document['Operation'] == 'invoke_model'
+    assert document['Retries'] == 1
+    assert document['Throttles'] == 1
+    assert document['ConcurrencyLimit'] == 4.25
+    assert document['Breaker'] == 'closed'
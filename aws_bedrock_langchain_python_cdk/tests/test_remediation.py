@@ -1,53 +1,45 @@
-import boto3
-from unittest.mock import patch, mock_open
+from unittest.mock import patch
 import pytest
-from aws_bedrock_langchain_python_cdk.lambda.code.langchain.remediation import RemediationHandler
+from remediation import RemediationHandler
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
 
 @pytest.fixture
-def mock_codecommit_client():
+def mock_boto3_client():
     with patch('boto3.client') as mock_boto3_client:
-        mock_codecommit_client = mock_boto3_client.return_value
-        mock_codecommit_client.get_branch.return_value = {'branch': {'commitId': 'abcdef01234'}}
-        yield mock_codecommit_client
+        yield mock_boto3_client
 
 @pytest.fixture
-def remediation_handler(monkeypatch, mock_codecommit_client):
+def remediation_handler(monkeypatch, mock_boto3_client):
     monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
-    remediation_handler = RemediationHandler()
-    remediation_handler.codecommit_repo_name = 'my-repo'
-    remediation_handler.codecommit_branch_name = 'main'
-    return remediation_handler
-
-def test_commit_file_with_commit_id(remediation_handler, mock_codecommit_client):
-    file_path = 'my-resource/remediation.yaml'
-    file_content = 'example: yaml\ncontent: here'
-
-    with patch('builtins.open', mock_open(read_data=file_content)):
-        commit_response, committed_file_path = remediation_handler.commit_file('remediation.yaml', 'my-resource')
-
-    assert committed_file_path == file_path
-    mock_codecommit_client.put_file.assert_called_with(
-        repositoryName='my-repo',
-        branchName='main',
-        fileContent=file_content,
-        filePath=file_path,
-        parentCommitId='abcdef01234',
-        commitMessage='Push the remediation template for the security hub finding'
-    )
-
-def test_commit_file_without_commit_id(remediation_handler, mock_codecommit_client):
-    mock_codecommit_client.get_branch.side_effect = mock_codecommit_client.exceptions.BranchDoesNotExistException()
-    file_path = 'my-resource/remediation.yaml'
-    file_content = 'example: yaml\ncontent: here'
-
-    with patch('builtins.open', mock_open(read_data=file_content)):
-        commit_response, committed_file_path = remediation_handler.commit_file('remediation.yaml', 'my-resource')
-
-    assert committed_file_path == file_path
-    mock_codecommit_client.put_file.assert_called_with(
-        repositoryName='my-repo',
-        branchName='main',
-        fileContent=file_content,
-        filePath=file_path,
-        commitMessage='Push the remediation template for the security hub finding'
-    )
+    return RemediationHandler(MODEL_ID, region='us-east-1')
+
+def test_clients_created_for_region(remediation_handler, mock_boto3_client):
+    services = [call.kwargs.get('service_name', call.args[0] if call.args else None) for call in mock_boto3_client.call_args_list]
+    assert services == ['s3', 'bedrock-runtime', 'bedrock-agent-runtime']
+    assert all(call.kwargs['region_name'] == 'us-east-1' for call in mock_boto3_client.call_args_list)
+
+def test_get_llm_configuration(remediation_handler):
+    llm = remediation_handler.get_llm()
+    assert llm.model_id == MODEL_ID
+    assert llm.model_kwargs == {'max_tokens': 4096, 'temperature': 0, 'top_p': 0.99}
+
+def test_get_named_parameter(remediation_handler):
+    event = {'parameters': [
+        {'name': 'other', 'type': 'string', 'value': 'x'},
+        {'name': 'sechub_finding', 'type': 'string', 'value': 'S3 buckets should have server-side encryption enabled'}
+    ]}
+    assert remediation_handler.get_named_parameter(event, 'sechub_finding') == 'S3 buckets should have server-side encryption enabled'
+
+def test_parse_yaml_code(remediation_handler):
+    string_output = "Here is the template:\n```yaml\nResources: {}\n```\nIt creates no resources."
+    assert remediation_handler.parse_yaml_code(string_output) == "\nResources: {}\n"
+
+def test_pydantic_parser_parses_chain_1_output(remediation_handler):
+    parser = remediation_handler.get_pydantic_parser()
+    output = parser.parse('{"remediation_details": "Enable encryption", "remediation_available": true, '
+                          '"remediation_runbook": "AWS-EnableS3BucketEncryption", '
+                          '"security_hub_finding_title": "S3.4", "resource_type": "S3 Bucket"}')
+    assert output.remediation_available is True
+    assert output.remediation_runbook == 'AWS-EnableS3BucketEncryption'
+    assert output.resource_type == 'S3 Bucket'
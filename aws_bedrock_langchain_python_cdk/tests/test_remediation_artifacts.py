@@ -0,0 +1,146 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+import index
+from gitHubCommit import GitHubCommitter
+from remediationArtifacts import build_artifact, load_template, template_parameters
+
+NO_THROTTLE = {'seconds_between_requests': None, 'seconds_between_writes': None}
+
+TEMPLATE = """AWSTemplateFormatVersion: '2010-09-09'
+Parameters:
+  BucketName:
+    Type: String
+  KmsKeyArn:
+    Type: String
+    Default: alias/aws/s3
+  EnforceSSL:
+    Type: String
+    AllowedValues: ['true', 'false']
+  Versioning:
+    Type: String
+    Default: true
+  RetentionDays:
+    Type: Number
+    Default: 30
+  Regions:
+    Type: CommaDelimitedList
+    Default: [us-east-1, eu-west-1]
+Conditions:
+  UseKms: !Not [!Equals [!Ref KmsKeyArn, '']]
+Resources:
+  Remediation:
+    Type: AWS::SSM::Document
+    Properties:
+      Content:
+        description: !Sub 'Encrypt ${BucketName}'
+        key: !If [UseKms, !GetAtt Key.Arn, !Ref 'AWS::NoValue']
+      Tags: !Custom {team: secops}
+"""
+
+
+def parameter_values(parameters):
+    return {item['ParameterKey']: item['ParameterValue'] for item in json.loads(parameters)}
+
+
+def test_short_form_functions_load_as_their_long_form():
+    resources = load_template(TEMPLATE)['Resources']['Remediation']['Properties']
+
+    assert resources['Content']['description'] == {'Fn::Sub': 'Encrypt ${BucketName}'}
+    assert resources['Content']['key'] == {'Fn::If': ['UseKms', {'Fn::GetAtt': ['Key', 'Arn']}, {'Ref': 'AWS::NoValue'}]}
+    assert resources['Tags'] == {'Fn::Custom': {'team': 'secops'}}
+
+
+def test_parameters_file_is_derived_from_the_parameters_section():
+    # BucketName has no Default and no AllowedValues and is left out
+    assert template_parameters(TEMPLATE) == [
+        {'ParameterKey': 'KmsKeyArn', 'ParameterValue': 'alias/aws/s3'},
+        {'ParameterKey': 'EnforceSSL', 'ParameterValue': 'true'},
+        {'ParameterKey': 'Versioning', 'ParameterValue': 'true'},
+        {'ParameterKey': 'RetentionDays', 'ParameterValue': '30'},
+        {'ParameterKey': 'Regions', 'ParameterValue': 'us-east-1,eu-west-1'},
+    ]
+    assert template_parameters("Resources: [unclosed") == []
+    assert template_parameters("Resources: {}") == []
+
+
+def test_parameters_with_empty_or_invalid_allowed_values_are_left_out():
+    template = """Parameters:
+  Empty:
+    Type: String
+    AllowedValues: []
+  NotAList:
+    Type: String
+    AllowedValues: 'true'
+  Mode:
+    Type: String
+    AllowedValues: [strict]
+Resources: {}
+"""
+    assert template_parameters(template) == [{'ParameterKey': 'Mode', 'ParameterValue': 'strict'}]
+
+
+def test_artifact_paths_follow_the_deploy_stage_convention():
+    artifact = build_artifact('S3.4', TEMPLATE, 'S3 Bucket')
+
+    assert artifact.template_path == 'S3 Bucket/GenRem-S3.4.yaml'
+    assert artifact.stack_name == 'S3-Bucket-GenRem-S3-4'
+    assert artifact.parameters_path == 'deploy/parameters/S3-Bucket-GenRem-S3-4-params.json'
+    assert parameter_values(artifact.parameters)['KmsKeyArn'] == 'alias/aws/s3'
+
+
+def test_same_file_name_in_two_resource_type_directories_deploys_as_two_stacks():
+    s3 = build_artifact('S3.4', TEMPLATE, 'S3')
+    s3_bucket = build_artifact('S3.4', TEMPLATE, 'S3 Bucket')
+
+    assert s3.stack_name != s3_bucket.stack_name
+    assert s3.parameters_path != s3_bucket.parameters_path
+
+
+@pytest.fixture
+def committer(fake_github, monkeypatch):
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.return_value.get_secret_value.return_value = {'SecretString': 'test-token'}
+        committer = GitHubCommitter('test-owner/test-repo', base_url=fake_github.url, github_options=NO_THROTTLE)
+    monkeypatch.setattr(index, 'get_github_committer', lambda repo: committer)
+    monkeypatch.setattr(index, 'commit_mode', 'sync')
+    return committer
+
+
+class FakeHandler:
+    def parse_yaml_code(self, string_output):
+        return string_output.split("```yaml")[1].split("```")[0]
+
+
+def test_template_and_parameters_are_committed_together_without_temp_files(committer, fake_github):
+    response = "```yaml\n" + TEMPLATE + "```"
+    with patch('tempfile.NamedTemporaryFile', side_effect=AssertionError('no temp files')):
+        body = index.commit_remediation(FakeHandler(), '[S3.4] S3 buckets should be encrypted', response, 'S3')
+
+    assert fake_github.repo.branches['main'] in body
+    assert fake_github.repo.commit_count() == 1
+    files = fake_github.repo.head_files()
+    assert set(files) == {'S3/GenRem-S3.4.yaml', 'deploy/parameters/S3-GenRem-S3-4-params.json'}
+    assert files['S3/GenRem-S3.4.yaml'] == "\n" + TEMPLATE
+
+
+def test_regenerated_parameters_keep_the_values_set_on_the_branch(committer, fake_github):
+    finding = '[S3.4] S3 buckets should be encrypted'
+    index.commit_remediation(FakeHandler(), finding, "```yaml\n" + TEMPLATE + "```", 'S3')
+    parameters_path = 'deploy/parameters/S3-GenRem-S3-4-params.json'
+    edited = json.loads(fake_github.repo.head_files()[parameters_path])
+    assert 'BucketName' not in parameter_values(json.dumps(edited))
+    edited.append({'ParameterKey': 'BucketName', 'ParameterValue': 'my-bucket'})
+    fake_github.repo.push({parameters_path: json.dumps(edited)})
+
+    changed = TEMPLATE.replace('  KmsKeyArn:\n', '  KeyArn:\n').replace('Default: 30', 'Default: 90')
+    index.commit_remediation(FakeHandler(), finding, "```yaml\n" + changed + "```", 'S3')
+
+    values = parameter_values(fake_github.repo.head_files()[parameters_path])
+    # Values on the branch win for the parameters the template still declares, including the ones
+    # left for the operator to set
+    assert values['BucketName'] == 'my-bucket'
+    assert values['RetentionDays'] == '30'
+    assert 'KmsKeyArn' not in values and values['KeyArn'] == 'alias/aws/s3'
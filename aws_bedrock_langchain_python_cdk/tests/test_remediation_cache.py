@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from remediationCache import LocalCacheStore, RemediationCache
+
+MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+KB_ID = 'TESTKBID'
+SECHUB_OUTPUT = {
+    'remediation_runbook': 'AWS-EnableS3BucketEncryption',
+    'remediation_details': 'Enables default encryption on the bucket',
+    'remediation_available': True,
+    'resource_type': 'S3 Bucket'
+}
+
+
+def test_miss_then_local_hit():
+    cache = RemediationCache(store=LocalCacheStore())
+    assert cache.get('S3 buckets should have server-side encryption enabled', MODEL_ID, KB_ID) is None
+
+    cache.put('S3 buckets should have server-side encryption enabled', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    cached = cache.get('s3 buckets should have server-side  encryption enabled.', MODEL_ID, KB_ID)
+
+    assert cached == {'sechub_output': SECHUB_OUTPUT, 'response': 'runbook text'}
+    assert cache.stats == {'local_hits': 1, 'remote_hits': 0, 'misses': 1}
+
+
+def test_key_includes_model_and_knowledge_base():
+    cache = RemediationCache(store=LocalCacheStore())
+    cache.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    assert cache.get('finding', 'other-model', KB_ID) is None
+    assert cache.get('finding', MODEL_ID, 'OTHERKB') is None
+
+
+def test_remote_hit_is_shared_between_containers():
+    store = LocalCacheStore()
+    RemediationCache(store=store).put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+
+    other_container = RemediationCache(store=store)
+    assert other_container.get('finding', MODEL_ID, KB_ID)['response'] == 'runbook text'
+    assert other_container.get('finding', MODEL_ID, KB_ID)['response'] == 'runbook text'
+    assert other_container.stats == {'local_hits': 1, 'remote_hits': 1, 'misses': 0}
+
+
+def test_stats_are_exact_under_concurrent_lookups():
+    cache = RemediationCache(store=LocalCacheStore())
+    cache.put('cached finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+
+    def lookup(i):
+        return cache.get('cached finding' if i % 2 else 'finding {}'.format(i), MODEL_ID, KB_ID)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lookup, range(400)))
+
+    assert cache.stats == {'local_hits': 200, 'remote_hits': 0, 'misses': 200}
+
+
+def test_lru_evicts_least_recently_used():
+    cache = RemediationCache(store=LocalCacheStore(), max_entries=2)
+    cache.store.put_item = lambda key, value, expires_at: None
+    cache.put('a', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'a')
+    cache.put('b', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'b')
+    cache.get('a', MODEL_ID, KB_ID)
+    cache.put('c', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'c')
+
+    assert cache.get('b', MODEL_ID, KB_ID) is None
+    assert cache.get('a', MODEL_ID, KB_ID)['response'] == 'a'
+
+
+def test_expired_entries_are_misses():
+    cache = RemediationCache(store=LocalCacheStore(), ttl_seconds=0)
+    cache.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    assert cache.get('finding', MODEL_ID, KB_ID) is None
+
+
+def test_invalidate_is_seen_by_other_containers():
+    store = LocalCacheStore()
+    writer = RemediationCache(store=store, generation_check_seconds=0)
+    reader = RemediationCache(store=store, generation_check_seconds=0)
+    writer.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    assert reader.get('finding', MODEL_ID, KB_ID) is not None
+
+    writer.invalidate()
+
+    assert writer.get('finding', MODEL_ID, KB_ID) is None
+    assert reader.get('finding', MODEL_ID, KB_ID) is None
+
+
+class FlakyGenerationStore(LocalCacheStore):
+    def __init__(self):
+        super().__init__()
+        self.available = True
+
+    def get_generation(self):
+        if not self.available:
+            raise ConnectionError('DynamoDB is unreachable')
+        return super().get_generation()
+
+
+def test_unreadable_generation_reuses_the_last_one():
+    store = FlakyGenerationStore()
+    cache = RemediationCache(store=store, generation_check_seconds=0)
+    cache.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+
+    store.available = False
+    assert cache.get('finding', MODEL_ID, KB_ID)['response'] == 'runbook text'
+
+
+def test_unknown_generation_bypasses_the_cache():
+    store = FlakyGenerationStore()
+    store.available = False
+    cache = RemediationCache(store=store)
+
+    cache.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    assert cache.get('finding', MODEL_ID, KB_ID) is None
+    assert store.items == {}
+
+    store.available = True
+    assert cache.get('finding', MODEL_ID, KB_ID) is None
+    cache.put('finding', MODEL_ID, KB_ID, SECHUB_OUTPUT, 'runbook text')
+    assert cache.get('finding', MODEL_ID, KB_ID)['response'] == 'runbook text'
@@ -0,0 +1,81 @@
+import asyncio
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from remediation import RemediationHandler, YamlTemplateStream
+
+GENERATION = (
+    "Here is the template:\n```yaml\nAWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n```\n"
+    "The template creates the following resources and explains every one of them at length."
+)
+
+
+def fake_handler(text):
+    handler = RemediationHandler('anthropic.claude-3-sonnet-20240229-v1:0')
+    handler._llms["chain_2"] = GenericFakeChatModel(messages=iter([AIMessage(content=text)]))
+    return handler
+
+
+def test_template_stream_detects_split_fences():
+    template_stream = YamlTemplateStream()
+    tokens = ["Intro ``", "`ya", "ml\nResources: {}\n`", "``", " trailing"]
+    completed = [template_stream.feed(token) for token in tokens]
+
+    assert completed == [False, False, False, True, True]
+    assert template_stream.text == "Intro ```yaml\nResources: {}\n```"
+
+
+def test_template_stream_ignores_other_code_blocks_before_yaml():
+    template_stream = YamlTemplateStream()
+    assert not template_stream.feed("```json\n{}\n```\n")
+    assert not template_stream.feed("```yaml\nResources: {}\n")
+    assert template_stream.feed("```")
+
+
+def test_stream_yaml_generation_stops_at_closing_fence():
+    handler = fake_handler(GENERATION)
+
+    text, metrics = handler.stream_yaml_generation("{sechub_finding}", {"sechub_finding": "finding"})
+
+    assert text.endswith("Resources: {}\n```")
+    assert "explains" not in text
+    assert handler.parse_yaml_code(text)
+    assert metrics["stopped_early"]
+    assert 0 <= metrics["time_to_first_token"] <= metrics["time_to_template"]
+
+
+def test_stream_yaml_generation_without_yaml_returns_full_text():
+    handler = fake_handler("No template could be generated for this finding.")
+
+    text, metrics = handler.stream_yaml_generation("{sechub_finding}", {"sechub_finding": "finding"})
+
+    assert text == "No template could be generated for this finding."
+    assert not metrics["stopped_early"]
+    assert metrics["time_to_template"] is None
+
+
+def test_astream_yaml_generation_stops_at_closing_fence():
+    handler = fake_handler(GENERATION)
+
+    text, metrics = asyncio.run(handler.astream_yaml_generation("{sechub_finding}", {"sechub_finding": "finding"}))
+
+    assert text.endswith("Resources: {}\n```")
+    assert metrics["stopped_early"]
+
+
+def test_stream_yaml_generation_runs_with_the_stage_config():
+    class Recorder(BaseCallbackHandler):
+        def __init__(self):
+            self.tokens = []
+
+        def on_llm_new_token(self, token, **kwargs):
+            self.tokens.append(token)
+
+    handler = fake_handler(GENERATION)
+    recorder = Recorder()
+
+    handler.stream_yaml_generation("{sechub_finding}", {"sechub_finding": "finding"}, config={"callbacks": [recorder]})
+
+    assert recorder.tokens
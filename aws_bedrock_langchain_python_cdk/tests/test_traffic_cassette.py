@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+
+import trafficCassette
+from gitHubCommit import GitHubCommitter
+from trafficCassette import Cassette, CassetteMissError, install_cassette, uninstall_cassette
+
+NO_THROTTLE = {'seconds_between_requests': None, 'seconds_between_writes': None}
+SERVICE_LATENCY = 0.05
+
+
+class FakeAwsServer:
+    """
+    Answers bedrock-runtime InvokeModel, bedrock-agent-runtime Retrieve and Secrets Manager GetSecretValue
+    over HTTP, SERVICE_LATENCY seconds after each request.
+    """
+
+    def __init__(self):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+                server.requests.append(self.path)
+                time.sleep(SERVICE_LATENCY)
+                if self.path.endswith('/invoke'):
+                    payload = {'content': [{'type': 'text', 'text': 'Answer to ' + body['messages'][0]['content']}]}
+                elif self.path.endswith('/retrieve'):
+                    payload = {'retrievalResults': [{'content': {'text': 'Passage about ' + body['retrievalQuery']['text']}}]}
+                else:
+                    payload = {'Name': body['SecretId'], 'SecretString': 'real-token'}
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fake_aws(monkeypatch):
+    server = FakeAwsServer()
+    monkeypatch.setenv('AWS_ENDPOINT_URL', server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cassette_path(tmp_path):
+    yield str(tmp_path / 'cassette.jsonl')
+    uninstall_cassette()
+
+
+def invoke(runtime, prompt):
+    body = json.dumps({'anthropic_version': 'bedrock-2023-05-31', 'max_tokens': 100,
+                       'messages': [{'role': 'user', 'content': prompt}]})
+    response = runtime.invoke_model(modelId='anthropic.claude-3-sonnet-20240229-v1:0', body=body)
+    return json.loads(response['body'].read())['content'][0]['text']
+
+
+def retrieve(agent_runtime, query):
+    response = agent_runtime.retrieve(knowledgeBaseId='TESTKBID00', retrievalQuery={'text': query})
+    return response['retrievalResults'][0]['content']['text']
+
+
+def clients():
+    return boto3.client('bedrock-runtime'), boto3.client('bedrock-agent-runtime')
+
+
+def test_recorded_bedrock_traffic_replays_without_the_services(fake_aws, cassette_path):
+    install_cassette(cassette_path, mode='record')
+    runtime, agent_runtime = clients()
+    recorded = [invoke(runtime, 'S3.1'), retrieve(agent_runtime, 'S3.1'), invoke(runtime, 'S3.2')]
+    uninstall_cassette()
+
+    lines = [json.loads(line) for line in open(cassette_path)]
+    assert [(line['service'], line['path']) for line in lines] == [
+        ('bedrock-runtime', '/model/anthropic.claude-3-sonnet-20240229-v1%3A0/invoke'),
+        ('bedrock-agent-runtime', '/knowledgebases/TESTKBID00/retrieve'),
+        ('bedrock-runtime', '/model/anthropic.claude-3-sonnet-20240229-v1%3A0/invoke'),
+    ]
+    assert all(line['seconds'] >= SERVICE_LATENCY for line in lines)
+    # Volatile headers are left out
+    assert 'date' not in lines[0]['headers'] and 'server' not in lines[0]['headers']
+
+    fake_aws.stop()
+    cassette = install_cassette(cassette_path, mode='replay', latency='zero')
+    runtime, agent_runtime = clients()
+    start = time.perf_counter()
+    replayed = [invoke(runtime, 'S3.1'), retrieve(agent_runtime, 'S3.1'), invoke(runtime, 'S3.2')]
+
+    assert replayed == recorded == ['Answer to S3.1', 'Passage about S3.1', 'Answer to S3.2']
+    assert time.perf_counter() - start < SERVICE_LATENCY * 3
+    assert cassette.stats == {'recorded': 0, 'replayed': 3, 'repeated': 0, 'missed': 0}
+    assert cassette.unused() == 0
+
+
+def test_replay_keeps_the_recorded_latency(fake_aws, cassette_path):
+    install_cassette(cassette_path, mode='record')
+    runtime, _ = clients()
+    invoke(runtime, 'S3.1')
+    uninstall_cassette()
+
+    install_cassette(cassette_path, mode='replay', latency='recorded')
+    runtime, _ = clients()
+    start = time.perf_counter()
+    invoke(runtime, 'S3.1')
+    assert time.perf_counter() - start >= SERVICE_LATENCY
+
+
+def test_replay_misses_unrecorded_requests_unless_matching_on_the_operation(fake_aws, cassette_path):
+    install_cassette(cassette_path, mode='record')
+    runtime, _ = clients()
+    invoke(runtime, 'S3.1')
+    uninstall_cassette()
+
+    cassette = install_cassette(cassette_path, mode='replay', latency='zero')
+    runtime, _ = clients()
+    with pytest.raises(CassetteMissError):
+        invoke(runtime, 'A changed prompt')
+    assert cassette.stats['missed'] == 1 and cassette.unused() == 1
+    uninstall_cassette()
+
+    # Matching on the operation serves the recorded answers in order, then from the first one again
+    cassette = install_cassette(cassette_path, mode='replay', latency='zero', match='operation')
+    runtime, _ = clients()
+    assert [invoke(runtime, 'A changed prompt') for _ in range(2)] == ['Answer to S3.1'] * 2
+    assert cassette.stats['repeated'] == 1
+    assert len(fake_aws.requests) == 1
+
+
+def test_github_traffic_replays_and_the_secret_is_redacted(fake_aws, fake_github, cassette_path):
+    files = {'S3 Bucket/GenRem-S3.1.yaml': 's3 template', 'EC2 Instance/GenRem-EC2.1.yaml': 'ec2 template'}
+    resource_types = ['S3 Bucket', 'EC2 Instance']
+    install_cassette(cassette_path, mode='record', github_urls=[fake_github.url])
+    commit, file_paths = GitHubCommitter('test-owner/test-repo', base_url=fake_github.url,
+                                         github_options=NO_THROTTLE).commit_contents(files, resource_types)
+    uninstall_cassette()
+    github_requests = len(fake_github.requests)
+
+    text = open(cassette_path).read()
+    assert 'real-token' not in text and trafficCassette.REDACTED_SECRET in text
+    assert {json.loads(line)['service'] for line in text.splitlines()} == {'secrets-manager', 'github'}
+
+    fake_aws.stop()
+    cassette = install_cassette(cassette_path, mode='replay', latency='zero', github_urls=[fake_github.url])
+    replayed_commit, replayed_paths = GitHubCommitter('test-owner/test-repo', base_url=fake_github.url,
+                                                      github_options=NO_THROTTLE).commit_contents(files, resource_types)
+
+    assert (replayed_commit.sha, replayed_paths) == (commit.sha, file_paths)
+    assert len(fake_github.requests) == github_requests
+    assert cassette.stats['missed'] == 0 and cassette.unused() == 0
+
+
+def test_gzip_cassettes_and_unknown_modes(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl.gz')
+    cassette = Cassette(path, mode='record')
+    cassette.record('bedrock-runtime', 'POST', 'https://host/model/m/invoke', b'{"b": 1, "a": 2}', 200,
+                    {'Content-Type': 'application/json', 'Date': 'now'}, b'\x00\xffbinary', 0.5)
+    cassette.close()
+
+    replay = Cassette(path, mode='replay', latency='zero')
+    # Request bodies are matched in canonical JSON form
+    assert replay.play('bedrock-runtime', 'POST', 'https://other/model/m/invoke', '{"a":2,"b":1}') == (
+        200, {'content-type': 'application/json'}, b'\x00\xffbinary')
+    with pytest.raises(ValueError):
+        Cassette(path, mode='rewind')
@@ -0,0 +1,173 @@
+"""
+Compare fixed-depth retrieval (k=4) with adaptive retrieval depth (RETRIEVAL_MODE=adaptive).
+
+Every labelled finding in data/retrieval_labels.json runs through chain 1 against the local BM25
+index, with the retrieved context compressed as in the Lambda function. Chain 1 is an oracle that
+answers remediation_available=true exactly when the expected runbook is in its context, so the
+answers measure retrieval rather than a model. A finding answered "false" goes to chain 2 (template
+generation), one answered "true" to chain 3 (runbook description). Reported per mode:
+
+- Retrieve calls, chain 1 calls, chain 2 and chain 3 calls, and chain 1 context tokens per finding.
+- runbook hit rate: the share of findings whose expected runbook reached chain 1.
+- the estimated model cost per finding, from the token sizes and PRICES below; for adaptive mode
+  also the extra Retrieve calls, chain 1 calls and tokens next to the chain 2 calls they avoided.
+
+The control index is not loaded, as for findings whose titles it does not match: a finding it
+matches skips chain 1 altogether.
+
+Usage:
+    python benchmarks/bench_adaptive_retrieval.py [--min-k 2] [--max-k 8]
+"""
+import argparse
+import io
+import json
+import os
+from types import SimpleNamespace
+
+from bench_retrieval import DEFAULT_LABELS, compact
+from common import setup_lambda_path
+
+# On-demand USD per 1000 input and output tokens of the model answering every chain
+PRICES = (0.003, 0.015)
+# Estimated input (besides the context) and output tokens of each chain
+CHAIN_TOKENS = {
+    "chain_1": (1100, 150),
+    "chain_2": (700, 1500),
+    "chain_3": (300, 400),
+}
+
+
+def chain_cost(chain, context_tokens=0):
+    input_tokens, output_tokens = CHAIN_TOKENS[chain]
+    return (input_tokens + context_tokens) / 1000 * PRICES[0] + output_tokens / 1000 * PRICES[1]
+
+
+class OracleAnswerChain:
+    """
+    Chain 1 stand-in answering remediation_available=true when the expected runbook is in the context.
+    """
+
+    def __init__(self):
+        self.expected = None
+        self.contexts = []
+
+    def invoke(self, inputs, config=None):
+        self.contexts.append(inputs["context"])
+        return SimpleNamespace(remediation_available=compact(self.expected) in compact(inputs["context"]))
+
+
+def run_fixed(labels, client, k):
+    from contextCompression import compress_context, estimate_tokens
+    from adaptiveRetrieval import retrieval_configuration
+    totals = dict(retrieve_calls=0, chain_1_calls=0, chain_2_calls=0, chain_3_calls=0, context_tokens=0, hits=0,
+                  cost_usd=0.0)
+    for label in labels:
+        response = client.retrieve(retrievalQuery={"text": label["finding"]}, knowledgeBaseId="local",
+                                   retrievalConfiguration=retrieval_configuration(k))
+        passages = [result["content"]["text"] for result in response["retrievalResults"]]
+        context = compress_context(label["finding"], passages).text
+        available = compact(label["expected"]) in compact(context)
+        followup = "chain_3" if available else "chain_2"
+        totals["retrieve_calls"] += 1
+        totals["chain_1_calls"] += 1
+        totals[followup + "_calls"] += 1
+        totals["context_tokens"] += estimate_tokens(context)
+        totals["hits"] += int(available)
+        totals["cost_usd"] += chain_cost("chain_1", estimate_tokens(context)) + chain_cost(followup)
+    return totals
+
+
+def run_adaptive(labels, client, min_k, max_k):
+    import metrics
+    from adaptiveRetrieval import AdaptiveRetrievalChain, AdaptiveRetriever
+    from contextCompression import compress_context, estimate_tokens
+    oracle = OracleAnswerChain()
+    handler = SimpleNamespace(render_context=lambda finding, passages: compress_context(finding, passages).text)
+    chain = AdaptiveRetrievalChain(handler, AdaptiveRetriever(client, "local", min_k, max_k), oracle)
+    totals = dict(retrieve_calls=0, chain_1_calls=0, chain_2_calls=0, chain_3_calls=0, context_tokens=0, hits=0,
+                  cost_usd=0.0, escalations=0, first_pass_escalations=0, extra_retrieve_calls=0, extra_chain_1_calls=0,
+                  extra_context_tokens=0, chain_2_calls_avoided=0, extra_cost_usd=0.0, avoided_cost_usd=0.0)
+    reasons = {}
+    for label in labels:
+        oracle.expected = label["expected"]
+        del oracle.contexts[:]
+        recorder = metrics.MetricsRecorder(stream=io.StringIO())
+        token = metrics._CURRENT.set(recorder)
+        try:
+            output = chain.invoke(label["finding"])
+        finally:
+            metrics._CURRENT.reset(token)
+        record = next(record for record in recorder.records if record.name == "adaptive_retrieval")
+        followup = "chain_3" if output.remediation_available else "chain_2"
+        context_tokens = sum(estimate_tokens(context) for context in oracle.contexts)
+        totals["retrieve_calls"] += 1 + record.values["ExtraRetrieveCalls"]
+        totals["chain_1_calls"] += len(oracle.contexts)
+        totals[followup + "_calls"] += 1
+        totals["context_tokens"] += context_tokens
+        totals["hits"] += int(output.remediation_available)
+        totals["cost_usd"] += sum(chain_cost("chain_1", estimate_tokens(context)) for context in oracle.contexts)
+        totals["cost_usd"] += chain_cost(followup)
+        totals["escalations"] += record.values["RetrievalEscalations"]
+        totals["first_pass_escalations"] += record.values["FirstPassEscalations"]
+        totals["extra_retrieve_calls"] += record.values["ExtraRetrieveCalls"]
+        totals["extra_chain_1_calls"] += record.values["ExtraChain1Calls"]
+        totals["extra_context_tokens"] += record.values["ExtraContextTokens"]
+        totals["chain_2_calls_avoided"] += record.values["Chain2CallsAvoided"]
+        if record.values["ExtraChain1Calls"]:
+            totals["extra_cost_usd"] += chain_cost("chain_1", record.values["ExtraContextTokens"])
+        totals["avoided_cost_usd"] += record.values["Chain2CallsAvoided"] * (chain_cost("chain_2") - chain_cost("chain_3"))
+        if record.properties.get("EscalationReason"):
+            reason = record.properties["EscalationReason"]
+            reasons[reason] = reasons.get(reason, 0) + 1
+    totals["escalation_reasons"] = reasons
+    return totals
+
+
+def per_finding(totals, findings):
+    report = {}
+    for key, value in totals.items():
+        if key == "hits":
+            report["runbook_hit_rate"] = round(value / findings, 3)
+        elif isinstance(value, dict):
+            report[key] = value
+        elif key.endswith("cost_usd"):
+            report[key + "_per_finding"] = round(value / findings, 6)
+        else:
+            report[key + "_per_finding"] = round(value / findings, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="Labelled findings")
+    parser.add_argument("--fixed-k", type=int, default=4, help="Passages retrieved per finding in fixed mode")
+    parser.add_argument("--min-k", type=int, default=2, help="RETRIEVAL_MIN_K")
+    parser.add_argument("--max-k", type=int, default=8, help="RETRIEVAL_MAX_K")
+    args = parser.parse_args()
+
+    os.environ["CONTROL_INDEX_PATH"] = os.devnull
+    setup_lambda_path()
+    from localRetriever import get_local_knowledge_base_client
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    client = get_local_knowledge_base_client()
+    fixed = per_finding(run_fixed(labels, client, args.fixed_k), len(labels))
+    adaptive = per_finding(run_adaptive(labels, client, args.min_k, args.max_k), len(labels))
+    report = {
+        "findings": len(labels),
+        "fixed": fixed,
+        "adaptive": adaptive,
+        "adaptive_vs_fixed": {
+            "context_tokens_saved_per_finding": round(
+                fixed["context_tokens_per_finding"] - adaptive["context_tokens_per_finding"], 1),
+            "chain_2_calls_saved_per_finding": round(
+                fixed["chain_2_calls_per_finding"] - adaptive["chain_2_calls_per_finding"], 3),
+            "cost_saved_pct": round((1 - adaptive["cost_usd_per_finding"] / fixed["cost_usd_per_finding"]) * 100, 1),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
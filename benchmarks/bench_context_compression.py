@@ -0,0 +1,73 @@
+"""
+Measure the retrieved-context compression applied before prompt 1 (CONTEXT_COMPRESSION).
+
+Every labelled finding in data/retrieval_labels.json is retrieved from the local BM25 index with
+the Lambda function's retrieval configuration, and its passages are compressed with
+contextCompression.compress_context. Reported:
+
+- prompt 1 context tokens before and after compression, and the tokens saved per request.
+- runbook retention: the share of findings whose expected runbook is still in the context after
+  compression, out of those where retrieval found it (ignoring the whitespace the PDF extraction
+  breaks names up with, as bench_retrieval.py does).
+- compression latency.
+
+Usage:
+    python benchmarks/bench_context_compression.py [--k 4] [--budget 800] [--window 30]
+"""
+import argparse
+import json
+import time
+
+from bench_retrieval import DEFAULT_LABELS, compact
+from common import setup_lambda_path, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="Labelled findings")
+    parser.add_argument("--k", type=int, default=4, help="Passages retrieved per finding")
+    parser.add_argument("--budget", type=int, help="Token budget, defaults to CONTEXT_TOKEN_BUDGET")
+    parser.add_argument("--window", type=int, help="Words kept around anchors, defaults to CONTEXT_WINDOW_WORDS")
+    args = parser.parse_args()
+
+    setup_lambda_path()
+    from contextCompression import compress_context
+    from localRetriever import get_local_knowledge_base_client
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    client = get_local_knowledge_base_client()
+    configuration = {"vectorSearchConfiguration": {"numberOfResults": args.k, "overrideSearchType": "HYBRID"}}
+    tokens_in, tokens_out, samples, retrieved, retained, lost = [], [], [], 0, 0, []
+    for label in labels:
+        response = client.retrieve(retrievalQuery={"text": label["finding"]}, knowledgeBaseId="local",
+                                   retrievalConfiguration=configuration)
+        passages = [result["content"]["text"] for result in response["retrievalResults"]]
+        start = time.perf_counter()
+        compressed = compress_context(label["finding"], passages, token_budget=args.budget, window=args.window)
+        samples.append(time.perf_counter() - start)
+        tokens_in.append(compressed.tokens_in)
+        tokens_out.append(compressed.tokens_out)
+        expected = compact(label["expected"])
+        if any(expected in compact(passage) for passage in passages):
+            retrieved += 1
+            if expected in compact(compressed.text):
+                retained += 1
+            else:
+                lost.append(label["finding"])
+
+    report = {
+        "findings": len(labels),
+        "context_tokens_in": round(sum(tokens_in) / len(labels), 1),
+        "context_tokens_out": round(sum(tokens_out) / len(labels), 1),
+        "tokens_saved_per_request": round((sum(tokens_in) - sum(tokens_out)) / len(labels), 1),
+        "tokens_saved_pct": round((1 - sum(tokens_out) / sum(tokens_in)) * 100, 1),
+        "runbook_retention": round(retained / retrieved, 3) if retrieved else None,
+        "runbooks_lost": lost,
+        "latency": summarize(samples),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare the LangChain and Converse remediation engines (REMEDIATION_ENGINE).
+
+Each engine runs in fresh interpreters against the zero-latency stand-ins in stubs.py, so only
+the cost of the engine itself is measured:
+
+- cold start: ``import index`` (the Lambda init phase) and the first uncached rag_flow call,
+  which builds the clients and chains and loads whatever the engine imports lazily.
+- per request: warm rag_flow calls with the remediation cache disabled, alternating between
+  findings that take the chain 2 and the chain 3 path.
+
+Usage:
+    python benchmarks/bench_engines.py [--runs 5] [--requests 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import setup_lambda_path, summarize
+
+ENGINES = ["langchain", "converse"]
+
+
+def child(requests):
+    setup_lambda_path()
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["METRICS_ENABLED"] = "false"
+    import stubs
+
+    start = time.perf_counter()
+    import index
+    init = time.perf_counter() - start
+
+    findings = [title for title, _ in stubs.FINDINGS]
+    with stubs.StubServices().installed():
+        start = time.perf_counter()
+        index.rag_flow(findings[0], index.kb_id)
+        first_request = time.perf_counter() - start
+
+        samples = []
+        for i in range(requests):
+            start = time.perf_counter()
+            index.rag_flow(findings[i % len(findings)], index.kb_id)
+            samples.append(time.perf_counter() - start)
+    print(json.dumps({"init": init, "first_request": first_request, "samples": samples,
+                      "modules": len(sys.modules)}))
+
+
+def run_engine(engine, runs, requests):
+    env = dict(os.environ, REMEDIATION_ENGINE=engine, PYTHONDONTWRITEBYTECODE="1")
+    reports = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(requests)],
+            env=env, capture_output=True, text=True, check=True)
+        reports.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    samples = [sample for report in reports for sample in report["samples"]]
+    return {
+        "init_ms": round(statistics.median(report["init"] for report in reports) * 1000, 1),
+        "first_request_ms": round(statistics.median(report["first_request"] for report in reports) * 1000, 1),
+        "cold_start_ms": round(statistics.median(report["init"] + report["first_request"] for report in reports) * 1000, 1),
+        "loaded_modules": reports[-1]["modules"],
+        "warm_request": summarize(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per engine")
+    parser.add_argument("--requests", type=int, default=200, help="Warm requests per interpreter")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.requests)
+        return
+    report = {engine: run_engine(engine, args.runs, args.requests) for engine in ENGINES}
+    baseline, lean = report["langchain"], report["converse"]
+    report["converse_vs_langchain"] = {
+        "cold_start_ms_saved": round(baseline["cold_start_ms"] - lean["cold_start_ms"], 1),
+        "warm_p50_ms_saved": round(baseline["warm_request"]["p50_ms"] - lean["warm_request"]["p50_ms"], 3),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
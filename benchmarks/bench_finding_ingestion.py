@@ -0,0 +1,187 @@
+"""
+Replay bursts of "Security Hub Findings - Imported" events through finding_events_handler.
+
+Events are delivered the way the SQS event source of the ingestion function delivers them: in
+batches closed after --batch-size events or after the batching window, whichever comes first. Each
+batch invokes finding_events_handler with the chains replaced by an instant stand-in, and the
+handler's clock follows the event times, so the replay takes seconds whatever the burst duration.
+Reported per batching window:
+
+- batches (function invocations), events and findings delivered;
+- remediation runs, the rag_flow executions the handler started;
+- reduction: findings per remediation run, against one run per finding for an entry point that
+  remediated every event.
+
+Events come from --events, a JSON array or JSON lines of recorded EventBridge events (for example
+from an EventBridge archive), ordered by their "time". Without it a burst is synthesized: --findings
+findings of --controls controls of the control index, over --duration seconds, with a few controls
+accounting for most findings as after enabling a standard.
+
+Usage:
+    python benchmarks/bench_finding_ingestion.py [--findings 2000 --controls 20 --duration 600]
+    python benchmarks/bench_finding_ingestion.py --events recorded-events.jsonl --windows 0,60,300
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from common import setup_lambda_path
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class InstantChain:
+    def __init__(self, result):
+        self.result = result
+
+    async def ainvoke(self, inputs, config=None):
+        await asyncio.sleep(0)
+        return self.result(inputs)
+
+
+class InstantHandler:
+    """
+    Remediation handler stand-in counting the findings remediated (chain 1 calls).
+    """
+
+    def __init__(self):
+        self.remediated = 0
+
+    def chain_config(self, stage):
+        return None
+
+    def retrievalChain(self, template, knowledge_id):
+        def answer(sechub_finding):
+            self.remediated += 1
+            return SimpleNamespace(remediation_runbook="AWS-Runbook", remediation_details="details",
+                                   remediation_available=True, resource_type="S3")
+        return InstantChain(answer)
+
+    def QAChain(self, template, stage=None):
+        return InstantChain(lambda inputs: "Runbook for " + inputs["sechub_finding"])
+
+
+class ElapsedContext:
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def synthesize_events(findings, controls, duration, seed):
+    from controlIndex import get_control_index
+    rng = random.Random(seed)
+    catalog = sorted(get_control_index().controls.items())
+    chosen = rng.sample(catalog, min(controls, len(catalog)))
+    # Zipf-like skew: the first controls fail on most resources
+    weights = [1.0 / (rank + 1) for rank in range(len(chosen))]
+    events = []
+    for i in range(findings):
+        control, details = rng.choices(chosen, weights)[0]
+        finding = {
+            "Id": "finding-{}".format(i),
+            "Title": details["title"],
+            "GeneratorId": "security-control/{}".format(control),
+            "Compliance": {"Status": "FAILED", "SecurityControlId": control},
+            "Resources": [{"Id": "arn:aws:s3:::resource-{}".format(i)}],
+        }
+        when = START + timedelta(seconds=rng.uniform(0, duration))
+        events.append({"source": "aws.securityhub", "detail-type": "Security Hub Findings - Imported",
+                       "time": when.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "detail": {"findings": [finding]}})
+    return events
+
+
+def load_events(path):
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def event_seconds(event):
+    return (datetime.fromisoformat(event["time"].replace("Z", "+00:00")) - START).total_seconds()
+
+
+def sqs_batches(events, batch_size, window):
+    """
+    Group time-ordered events into the batches of an SQS event source: a batch closes when it holds
+    batch_size events or window seconds after its first event (1 second without a window).
+
+    Returns:
+        list: (close time in seconds, events) tuples.
+    """
+    batches = []
+    current, opened = [], None
+    for event in sorted(events, key=event_seconds):
+        at = event_seconds(event)
+        if current and at >= opened + max(window, 1):
+            batches.append((opened + max(window, 1), current))
+            current = []
+        if not current:
+            opened = at
+        current.append(event)
+        if len(current) == batch_size:
+            batches.append((at, current))
+            current = []
+    if current:
+        batches.append((opened + max(window, 1), current))
+    return batches
+
+
+def replay(events, batch_size, window, ingestion_window):
+    import findingEvents
+    import index
+    handler = InstantHandler()
+    clock = SimpleNamespace(now=0.0)
+    index.get_remediation_handler = lambda model_id: handler
+    findingEvents._RECENT_FINDINGS = findingEvents.RecentFindings(ingestion_window, clock=lambda: clock.now)
+    batches = sqs_batches(events, batch_size, window)
+    failures = 0
+    for number, (closed, batch) in enumerate(batches):
+        clock.now = closed
+        records = [{"messageId": "{}-{}".format(number, i), "body": json.dumps(event)} for i, event in enumerate(batch)]
+        failures += len(index.finding_events_handler({"Records": records}, ElapsedContext())["batchItemFailures"])
+    findings = sum(len(event["detail"]["findings"]) for event in events)
+    return {
+        "batches": len(batches),
+        "events": len(events),
+        "findings": findings,
+        "remediation_runs": handler.remediated,
+        "failed_messages": failures,
+        "findings_per_remediation_run": round(findings / handler.remediated, 1) if handler.remediated else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", help="Recorded EventBridge events, JSON array or JSON lines")
+    parser.add_argument("--findings", type=int, default=2000, help="Findings of the synthesized burst")
+    parser.add_argument("--controls", type=int, default=20, help="Distinct controls of the synthesized burst")
+    parser.add_argument("--duration", type=float, default=600, help="Seconds the synthesized burst lasts")
+    parser.add_argument("--batch-size", type=int, default=500, help="Batch size of the SQS event source")
+    parser.add_argument("--windows", default="0,10,60,300", help="Batching windows to compare, in seconds")
+    parser.add_argument("--ingestion-window", type=int, default=900, help="INGESTION_WINDOW_SECONDS")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["CONTROL_INDEX_ENABLED"] = "false"
+    setup_lambda_path()
+    logging.disable(logging.INFO)
+    events = load_events(args.events) if args.events else synthesize_events(
+        args.findings, args.controls, args.duration, args.seed)
+    report = {"per_finding_remediation_runs": sum(len(event["detail"]["findings"]) for event in events)}
+    for window in (int(value) for value in args.windows.split(",")):
+        report["window_{}s".format(window)] = replay(events, args.batch_size, window, args.ingestion_window)
+        # Coalescing within each batch only, as on containers that never stay warm
+        report["window_{}s_batch_only".format(window)] = replay(events, args.batch_size, window, 0)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
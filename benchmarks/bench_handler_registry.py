@@ -0,0 +1,61 @@
+"""
+Benchmark the per-request cost of building RemediationHandler clients and chains.
+
+Compares the previous behaviour (two RemediationHandler instances and a fresh chain graph per
+request) with the process-level registry used by warm Lambda invocations. No AWS calls are made:
+only object construction is measured.
+
+Usage:
+    python benchmarks/bench_handler_registry.py [--iterations 50]
+"""
+import argparse
+import json
+
+from common import setup_lambda_path, summarize, time_calls
+
+setup_lambda_path()
+
+import index  # noqa: E402
+from remediation import RemediationHandler, clear_remediation_handlers, get_remediation_handler  # noqa: E402
+
+
+def build_per_request():
+    # Previous lambda_handler/rag_flow: one handler in each, chains rebuilt for every request
+    RemediationHandler(index.modelId)
+    handler = RemediationHandler(index.modelId)
+    handler.retrievalChain(index.prompt1, index.kb_id)
+    handler.QAChain(index.prompt2)
+    handler.QAChain(index.prompt3)
+
+
+def build_from_registry():
+    get_remediation_handler(index.modelId)
+    handler = get_remediation_handler(index.modelId)
+    handler.retrievalChain(index.prompt1, index.kb_id)
+    handler.QAChain(index.prompt2)
+    handler.QAChain(index.prompt3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    # Warm up imports and botocore's service model loaders so both paths start from the same state
+    build_per_request()
+
+    per_request = summarize(time_calls(build_per_request, args.iterations))
+    clear_remediation_handlers()
+    first_request = summarize(time_calls(build_from_registry, 1))
+    warm_requests = summarize(time_calls(build_from_registry, args.iterations))
+
+    print(json.dumps({
+        "per_request_construction": per_request,
+        "registry_first_request": first_request,
+        "registry_warm_request": warm_requests,
+        "saved_per_warm_request_ms": round(per_request["mean_ms"] - warm_requests["mean_ms"], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
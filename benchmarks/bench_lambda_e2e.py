@@ -0,0 +1,217 @@
+"""
+Offline end-to-end latency benchmark of lambda_handler.
+
+Drives lambda_handler with Bedrock agent events while bedrock-runtime, bedrock-agent-runtime
+Retrieve, Secrets Manager and the GitHub REST API are served by local stand-ins with
+configurable latency and failure injection (see stubs.py). Reports p50/p95/p99 latency per stage
+and throughput at the requested concurrency, and saves the results under benchmarks/results/ so
+runs can be compared between commits.
+
+Usage:
+    python benchmarks/bench_lambda_e2e.py --requests 64 --concurrency 8 --model-latency 0.05
+    python benchmarks/bench_lambda_e2e.py --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import REPO_ROOT, setup_lambda_path, summarize
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64, help="Number of agent events to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent lambda_handler invocations")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Seconds per Bedrock model call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Extra seconds per output token")
+    parser.add_argument("--retrieve-latency", type=float, default=0.02, help="Seconds per KB Retrieve call")
+    parser.add_argument("--secrets-latency", type=float, default=0.01, help="Seconds per Secrets Manager call")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="Seconds per GitHub API request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform jitter applied to every latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of a Bedrock ThrottlingException")
+    parser.add_argument("--cache", action="store_true", help="Keep the remediation result cache enabled")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra Lambda environment variables")
+    parser.add_argument("--label", help="Name of the results file, defaults to the current git commit")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def agent_event(title):
+    return {
+        "messageVersion": "1.0",
+        "agent": {"name": "SecHubRemediationAgent", "id": "BENCHAGENT", "alias": "TSTALIASID", "version": "DRAFT"},
+        "sessionId": "bench-session",
+        "inputText": "Generate automation for remediation of " + title,
+        "actionGroup": "SecHubRemediation",
+        "apiPath": "/secHubRemediate/{sechub_finding}",
+        "httpMethod": "GET",
+        "parameters": [{"name": "sechub_finding", "type": "string", "value": title}],
+    }
+
+
+class BenchContext:
+    def __init__(self, timeout_seconds=900):
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def instrument(index, remediation, gitHubCommit, stubs):
+    """
+    Wrap the pipeline stages of the Lambda code with timers feeding the current StageTimer.
+    """
+    def timed(stage, fn):
+        def wrapper(*args, **kwargs):
+            timer = stubs.CURRENT_TIMER.get()
+            if timer is None:
+                return fn(*args, **kwargs)
+            with timer.measure(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    class TimedChain:
+        def __init__(self, stage, chain):
+            self.stage = stage
+            self.chain = chain
+
+        def invoke(self, *args, **kwargs):
+            return timed(self.stage, self.chain.invoke)(*args, **kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self.chain, name)
+
+    retrieval_chain = remediation.RemediationHandler.retrievalChain
+    qa_chain = remediation.RemediationHandler.QAChain
+    remediation.RemediationHandler.retrievalChain = lambda self, *args: TimedChain("chain_1", retrieval_chain(self, *args))
+    remediation.RemediationHandler.QAChain = lambda self, template, stage=None: TimedChain(
+        stage or ("chain_2" if template is index.prompt2 else "chain_3"), qa_chain(self, template, stage))
+    remediation.RemediationHandler.parse_yaml_code = timed("yaml_parse", remediation.RemediationHandler.parse_yaml_code)
+    gitHubCommit.GitHubCommitter.commit_artifacts = timed("github_commit", gitHubCommit.GitHubCommitter.commit_artifacts)
+
+
+def run(args):
+    setup_lambda_path()
+    os.environ["CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ.pop("CACHE_TABLE_NAME", None)
+    # EMF lines would interleave with the report, pass --env METRICS_ENABLED=true to measure their cost
+    os.environ["METRICS_ENABLED"] = "false"
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+    import stubs
+    github = stubs.FakeGitHubServer("{}/{}".format(os.environ["GITHUB_OWNER"], os.environ["GITHUB_REPO"]), latency=args.github_latency).start()
+    os.environ["GITHUB_API_URL"] = github.url
+
+    def fault(latency):
+        return stubs.FaultProfile(latency=latency, jitter=args.jitter, seed=args.seed)
+
+    services = stubs.StubServices(
+        bedrock_runtime=stubs.StubBedrockRuntime(
+            fault=stubs.FaultProfile(latency=args.model_latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed),
+            token_latency=args.token_latency),
+        bedrock_agent_runtime=stubs.StubBedrockAgentRuntime(fault=fault(args.retrieve_latency)),
+        secretsmanager=stubs.StubSecretsManager(fault=fault(args.secrets_latency)),
+    )
+
+    with services.installed():
+        import index
+        import remediation
+        import gitHubCommit
+        instrument(index, remediation, gitHubCommit, stubs)
+
+        events = [agent_event(stubs.FINDINGS[i % len(stubs.FINDINGS)][0]) for i in range(args.requests)]
+        samples = []
+
+        def invoke(event):
+            timer = stubs.StageTimer()
+            token = stubs.CURRENT_TIMER.set(timer)
+            start = time.perf_counter()
+            error = None
+            try:
+                index.lambda_handler(event, BenchContext())
+            except Exception as e:
+                error = type(e).__name__
+            finally:
+                timer.add("total", time.perf_counter() - start)
+                stubs.CURRENT_TIMER.reset(token)
+            return timer.stages, error
+
+        # First request pays container initialisation, measure it separately
+        cold_stages, _ = invoke(events[0])
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            samples = list(executor.map(invoke, events))
+        wall = time.perf_counter() - wall_start
+
+    github.stop()
+    stages = {}
+    for stage_times, _ in samples:
+        for stage, seconds in stage_times.items():
+            stages.setdefault(stage, []).append(seconds)
+    errors = {}
+    for _, error in samples:
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("compare", "label")},
+        "first_request_ms": {stage: round(seconds * 1000, 3) for stage, seconds in cold_stages.items()},
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        "throughput_rps": round(len(samples) / wall, 3) if wall else 0.0,
+        "errors": errors,
+        "model_calls": len(services.clients["bedrock-runtime"].calls),
+        "retrieve_calls": services.clients["bedrock-agent-runtime"].calls,
+        "secrets_calls": services.clients["secretsmanager"].calls,
+        "github_requests": len(github.requests),
+    }
+
+
+def compare(current, previous):
+    """
+    Print the change of p50/p95 per stage and of throughput against a previous run.
+    """
+    print("\nComparison with {} ({}):".format(previous["revision"], previous["timestamp"]))
+    for stage, summary in current["stages"].items():
+        before = previous["stages"].get(stage)
+        if not before:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            delta = summary[key] - before[key]
+            pct = (delta / before[key] * 100) if before[key] else 0.0
+            print("  {:<22} {:<7} {:>10.3f} -> {:>10.3f} ms ({:+.1f}%)".format(stage, key, before[key], summary[key], pct))
+    print("  {:<22} {:<7} {:>10.3f} -> {:>10.3f}".format("throughput_rps", "", previous["throughput_rps"], current["throughput_rps"]))
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, "{}.json".format(args.label or results["revision"]))
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print("\nResults saved to {}".format(path))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Compare single-model mode with per-stage model routing (MODEL_ROUTING, MODEL_FALLBACK_ID).
+
+Each scenario runs in a fresh interpreter against the stand-ins in stubs.py, where every model
+answers after its own latency and tokens are counted per model. Chain 1 (runbook lookup) and
+chain 3 (runbook description) are short classification/summary answers that a small model handles;
+chain 2 writes the CloudFormation template and keeps the large model. Reported per scenario:
+
+- latency of uncached rag_flow calls (p50/p95), at the requested concurrency.
+- model calls and tokens per model, and the estimated cost per request from PRICES.
+- fallbacks: with --throttle-rate, that share of the large model's calls is throttled and chain 2
+  falls back to the small model instead of backing off.
+
+Usage:
+    python benchmarks/bench_model_routing.py [--requests 64] [--concurrency 4] [--throttle-rate 0.2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import setup_lambda_path, summarize
+
+LARGE_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+SMALL_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# On-demand USD per 1000 input and output tokens
+PRICES = {
+    LARGE_MODEL: (0.003, 0.015),
+    SMALL_MODEL: (0.00025, 0.00125),
+}
+
+ROUTED = {
+    "chain_1": {"model_id": SMALL_MODEL, "model_kwargs": {"max_tokens": 1024}},
+    "chain_3": {"model_id": SMALL_MODEL, "model_kwargs": {"max_tokens": 1024}},
+}
+ROUTED_WITH_FALLBACK = dict(ROUTED, chain_2={"fallback_model_id": SMALL_MODEL})
+
+SCENARIOS = {
+    "single_model": {},
+    "routed": {"MODEL_ROUTING": json.dumps(ROUTED)},
+    "routed_with_fallback": {"MODEL_ROUTING": json.dumps(ROUTED_WITH_FALLBACK)},
+}
+
+
+def child(args):
+    setup_lambda_path()
+    os.environ["MODEL_ID"] = LARGE_MODEL
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ["BEDROCK_RATE_PER_SECOND"] = "1000"
+    os.environ["BEDROCK_BURST"] = "1000"
+    os.environ["BEDROCK_RETRY_BASE_DELAY_SECONDS"] = str(args.retry_delay)
+    import stubs
+
+    runtime = stubs.StubBedrockRuntime(model_faults={
+        LARGE_MODEL: stubs.FaultProfile(latency=args.large_latency, failure_rate=args.throttle_rate, seed=7),
+        SMALL_MODEL: stubs.FaultProfile(latency=args.small_latency, seed=7),
+    })
+    services = stubs.StubServices(bedrock_runtime=runtime,
+                                  bedrock_agent_runtime=stubs.StubBedrockAgentRuntime(stubs.FaultProfile(0.02)))
+    findings = [title for title, _ in stubs.FINDINGS]
+    with services.installed():
+        import index
+        # Every finding takes the chain 1 path, as for findings without a control ID
+        os.environ["CONTROL_INDEX_ENABLED"] = "false"
+        index.control_index_enabled = False
+
+        def invoke(i):
+            start = time.perf_counter()
+            try:
+                index.rag_flow(findings[i % len(findings)], index.kb_id)
+                error = None
+            except Exception as e:
+                error = type(e).__name__
+            return time.perf_counter() - start, error
+
+        invoke(0)
+        runtime.usage.clear()
+        del runtime.calls[:]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(invoke, range(args.requests)))
+    for model_id, stage in runtime.calls:
+        stages = runtime.usage.setdefault(model_id, {}).setdefault("calls_by_stage", {})
+        stages[stage] = stages.get(stage, 0) + 1
+    print(json.dumps({"samples": [seconds for seconds, _ in results],
+                      "errors": [error for _, error in results if error],
+                      "usage": runtime.usage}))
+
+
+def run_scenario(name, args):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", **SCENARIOS[name])
+    command = [sys.executable, os.path.abspath(__file__), "--child"] + sys.argv[1:]
+    result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    cost = 0.0
+    for model_id, usage in report["usage"].items():
+        if "input_tokens" not in usage:
+            continue
+        input_price, output_price = PRICES[model_id]
+        usage["cost_usd"] = round(usage["input_tokens"] / 1000 * input_price + usage["output_tokens"] / 1000 * output_price, 6)
+        cost += usage["cost_usd"]
+    return {
+        "latency": summarize(report["samples"]),
+        "errors": len(report["errors"]),
+        "models": report["usage"],
+        "cost_per_request_usd": round(cost / args.requests, 6),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64, help="Uncached rag_flow calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent rag_flow calls")
+    parser.add_argument("--large-latency", type=float, default=0.4, help="Seconds per call of the large model")
+    parser.add_argument("--small-latency", type=float, default=0.1, help="Seconds per call of the small model")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of large model calls throttled")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="BEDROCK_RETRY_BASE_DELAY_SECONDS")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+    report = {name: run_scenario(name, args) for name in SCENARIOS}
+    baseline, routed = report["single_model"], report["routed"]
+    report["routed_vs_single_model"] = {
+        "p50_ms_saved": round(baseline["latency"]["p50_ms"] - routed["latency"]["p50_ms"], 3),
+        "cost_per_request_saved_pct": round(
+            (1 - routed["cost_per_request_usd"] / baseline["cost_per_request_usd"]) * 100, 1)
+        if baseline["cost_per_request_usd"] else 0.0,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
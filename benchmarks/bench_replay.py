@@ -0,0 +1,116 @@
+"""
+Record the Bedrock, knowledge base and GitHub traffic of lambda_handler once, then replay it offline.
+
+record: runs lambda_handler on the findings of --findings (one title per line) against the live
+services, with the Lambda environment variables and AWS credentials of the caller, and writes the
+traffic to --cassette (see trafficCassette.py) and the handler's responses next to it
+(<cassette>.responses.json).
+
+replay: runs the same findings --repeat times at --concurrency, with every Bedrock, Retrieve,
+Secrets Manager and GitHub call served from the cassette with the recorded latencies or, with
+--latency zero, at once. Reports latency percentiles and throughput, the responses of the first pass
+that differ from the recorded ones, and the requests the cassette could not answer (a prompt or
+chain change that altered the calls) or that it answered but were never made. Concurrent replays
+of GitHub commits may miss: their recorded order only holds for the order they were recorded in.
+
+Usage:
+    KB_ID=... MODEL_ID=... GITHUB_REPO=... GITHUB_OWNER=... \\
+        python benchmarks/bench_replay.py record --findings findings.txt --cassette trace.jsonl.gz
+    python benchmarks/bench_replay.py replay --findings findings.txt --cassette trace.jsonl.gz --latency zero --concurrency 8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_lambda_e2e import BenchContext, agent_event
+from common import LAMBDA_CODE_DIR, setup_lambda_path, summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("--findings", required=True, help="Finding titles, one per line")
+    parser.add_argument("--cassette", default="trace.jsonl.gz", help="Cassette file, gzip compressed when it ends with .gz")
+    parser.add_argument("--latency", choices=("recorded", "zero"), default="recorded", help="Latency of replayed responses")
+    parser.add_argument("--match", choices=("request", "operation"), default="request",
+                        help="Match replayed requests on their body, or on the operation only")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent lambda_handler invocations")
+    parser.add_argument("--repeat", type=int, default=1, help="Times the findings are replayed")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra Lambda environment variables")
+    return parser.parse_args()
+
+
+def responses_path(cassette):
+    return cassette + ".responses.json"
+
+
+def run(args):
+    # The remediation cache would answer repeated findings without any model call
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["METRICS_ENABLED"] = "false"
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+    os.environ.update(CASSETTE_MODE=args.mode, CASSETTE_PATH=args.cassette, CASSETTE_LATENCY=args.latency,
+                      CASSETTE_MATCH=args.match)
+    if args.mode == "replay":
+        # Requests never leave the process, the dummy credentials only let boto3 sign them
+        setup_lambda_path()
+    elif os.path.exists(args.cassette):
+        raise SystemExit("{} exists, record to a new cassette".format(args.cassette))
+    else:
+        # Recording uses the caller's own environment and credentials
+        sys.path.insert(0, LAMBDA_CODE_DIR)
+    logging.disable(logging.INFO)
+
+    import index
+    import trafficCassette
+    with open(args.findings) as f:
+        titles = [line.strip() for line in f if line.strip()]
+
+    def invoke(title):
+        start = time.perf_counter()
+        try:
+            response = index.lambda_handler(agent_event(title), BenchContext())
+            body = response["response"]["responseBody"]["application/json"]["body"]
+        except Exception as e:
+            body = "{}: {}".format(type(e).__name__, e)
+        return title, body, time.perf_counter() - start
+
+    runs = titles * (args.repeat if args.mode == "replay" else 1)
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(invoke, runs))
+    wall = time.perf_counter() - wall_start
+    cassette = trafficCassette.get_cassette()
+    report = {
+        "mode": args.mode,
+        "requests": len(results),
+        "latency": summarize([seconds for _, _, seconds in results]),
+        "throughput_rps": round(len(results) / wall, 3) if wall else 0.0,
+        "cassette": dict(cassette.stats),
+    }
+    if args.mode == "record":
+        trafficCassette.uninstall_cassette()
+        with open(responses_path(args.cassette), "w") as f:
+            json.dump({title: body for title, body, _ in results}, f, indent=2)
+        return report
+
+    with open(responses_path(args.cassette)) as f:
+        recorded = json.load(f)
+    report["cassette"]["unused"] = cassette.unused()
+    # Later passes run on a warm container, e.g. a template committed by the first pass is not committed again
+    report["changed_responses"] = sorted(title for title, body, _ in results[:len(titles)] if recorded.get(title) != body)
+    return report
+
+
+def main():
+    print(json.dumps(run(parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
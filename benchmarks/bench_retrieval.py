@@ -0,0 +1,93 @@
+"""
+Compare the local BM25 retriever (RETRIEVER=local) with the Bedrock knowledge base on a labelled
+set of Security Hub findings.
+
+Every label in data/retrieval_labels.json names the ASR playbook or Systems Manager runbook that
+remediates the finding. A finding counts as recalled at k when one of the top k retrieved chunks
+mentions that runbook (ignoring whitespace, which the PDF extraction breaks up). Chain 1 only sees
+what retrieval returns, so a miss here is a finding chain 1 cannot map to its runbook.
+
+The local index always runs. The knowledge base runs only when --kb-id is given, with the
+default AWS credentials, and uses the same retrieval configuration as the Lambda function.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--k 4] [--iterations 20] [--kb-id <knowledge base id>]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from common import REPO_ROOT, setup_lambda_path, summarize
+
+DEFAULT_LABELS = os.path.join(REPO_ROOT, "benchmarks", "data", "retrieval_labels.json")
+
+
+def compact(text):
+    return re.sub(r"\s+", "", text).casefold()
+
+
+def evaluate(client, labels, k, kb_id, iterations):
+    """
+    Run every labelled finding through client.retrieve and measure recall@k, MRR and latency.
+    """
+    configuration = {"vectorSearchConfiguration": {"numberOfResults": k, "overrideSearchType": "HYBRID"}}
+    hits, reciprocal_ranks, samples, misses = 0, 0.0, [], []
+    for label in labels:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.retrieve(retrievalQuery={"text": label["finding"]}, knowledgeBaseId=kb_id,
+                                       retrievalConfiguration=configuration)
+            samples.append(time.perf_counter() - start)
+        texts = [compact(result["content"]["text"]) for result in response["retrievalResults"]]
+        expected = compact(label["expected"])
+        rank = next((i for i, text in enumerate(texts, start=1) if expected in text), None)
+        if rank is None:
+            misses.append(label["finding"])
+        else:
+            hits += 1
+            reciprocal_ranks += 1.0 / rank
+    return {
+        "recall_at_k": round(hits / len(labels), 3),
+        "mrr": round(reciprocal_ranks / len(labels), 3),
+        "latency": summarize(samples),
+        "misses": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="Labelled findings")
+    parser.add_argument("--k", type=int, default=4, help="Number of results per query")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed queries per finding (local index)")
+    parser.add_argument("--kb-id", help="Also evaluate this Bedrock knowledge base")
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION"), help="Knowledge base region")
+    args = parser.parse_args()
+
+    setup_lambda_path()
+    from localRetriever import DEFAULT_INDEX_PATH, Bm25Index, LocalKnowledgeBaseClient
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+
+    start = time.perf_counter()
+    bm25_index = Bm25Index(DEFAULT_INDEX_PATH)
+    open_ms = (time.perf_counter() - start) * 1000
+    report = {"labels": len(labels), "k": args.k}
+    report["local"] = evaluate(LocalKnowledgeBaseClient(bm25_index), labels, args.k, None, args.iterations)
+    report["local"]["index_open_ms"] = round(open_ms, 3)
+    report["local"]["index_bytes"] = os.path.getsize(DEFAULT_INDEX_PATH)
+    report["local"]["chunks"] = bm25_index.doc_count
+
+    if args.kb_id:
+        import boto3
+        client = boto3.client("bedrock-agent-runtime", region_name=args.region)
+        # One query per finding: knowledge base calls are billed and rate limited
+        report["knowledge_base"] = evaluate(client, labels, args.k, args.kb_id, 1)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
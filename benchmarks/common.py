@@ -0,0 +1,73 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The Lambda code is deployed as a flat asset directory, so benchmarks put it on sys.path and
+import the modules the same way the Lambda runtime does (``import index``).
+"""
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_CODE_DIR = os.path.join(REPO_ROOT, "aws_bedrock_langchain_python_cdk", "lambda", "code", "langchain")
+
+# Environment the Lambda function is deployed with. Dummy credentials let boto3 build clients
+# without ever reaching AWS.
+DEFAULT_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "KB_ID": "BENCHKBID",
+    "MODEL_ID": "anthropic.claude-3-sonnet-20240229-v1:0",
+    "GITHUB_REPO": "remediations",
+    "GITHUB_OWNER": "bench-owner",
+}
+
+
+def setup_lambda_path():
+    """
+    Put the Lambda code directory on sys.path and fill in any missing Lambda environment variables.
+    """
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    if LAMBDA_CODE_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_CODE_DIR)
+
+
+def percentile(samples, pct):
+    """
+    Return the pct-th percentile of samples using nearest-rank interpolation.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(samples):
+    """
+    Summarize a list of durations in seconds as milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def time_calls(fn, iterations):
+    """
+    Call fn() iterations times and return the wall time of each call in seconds.
+    """
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
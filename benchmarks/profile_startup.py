@@ -0,0 +1,123 @@
+"""
+Profile the import time of the Lambda package.
+
+Each phase runs in a fresh interpreter with ``python -X importtime`` so every measurement is a
+cold import, like the init phase of a new Lambda execution environment:
+
+- ``init``: ``import index``, what the Lambda runtime does before the first invocation.
+- ``chains``: init plus building the LLM and the chains, the extra imports paid by the first
+  request that misses the remediation cache.
+- ``commit``: init plus creating the GitHub committer client, the extra imports paid by the
+  first request that commits a template.
+
+Reports the median wall time of each phase, the import time per top-level package (self time of
+all its modules) and the slowest modules by cumulative time. For numbers that match the deployed
+function, run it on the Lambda Python 3.11 ARM64 image (public.ecr.aws/lambda/python:3.11-arm64).
+
+Usage:
+    python benchmarks/profile_startup.py [--runs 5] [--top 15] [--output results.json]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from common import DEFAULT_ENV, LAMBDA_CODE_DIR
+
+# Packages that should only be loaded on the code paths that use them
+DEFERRED_PACKAGES = ["langchain", "langchain_community", "langchain_core", "pydantic", "github"]
+
+PHASES = {
+    "init": "import index",
+    "chains": (
+        "import index\n"
+        "handler = index.get_remediation_handler(index.modelId)\n"
+        "handler.retrievalChain(index.prompt1, index.kb_id)\n"
+        "handler.QAChain(index.prompt2)\n"
+    ),
+    "commit": "import index\nfrom github import Github\nGithub('token')\n",
+}
+
+# Runs the phase, then reports its wall time and which deferred packages it loaded
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, nesting depth) per import.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return entries
+
+
+def run_phase(statement):
+    env = dict(os.environ)
+    for key, value in DEFAULT_ENV.items():
+        env.setdefault(key, value)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    child = CHILD.format(statement=statement, deferred=DEFERRED_PACKAGES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", child],
+        cwd=LAMBDA_CODE_DIR, env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["imports"] = parse_importtime(result.stderr)
+    return report
+
+
+def profile_phase(statement, runs, top):
+    reports = [run_phase(statement) for _ in range(runs)]
+    package_ms = {}
+    module_ms = {}
+    for report in reports:
+        for module, self_us, cumulative_us, _ in report["imports"]:
+            package = module.split(".")[0]
+            package_ms.setdefault(package, []).append(self_us / 1000)
+            module_ms.setdefault(module, []).append(cumulative_us / 1000)
+    # Sum per run, then take the median across runs
+    packages = {
+        package: round(sum(samples) / runs, 1) for package, samples in package_ms.items()
+    }
+    modules = {module: round(statistics.median(samples), 1) for module, samples in module_ms.items()}
+    return {
+        "median_ms": round(statistics.median(report["seconds"] for report in reports) * 1000, 1),
+        "loaded_deferred": reports[-1]["loaded"],
+        "packages_ms": dict(sorted(packages.items(), key=lambda item: -item[1])[:top]),
+        "slowest_modules_ms": dict(sorted(modules.items(), key=lambda item: -item[1])[:top]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per phase")
+    parser.add_argument("--top", type=int, default=15, help="Packages and modules to report per phase")
+    parser.add_argument("--phase", action="append", choices=sorted(PHASES), help="Phases to run (default: all)")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = {name: profile_phase(PHASES[name], args.runs, args.top) for name in (args.phase or PHASES)}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
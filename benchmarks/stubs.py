@@ -0,0 +1,362 @@
+"""
+Offline stand-ins for the AWS services used by the Lambda function.
+
+Each stub implements the boto3 client methods the function calls, with configurable latency and
+failure injection, and records how long each call took in the current request's StageTimer.
+GitHub is served by the FakeGitHubServer used by the unit tests.
+"""
+import contextvars
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from common import REPO_ROOT
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "aws_bedrock_langchain_python_cdk", "tests"))
+from fake_github import FakeGitHubServer  # noqa: E402,F401
+
+# Timings of the request being served on this thread/context, see StageTimer
+CURRENT_TIMER = contextvars.ContextVar("current_timer", default=None)
+
+
+class StageTimer:
+    """
+    Accumulates wall time per stage for one request.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+
+def record_stage(stage, seconds):
+    timer = CURRENT_TIMER.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+class FaultProfile:
+    """
+    Latency and failure injection for one stub.
+
+    Args:
+        latency (float): Mean latency in seconds added to each call.
+        jitter (float): Latency is drawn uniformly from latency +/- jitter.
+        failure_rate (float): Probability that a call raises error_code.
+        error_code (str): The AWS error code raised for injected failures.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, error_code="ThrottlingException", seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.error_code = error_code
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self, operation):
+        with self._lock:
+            delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0.0)
+            fail = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ClientError({"Error": {"Code": self.error_code, "Message": "Injected failure"}}, operation)
+
+
+# Control titles used to build realistic agent events, with the runbook the stub KB "knows" for them
+FINDINGS = [
+    ("S3 general purpose buckets should have server-side encryption enabled", "AWS-EnableS3BucketEncryption"),
+    ("S3 general purpose buckets should block public access", "ASR-ConfigureS3BucketPublicAccessBlock"),
+    ("CloudTrail log file validation should be enabled", "ASR-EnableCloudTrailLogFileValidation"),
+    ("CloudTrail should be enabled and configured with at least one multi-Region trail", "ASR-CreateMultiRegionTrail"),
+    ("VPC flow logging should be enabled in all VPCs", "ASR-EnableVPCFlowLogs"),
+    ("EBS default encryption should be enabled", "ASR-EnableEbsEncryptionByDefault"),
+    ("RDS DB instances should prohibit public access", "ASR-DisablePublicAccessToRDSInstance"),
+    ("IAM root user access key should not exist", None),
+    ("Database Migration Service replication instances should not be public", None),
+    ("API Gateway REST API stages should have AWS X-Ray tracing enabled", "AWSConfigRemediation-EnableAPIGatewayTracing"),
+    ("Amazon SageMaker notebook instances should not have direct internet access", None),
+    ("Lambda functions should use supported runtimes", None),
+    ("Secrets Manager secrets should have automatic rotation enabled", "ASR-EnableAutoSecretRotation"),
+    ("KMS keys should not be deleted unintentionally", None),
+    ("EC2 instances should not have a public IPv4 address", None),
+    ("GuardDuty should be enabled", "ASR-EnableGuardDuty"),
+]
+RUNBOOKS = dict(FINDINGS)
+
+CHAIN1_MARKER = "<security_hub_finding_title>"
+CHAIN2_MARKER = "create an AWS CloudFormation template"
+TEMPLATE = """AWSTemplateFormatVersion: '2010-09-09'
+Description: Remediation for {title}
+Parameters:
+  AutomationAssumeRole:
+    Type: String
+    Description: Role assumed by the automation
+Resources:
+  RemediationDocument:
+    Type: AWS::SSM::Document
+    Properties:
+      DocumentType: Automation
+      Content:
+        schemaVersion: '0.3'
+        assumeRole: !Ref AutomationAssumeRole
+        mainSteps:
+          - name: Remediate
+            action: aws:executeScript
+            inputs:
+              Runtime: python3.11
+              Handler: handler
+              Script: "def handler(events, context):\\n    return {{}}"
+"""
+TRAILING_PROSE = " ".join(["This template defines the SSM document and explains each resource in detail."] * 30)
+
+
+def find_title(prompt):
+    for title, _ in FINDINGS:
+        if title in prompt:
+            return title
+    match = re.search(r"<security_hub_finding_title>(.*?)</security_hub_finding_title>", prompt, re.S)
+    return match.group(1).strip() if match else "unknown finding"
+
+
+def answer(prompt):
+    """
+    Produce the model output a well-behaved model would give for one of the three prompts.
+    """
+    title = find_title(prompt)
+    if CHAIN1_MARKER in prompt:
+        runbook = RUNBOOKS.get(title)
+        return "chain_1", json.dumps({
+            "remediation_details": "Remediates: " + title,
+            "remediation_available": runbook is not None,
+            "remediation_runbook": runbook or "no remediation available",
+            "security_hub_finding_title": title,
+            "resource_type": title.split()[0] + " Resource",
+        })
+    if CHAIN2_MARKER in prompt:
+        return "chain_2", "Here is the template:\n```yaml\n" + TEMPLATE.format(title=title) + "```\n" + TRAILING_PROSE
+    return "chain_3", "I want to inform you that a remediation runbook is available for " + title + "."
+
+
+def _token_count(text):
+    return max(len(text) // 4, 1)
+
+
+class StubBedrockRuntime:
+    """
+    bedrock-runtime stand-in answering Anthropic messages API (InvokeModel) and Converse requests.
+
+    Args:
+        fault (FaultProfile): Latency/failures applied once per call.
+        token_latency (float): Extra seconds per output token, paid for the whole completion by
+            invoke_model and per streamed chunk by invoke_model_with_response_stream.
+        model_faults (dict): Model id -> FaultProfile applied instead of fault to calls of that model.
+    """
+
+    def __init__(self, fault=None, token_latency=0.0, model_faults=None):
+        self.fault = fault or FaultProfile()
+        self.token_latency = token_latency
+        self.model_faults = model_faults or {}
+        self.calls = []
+        # Model id -> {"calls", "input_tokens", "output_tokens"} of the calls that returned
+        self.usage = {}
+        self._usage_lock = threading.Lock()
+
+    def _apply_fault(self, modelId, operation):
+        self.model_faults.get(modelId, self.fault).apply(operation)
+
+    def _record_usage(self, modelId, prompt, text):
+        with self._usage_lock:
+            usage = self.usage.setdefault(modelId, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            usage["calls"] += 1
+            usage["input_tokens"] += _token_count(prompt)
+            usage["output_tokens"] += _token_count(text)
+
+    def _prompt(self, body):
+        request = json.loads(body)
+        parts = []
+        for message in request.get("messages", []):
+            content = message["content"]
+            parts.append(content if isinstance(content, str) else "".join(item.get("text", "") for item in content))
+        return "".join(parts) or request.get("prompt", "")
+
+    def invoke_model(self, body, modelId, **kwargs):
+        start = time.perf_counter()
+        prompt = self._prompt(body)
+        stage, text = answer(prompt)
+        self.calls.append((modelId, stage))
+        self._apply_fault(modelId, "InvokeModel")
+        self._record_usage(modelId, prompt, text)
+        if self.token_latency:
+            time.sleep(self.token_latency * _token_count(text))
+        record_stage(stage + "_model", time.perf_counter() - start)
+        payload = {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn"}
+        return {
+            "body": io.BytesIO(json.dumps(payload).encode("utf-8")),
+            "ResponseMetadata": {"HTTPHeaders": {
+                "x-amzn-bedrock-input-token-count": str(_token_count(prompt)),
+                "x-amzn-bedrock-output-token-count": str(_token_count(text)),
+            }},
+        }
+
+    def _converse_prompt(self, messages):
+        return "".join(block.get("text", "") for message in messages for block in message["content"])
+
+    def converse(self, modelId, messages, **kwargs):
+        start = time.perf_counter()
+        prompt = self._converse_prompt(messages)
+        stage, text = answer(prompt)
+        self.calls.append((modelId, stage))
+        self._apply_fault(modelId, "Converse")
+        self._record_usage(modelId, prompt, text)
+        if self.token_latency:
+            time.sleep(self.token_latency * _token_count(text))
+        record_stage(stage + "_model", time.perf_counter() - start)
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": _token_count(prompt), "outputTokens": _token_count(text),
+                      "totalTokens": _token_count(prompt) + _token_count(text)},
+        }
+
+    def converse_stream(self, modelId, messages, **kwargs):
+        prompt = self._converse_prompt(messages)
+        stage, text = answer(prompt)
+        self.calls.append((modelId, stage))
+        self._apply_fault(modelId, "ConverseStream")
+        self._record_usage(modelId, prompt, text)
+        return {"stream": self._converse_events(stage, text)}
+
+    def _converse_events(self, stage, text):
+        start = time.perf_counter()
+        yield {"messageStart": {"role": "assistant"}}
+        try:
+            for index in range(0, len(text), 16):
+                if self.token_latency:
+                    time.sleep(self.token_latency * 4)
+                yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": text[index:index + 16]}}}
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        finally:
+            record_stage(stage + "_model", time.perf_counter() - start)
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        prompt = self._prompt(body)
+        stage, text = answer(prompt)
+        self.calls.append((modelId, stage))
+        self._apply_fault(modelId, "InvokeModelWithResponseStream")
+        self._record_usage(modelId, prompt, text)
+        return {"body": self._events(stage, text)}
+
+    def _events(self, stage, text):
+        start = time.perf_counter()
+        yield {"chunk": {"bytes": json.dumps({"type": "message_start"}).encode("utf-8")}}
+        try:
+            for index in range(0, len(text), 16):
+                if self.token_latency:
+                    time.sleep(self.token_latency * 4)
+                delta = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text[index:index + 16]}}
+                yield {"chunk": {"bytes": json.dumps(delta).encode("utf-8")}}
+            yield {"chunk": {"bytes": json.dumps({"type": "content_block_stop"}).encode("utf-8")}}
+        finally:
+            record_stage(stage + "_model", time.perf_counter() - start)
+
+
+class StubBedrockAgentRuntime:
+    """
+    bedrock-agent-runtime stand-in for the knowledge base Retrieve API.
+    """
+
+    def __init__(self, fault=None):
+        self.fault = fault or FaultProfile()
+        self.calls = 0
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId, retrievalConfiguration=None, **kwargs):
+        start = time.perf_counter()
+        self.calls += 1
+        self.fault.apply("Retrieve")
+        query = retrievalQuery["text"]
+        count = ((retrievalConfiguration or {}).get("vectorSearchConfiguration") or {}).get("numberOfResults", 4)
+        runbook = RUNBOOKS.get(query)
+        results = []
+        for rank in range(count):
+            text = "Control remediation for {}. ".format(query)
+            if runbook and rank == 0:
+                text += "The {} runbook remediates this control. ".format(runbook)
+            results.append({
+                "content": {"text": text * 20},
+                "location": {"type": "S3", "s3Location": {"uri": "s3://kb/automated-security-response-on-aws.pdf"}},
+                "score": round(0.9 - rank * 0.1, 3),
+            })
+        record_stage("kb_retrieval", time.perf_counter() - start)
+        return {"retrievalResults": results}
+
+
+class StubSecretsManager:
+    """
+    secretsmanager stand-in returning the GitHub token.
+    """
+
+    def __init__(self, fault=None, token="bench-token"):
+        self.fault = fault or FaultProfile()
+        self.token = token
+        self.calls = 0
+
+    def get_secret_value(self, SecretId, **kwargs):
+        start = time.perf_counter()
+        self.calls += 1
+        self.fault.apply("GetSecretValue")
+        record_stage("secrets", time.perf_counter() - start)
+        return {"Name": SecretId, "SecretString": self.token}
+
+
+class StubServices:
+    """
+    The set of stubs served in place of boto3 clients, by service name.
+    """
+
+    def __init__(self, bedrock_runtime=None, bedrock_agent_runtime=None, secretsmanager=None):
+        self.clients = {
+            "bedrock-runtime": bedrock_runtime or StubBedrockRuntime(),
+            "bedrock-agent-runtime": bedrock_agent_runtime or StubBedrockAgentRuntime(),
+            "secretsmanager": secretsmanager or StubSecretsManager(),
+        }
+        self._real_client = None
+
+    def client(self, service_name=None, *args, **kwargs):
+        service_name = service_name or args[0]
+        if service_name in self.clients:
+            return self.clients[service_name]
+        return self._real_client(service_name, *args, **kwargs)
+
+    @contextmanager
+    def installed(self):
+        """
+        Route boto3.client() calls for the stubbed services to the stubs.
+        """
+        import boto3
+        self._real_client = boto3.client
+        with patch("boto3.client", side_effect=self.client):
+            yield self
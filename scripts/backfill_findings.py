@@ -0,0 +1,65 @@
+"""
+Pre-generate remediations for the active failed findings of a Security Hub account.
+
+Pages through GetFindings (failed compliance, active, workflow NEW or NOTIFIED), groups the findings
+by control and runs the remediation flow of the Lambda function once per control, --concurrency
+controls at a time. Every --chunk-size controls, the generated templates are committed together
+through GitHubCommitter, or queued in async commit mode. Progress is saved to --checkpoint after
+every page and every chunk; run the same command again to resume an interrupted backfill. Controls
+whose remediation failed are retried by the next run.
+
+Runs with AWS credentials for Security Hub, Bedrock and the github-token secret, and with the
+environment variables of the Lambda function (KB_ID, MODEL_ID, GITHUB_REPO, GITHUB_OWNER and any
+optional ones, such as COMMIT_MODE or CACHE_TABLE_NAME).
+
+Usage:
+    KB_ID=... MODEL_ID=... GITHUB_REPO=... GITHUB_OWNER=... python scripts/backfill_findings.py \\
+        [--region us-east-1] [--checkpoint backfill-checkpoint.json] [--concurrency 4] [--chunk-size 10]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_CODE_DIR = os.path.join(REPO_ROOT, "aws_bedrock_langchain_python_cdk", "lambda", "code", "langchain")
+REQUIRED_ENV = ("KB_ID", "MODEL_ID", "GITHUB_REPO", "GITHUB_OWNER")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--region", default=os.environ.get("AWS_DEFAULT_REGION"), help="Security Hub and Bedrock region")
+    parser.add_argument("--checkpoint", default="backfill-checkpoint.json", help="Progress file, resumed when it exists")
+    parser.add_argument("--concurrency", type=int, default=4, help="Controls remediated concurrently")
+    parser.add_argument("--chunk-size", type=int, default=10, help="Controls committed together")
+    args = parser.parse_args()
+
+    missing = [name for name in REQUIRED_ENV if not os.environ.get(name)]
+    if missing:
+        parser.error("set the environment variables {}".format(", ".join(missing)))
+    if not args.region:
+        parser.error("set --region or AWS_DEFAULT_REGION")
+    os.environ["AWS_DEFAULT_REGION"] = args.region
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    sys.path.insert(0, LAMBDA_CODE_DIR)
+    import boto3
+    import index
+    from findingBackfill import BackfillCheckpoint, run_backfill
+
+    index.batch_max_concurrency = args.concurrency
+    handler = index.get_remediation_handler(index.modelId)
+
+    def remediate(sechub_findings):
+        return index.remediate_findings(handler, sechub_findings, None)
+
+    report = run_backfill(boto3.client("securityhub", region_name=args.region), BackfillCheckpoint(args.checkpoint),
+                          remediate, args.chunk_size)
+    print(json.dumps(report, indent=2))
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
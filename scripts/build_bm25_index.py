@@ -0,0 +1,78 @@
+"""
+Build the local BM25 index used by the "local" retriever from the files in data-source/.
+
+PDF pages (read with pypdf) and text/Markdown files are split into overlapping word windows, and
+the chunks are indexed with localRetriever.write_index into a file the Lambda function memory-maps
+at cold start.
+
+Requires pypdf (see requirements-dev.txt); the Lambda function only reads the index file.
+
+Usage:
+    python scripts/build_bm25_index.py [--source data-source] [--chunk-words 200] [--overlap-words 40]
+        [--output aws_bedrock_langchain_python_cdk/lambda/code/langchain/kb_index.bm25]
+"""
+import argparse
+import os
+import sys
+import unicodedata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_CODE_DIR = os.path.join(REPO_ROOT, "aws_bedrock_langchain_python_cdk", "lambda", "code", "langchain")
+DEFAULT_SOURCE = os.path.join(REPO_ROOT, "data-source")
+DEFAULT_OUTPUT = os.path.join(LAMBDA_CODE_DIR, "kb_index.bm25")
+
+sys.path.insert(0, LAMBDA_CODE_DIR)
+from localRetriever import write_index  # noqa: E402
+
+
+def read_pages(path):
+    """
+    Yield (page number, text) for a source file; text files are a single page.
+    """
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        for page_number, page in enumerate(PdfReader(path).pages, start=1):
+            yield page_number, page.extract_text()
+    elif path.lower().endswith((".txt", ".md")):
+        with open(path) as f:
+            yield 1, f.read()
+
+
+def chunk_words(text, chunk_words, overlap_words):
+    """
+    Split text into windows of chunk_words words, each overlapping the previous one by overlap_words.
+    """
+    words = unicodedata.normalize("NFKC", text).split()
+    step = max(chunk_words - overlap_words, 1)
+    for start in range(0, max(len(words) - overlap_words, 1), step):
+        window = words[start:start + chunk_words]
+        if window:
+            yield " ".join(window)
+
+
+def build_chunks(source_dir, chunk_words_count, overlap_words):
+    chunks = []
+    for name in sorted(os.listdir(source_dir)):
+        for page_number, text in read_pages(os.path.join(source_dir, name)):
+            for chunk in chunk_words(text, chunk_words_count, overlap_words):
+                chunks.append({"text": chunk, "source": name, "page": page_number})
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Directory with the knowledge base documents")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Index file to write")
+    parser.add_argument("--chunk-words", type=int, default=200, help="Words per chunk")
+    parser.add_argument("--overlap-words", type=int, default=40, help="Words shared by consecutive chunks")
+    args = parser.parse_args()
+
+    chunks = build_chunks(args.source, args.chunk_words, args.overlap_words)
+    write_index(args.output, chunks)
+    print("Indexed {} chunks from {} into {} ({} bytes)".format(
+        len(chunks), args.source, args.output, os.path.getsize(args.output)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Build the control index used by the rag_flow fast path from the ASR implementation guide.
+
+Extracts the playbook table of data-source/automated-security-response-on-aws.pdf (the
+"Playbooks" section of the developer guide): for every Security Hub control with a remediation,
+the ASR playbook or AWS-owned Systems Manager runbook that remediates it and the control
+description. The result is written as compact JSON next to the Lambda code, where
+controlIndex.py loads it.
+
+Requires pypdf (see requirements-dev.txt); the Lambda function only reads the JSON.
+
+Usage:
+    python scripts/build_control_index.py [--pdf data-source/automated-security-response-on-aws.pdf]
+        [--output aws_bedrock_langchain_python_cdk/lambda/code/langchain/control_index.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import unicodedata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PDF = os.path.join(REPO_ROOT, "data-source", "automated-security-response-on-aws.pdf")
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, "aws_bedrock_langchain_python_cdk", "lambda", "code", "langchain", "control_index.json")
+
+sys.path.insert(0, os.path.dirname(DEFAULT_OUTPUT))
+from controlIndex import INDEX_VERSION, title_key  # noqa: E402
+
+ROW_START = re.compile(r"^ (ASR|AWS)-\S")
+CONTROL_ID = re.compile(r"^[A-Za-z][A-Za-z0-9]*\.\d+$")
+# The playbook table starts after its column headers and ends with the next section
+TABLE_HEADER = re.compile(r"Description\s+AWS FSBP")
+TABLE_SECTION = "Playbooks"
+TABLE_END = "Adding new remediations"
+# Words the table cells wrap mid-word ("multi-Reg" / "ion"); pypdf has no hyphenation to tell them apart
+# from two words, and most of them never appear whole in the guide
+WRAPPED_WORDS = {
+    "authentication", "cloudtrail", "configured", "integrated", "monitoring", "notification", "region", "side",
+    "unauthorized",
+}
+# The guide says "activated" where Security Hub control titles say "enabled"
+TITLE_WORDS = {"activated": "enabled", "deactivated": "disabled"}
+# Controls whose guide description is not the Security Hub control title
+TITLE_OVERRIDES = {
+    "IAM.7": "Password policies for IAM users should have strong configurations",
+}
+
+
+def fields(line):
+    """
+    Split a layout line into (start column, text) fields separated by two or more spaces.
+    """
+    return [(match.start(), match.group(0)) for match in re.finditer(r"\S+(?: \S+)*", line)]
+
+
+def outline_entries(reader, outline=None):
+    """
+    Yield (title, page index) for every entry of the PDF outline, in document order.
+    """
+    for item in reader.outline if outline is None else outline:
+        if isinstance(item, list):
+            yield from outline_entries(reader, item)
+        else:
+            yield item.title, reader.get_destination_page_number(item)
+
+
+def table_pages(reader):
+    """
+    Return the pages of the "Playbooks" section that ends at "Adding new remediations", or every page
+    when the outline does not have them. Extracting text is slow, so only these pages are read.
+    """
+    entries = list(outline_entries(reader))
+    titles = [title for title, _ in entries]
+    if TABLE_END in titles:
+        end = titles.index(TABLE_END)
+        starts = [i for i, title in enumerate(titles[:end]) if title == TABLE_SECTION]
+        if starts:
+            return reader.pages[entries[starts[-1]][1]:entries[end][1] + 1]
+    return reader.pages
+
+
+def table_lines(pdf_path):
+    """
+    Yield (page number, line) for the lines of the playbook table, in reading order.
+    """
+    from pypdf import PdfReader
+
+    in_table = False
+    for page in table_pages(PdfReader(pdf_path)):
+        for line in page.extract_text(extraction_mode="layout").splitlines():
+            if not in_table:
+                in_table = bool(TABLE_HEADER.search(line))
+                continue
+            if line.startswith(TABLE_END):
+                return
+            # Table cells are indented, page headers and footers start at the margin
+            if not line.strip() or line.startswith(" "):
+                yield page.page_number, line.rstrip()
+
+
+def split_rows(lines):
+    """
+    Group table lines into rows, each a list of lines starting at a playbook name.
+    """
+    row = None
+    for page_number, line in lines:
+        if ROW_START.match(line):
+            if row:
+                yield row
+            row = {"page": page_number, "lines": []}
+        if row is not None:
+            row["lines"].append(line)
+    if row:
+        yield row
+
+
+def parse_row(row, control_column):
+    """
+    Parse one table row.
+
+    The first lines, up to the first blank line, hold the wrapped playbook name in the first column
+    and the wrapped control IDs in the standard columns. The description follows below the name,
+    usually after a blank line. Name fragments never contain spaces, which tells the two apart when
+    the blank line is missing.
+
+    Returns:
+        dict: {"control_id", "runbook", "description"} or None when the row has no security control ID.
+    """
+    head, description = [], []
+    first = fields(row["lines"][0])
+    name_end = first[1][0] if len(first) > 1 else len(row["lines"][0])
+    target = head
+    for line in row["lines"]:
+        if not line.strip():
+            if head:
+                target = description
+            continue
+        if target is head and head and " " in line[:name_end].strip():
+            target = description
+        target.append(line)
+    runbook = "".join(line[:name_end].strip() for line in head)
+    control_start, control_id = first[-1]
+    if control_start < control_column - 3:
+        # The security control ID column is empty for this row
+        return None
+    for line in head[1:]:
+        for start, text in fields(line):
+            if abs(start - control_start) <= 3:
+                control_id += text
+    # Column positions are only valid on the raw text, ligatures are expanded afterwards
+    control_id = unicodedata.normalize("NFKC", control_id)
+    if not CONTROL_ID.match(control_id):
+        return None
+    return {
+        "control_id": control_id,
+        "runbook": unicodedata.normalize("NFKC", runbook),
+        "description": clean_title(join_lines(unicodedata.normalize("NFKC", line) for line in description)),
+    }
+
+
+def join_lines(lines):
+    """
+    Join the wrapped lines of a description cell, without a space where a line ends with a hyphen or a
+    line break splits one of WRAPPED_WORDS.
+    """
+    text = ""
+    for line in lines:
+        line = line.strip()
+        if text and not text.endswith("-"):
+            end, start = re.search(r"[A-Za-z]*$", text).group(0), re.match(r"[a-z]*", line).group(0)
+            if not (end and start and (end + start).casefold() in WRAPPED_WORDS):
+                text += " "
+        text += line
+    return text
+
+
+def clean_title(description):
+    """
+    Turn a description from the guide into the Security Hub control title: drop a description printed
+    twice and use the Security Hub wording.
+    """
+    words = description.split()
+    half = len(words) // 2
+    if len(words) % 2 == 0 and words[:half] == words[half:]:
+        words = words[:half]
+    return " ".join(TITLE_WORDS.get(word, word) for word in words)
+
+
+def build_index(pdf_path):
+    rows = list(split_rows(table_lines(pdf_path)))
+    # The security control ID is the rightmost column; its position varies slightly per page
+    control_columns = {}
+    for row in rows:
+        start = fields(row["lines"][0])[-1][0]
+        control_columns[row["page"]] = max(control_columns.get(row["page"], 0), start)
+
+    controls, titles, skipped = {}, {}, []
+    for row in rows:
+        parsed = parse_row(row, control_columns[row["page"]])
+        if parsed is None:
+            skipped.append(row["lines"][0].strip())
+            continue
+        control_id = parsed["control_id"]
+        if control_id in controls:
+            continue
+        title = TITLE_OVERRIDES.get(control_id, parsed["description"])
+        controls[control_id] = {
+            "runbook": parsed["runbook"],
+            "title": title,
+            "resource_type": control_id.split(".")[0],
+        }
+        for text in (title, parsed["description"]):
+            titles.setdefault(title_key(text), control_id)
+
+    with open(pdf_path, "rb") as f:
+        source_sha256 = hashlib.sha256(f.read()).hexdigest()
+    index = {
+        "version": INDEX_VERSION,
+        "source": os.path.basename(pdf_path),
+        "source_sha256": source_sha256,
+        "controls": dict(sorted(controls.items())),
+        "titles": dict(sorted(titles.items())),
+    }
+    return index, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="ASR implementation guide PDF")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Index file to write")
+    args = parser.parse_args()
+
+    index, skipped = build_index(args.pdf)
+    with open(args.output, "w") as f:
+        json.dump(index, f, separators=(",", ":"), sort_keys=False)
+        f.write("\n")
+    print("Indexed {} controls from {} into {}".format(len(index["controls"]), index["source"], args.output))
+    if skipped:
+        print("Skipped {} rows without a security control ID: {}".format(len(skipped), ", ".join(skipped)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
 import aws_cdk as cdk
 import aws_cdk.assertions as assertions
 from aws_bedrock_langchain_python_cdk.aws_bedrock_langchain_codepipeline_stack import AwsBedrockLangchainCodePipelineStack
@@ -39,3 +45,146 @@ def test_codepipeline_created():
 
     cloudformation_action = deploy_stage.node.find_child("CloudFormation StackSet")
     assert cloudformation_action is not None, "CloudFormation StackSet action should be created"
+
+
+def synth_buildspecs(**context):
+    app = cdk.App(context={"GITHUB_OWNER": "test-owner", "GITHUB_REPO": "test-repo", **context})
+    template = assertions.Template.from_stack(AwsBedrockLangchainCodePipelineStack(app, "PipelineStack"))
+    projects = template.find_resources("AWS::CodeBuild::Project")
+    return {name: json.loads(project["Properties"]["Source"]["BuildSpec"]) for name, project in projects.items()}, template
+
+
+def build_commands(buildspecs, project):
+    name = next(name for name in buildspecs if name.startswith(project))
+    return "\n".join(buildspecs[name]["phases"]["build"]["commands"])
+
+
+def test_changed_templates_are_validated_and_deployed_in_parallel():
+    buildspecs, template = synth_buildspecs(PIPELINE_MAX_PARALLEL=8)
+
+    for project in ("ValidateProject", "DeployProject"):
+        commands = build_commands(buildspecs, project)
+        assert 'aws s3 cp "s3://$STATE_BUCKET/$DEPLOYED_MANIFEST_KEY" deployed.manifest' in commands
+        assert 'xargs -0 -r -n 1 -P "$MAX_PARALLEL"' in commands
+    assert "validate-template" in build_commands(buildspecs, "ValidateProject")
+    deploy = build_commands(buildspecs, "DeployProject")
+    assert "--no-fail-on-empty-changeset" in deploy
+    assert 'aws s3 cp next.manifest "s3://$STATE_BUCKET/$DEPLOYED_MANIFEST_KEY"' in deploy
+    template.has_resource_properties("AWS::CodeBuild::Project", {
+        "Environment": {"EnvironmentVariables": assertions.Match.array_with([
+            {"Name": "MAX_PARALLEL", "Type": "PLAINTEXT", "Value": "8"}])}
+    })
+    template.has_resource_properties("AWS::S3::Bucket", {
+        "VersioningConfiguration": {"Status": "Enabled"}
+    })
+
+
+# A fake AWS CLI logging its calls: the state bucket is a directory, stack sets are files listing
+# their stack instances, and deploying GenRem-Bad fails
+FAKE_AWS = r"""#!/bin/bash
+echo "$*" >> "$CALLS"
+option() { printf "%s\n" "$@" | awk -v name="$1" 'NR > 1 && $0 == name { on = 1; next } on && /^--/ { on = 0 } on { print }'; }
+set_file="$STACK_SETS/$(option --stack-set-name "$@")"
+case "$1 $2" in
+  "s3 cp") if [[ $3 == s3://* ]]; then cp "$BUCKET/$(basename "$3")" "$4" 2>/dev/null; else cp "$3" "$BUCKET/$(basename "$4")"; fi;;
+  "cloudformation deploy") [[ "$*" != *GenRem-Bad* ]];;
+  "cloudformation describe-stack-set") [ -f "$set_file" ];;
+  "cloudformation create-stack-set") touch "$set_file";;
+  "cloudformation update-stack-set") echo update-operation;;
+  "cloudformation list-stack-instances") tr " " "\t" < "$set_file";;
+  "cloudformation create-stack-instances")
+    for account in $(option --accounts "$@"); do for region in $(option --regions "$@"); do echo "$account $region" >> "$set_file"; done; done
+    echo create-operation;;
+  "cloudformation describe-stack-set-operation") echo SUCCEEDED;;
+  "cloudformation list-stack-set-operation-results") printf "SUCCEEDED\tSUCCEEDED\n";;
+esac
+"""
+
+
+@pytest.fixture
+def deploy_build(tmp_path, monkeypatch):
+    """
+    Run the deploy build commands in a source directory with GenRem-A, GenRem-B and GenRem-Bad
+    templates, against the fake AWS CLI. Returns the commands run and their exit status.
+    """
+    buildspecs, _ = synth_buildspecs()
+    deploy = build_commands(buildspecs, "DeployProject")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "aws").write_text(FAKE_AWS)
+    (bin_dir / "aws").chmod(0o755)
+    source = tmp_path / "source"
+    (source / "S3 Bucket").mkdir(parents=True)
+    (source / "deploy" / "parameters").mkdir(parents=True)
+    for name in ("A", "B", "Bad"):
+        (source / "S3 Bucket" / "GenRem-{}.yaml".format(name)).write_text("Resources: {}\n")
+        (source / "deploy" / "parameters" / "S3-Bucket-GenRem-{}-params.json".format(name)).write_text("[]\n")
+    for directory in ("bucket", "stack_sets"):
+        (tmp_path / directory).mkdir()
+    calls = tmp_path / "calls"
+    monkeypatch.setenv("PATH", "{}{}{}".format(bin_dir, os.pathsep, os.environ["PATH"]))
+    for name, value in {"CALLS": calls, "BUCKET": tmp_path / "bucket", "STACK_SETS": tmp_path / "stack_sets",
+                        "STATE_BUCKET": "state", "DEPLOYED_MANIFEST_KEY": "deployed", "MAX_PARALLEL": "2",
+                        "CFN_EXEC_ROLE_NAME": "", "WORKLOAD_ACCOUNTS": "", "STACKSET_REGIONS": "us-east-1",
+                        "STACKSET_OPERATION_PREFERENCES": "RegionConcurrencyType=PARALLEL", "STACKSET_POLL_SECONDS": "0"}.items():
+        monkeypatch.setenv(name, str(value))
+
+    def run():
+        calls.write_text("")
+        result = subprocess.run(["bash", "-c", deploy], cwd=source, capture_output=True, text=True)
+        return result.returncode, calls.read_text().splitlines()
+    run.source = source
+    run.stack_sets = tmp_path / "stack_sets"
+    return run
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="The buildspecs run in bash")
+def test_deploy_commands_deploy_only_changed_templates(deploy_build):
+    def deployed_stacks():
+        status, calls = deploy_build()
+        return status, sorted(call.split("--stack-name ")[1].split()[0] for call in calls
+                              if call.startswith("cloudformation deploy"))
+
+    # The same file name under another resource type directory is another stack
+    (deploy_build.source / "S3").mkdir()
+    (deploy_build.source / "S3" / "GenRem-A.yaml").write_text("Resources: {}\n")
+    (deploy_build.source / "deploy" / "parameters" / "S3-GenRem-A-params.json").write_text("[]\n")
+
+    assert deployed_stacks() == (1, ["S3-Bucket-GenRem-A", "S3-Bucket-GenRem-B", "S3-Bucket-GenRem-Bad", "S3-GenRem-A"])
+    # The failed template is retried, the deployed ones are not
+    assert deployed_stacks() == (1, ["S3-Bucket-GenRem-Bad"])
+    (deploy_build.source / "S3 Bucket" / "GenRem-Bad.yaml").unlink()
+    (deploy_build.source / "deploy" / "parameters" / "S3-Bucket-GenRem-A-params.json").write_text(
+        '[{"ParameterKey": "K", "ParameterValue": "v"}]\n')
+    assert deployed_stacks() == (0, ["S3-Bucket-GenRem-A"])
+    assert deployed_stacks() == (0, [])
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="The buildspecs run in bash")
+def test_stack_sets_are_updated_or_created_in_every_target_region(deploy_build, monkeypatch):
+    (deploy_build.source / "S3 Bucket" / "GenRem-Bad.yaml").unlink()
+    monkeypatch.setenv("CFN_EXEC_ROLE_NAME", "StackSetExecutionRole")
+    monkeypatch.setenv("WORKLOAD_ACCOUNTS", "111111111111 222222222222")
+    monkeypatch.setenv("STACKSET_REGIONS", "us-east-1 eu-west-1")
+
+    status, calls = deploy_build()
+
+    assert status == 0
+    assert sum(call.startswith("cloudformation create-stack-set") for call in calls) == 2
+    instances = (deploy_build.stack_sets / "RemediationAutomate-S3-Bucket-GenRem-A").read_text().split("\n")
+    assert sorted(filter(None, instances)) == ["111111111111 eu-west-1", "111111111111 us-east-1",
+                                               "222222222222 eu-west-1", "222222222222 us-east-1"]
+    assert all("--operation-preferences RegionConcurrencyType=PARALLEL" in call for call in calls
+               if call.startswith("cloudformation create-stack-instances"))
+
+    # An existing stack set is updated, and only given the stack instances it does not have
+    (deploy_build.source / "S3 Bucket" / "GenRem-A.yaml").write_text("Resources: {Changed: {}}\n")
+    monkeypatch.setenv("STACKSET_REGIONS", "us-east-1 eu-west-1 ap-south-1")
+    status, calls = deploy_build()
+
+    assert status == 0
+    operations = ("describe-stack-set", "create-stack-set", "update-stack-set", "create-stack-instances")
+    assert [call.split()[1] for call in calls if call.split()[1] in operations] == [
+        "describe-stack-set", "update-stack-set", "create-stack-instances"]
+    create = next(call for call in calls if "create-stack-instances" in call)
+    assert "--accounts 111111111111 222222222222 --regions ap-south-1" in create